@@ -1,8 +1,8 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 from datetime import datetime, date, timedelta
 from io import BytesIO
-import os
 import matplotlib.pyplot as plt
 import matplotlib.ticker as mticker
 from reportlab.lib.pagesizes import letter
@@ -12,26 +12,55 @@ from reportlab.lib import colors
 from reportlab.lib.units import inch
 import base64
 import io
-import atexit
+import json
+import time
+
+import arranque
+import cartera
+import conciliacion
+import escritura_diferida
+import eventos
+import particiones
+import pronostico
+import respaldos
+import sucursales
+import validacion
+import ventas_gastos
+from ventas_gastos import (
+    VENTAS_FILE, GASTOS_FILE, VENTAS_KEYS_FILE, GASTOS_KEYS_FILE,
+    CLIENTES, TIPOS_AVE, CATEGORIAS_GASTO, COLUMNS_VENTAS, COLUMNS_GASTOS,
+    KEY_COLUMNS_VENTAS, KEY_COLUMNS_GASTOS, RENOMBRAR_VENTAS, RENOMBRAR_GASTOS,
+    calcular_hash_claves, cargar_indice_claves, filtrar_duplicados,
+    formatear_moneda, calcular_libras_netas, calcular_total_cobrar, calcular_saldo,
+    analizar_alertas_clientes,
+)
 
 # --- 1. CONSTANTES Y CONFIGURACIÓN INICIAL ---
+# Sucursal de la sesión (ver sucursales.py): en esta ejecución, los archivos se leen y escriben
+# en su carpeta y el saldo inicial, los proveedores y los clientes salen de su configuración
+SUCURSAL = sucursales.activar(st.session_state.get("sucursal"))
+st.session_state.sucursal = SUCURSAL
+
 # Archivos para el Código 1 (Proveedores, Depósitos, Notas de Débito)
 DATA_FILE = "registro_data.pkl"
 DEPOSITS_FILE = "registro_depositos.pkl"
 DEBIT_NOTES_FILE = "registro_notas_debito.pkl"
+# Los archivos, listas y cálculos del Código 2 (Ventas y Gastos) están en ventas_gastos.py,
+# compartido con la página de ventas y gastos (pages/)
 
-# Archivos para el Código 2 (Ventas y Gastos)
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATA_DIR = os.path.join(BASE_DIR, 'data')
-os.makedirs(DATA_DIR, exist_ok=True)
-VENTAS_FILE = os.path.join(DATA_DIR, 'ventas.csv')
-GASTOS_FILE = os.path.join(DATA_DIR, 'gastos.csv')
+# Escritura de tablas en un hilo de fondo: opcional, cada sesión la elige en la barra lateral
+# y se activa solo para sus propias ejecuciones (ver escritura_diferida.py)
+ESCRITURA_DIFERIDA_POR_DEFECTO = False
+escritura_diferida.activar(st.session_state.get("escritura_diferida", ESCRITURA_DIFERIDA_POR_DEFECTO))
 
 # Constantes del Código 1
-INITIAL_ACCUMULATED_BALANCE = 176.01
+INITIAL_ACCUMULATED_BALANCE = sucursales.valor("saldo_inicial", 176.01)
+# Proveedor asignado a las notas de débito de días sin compras
+SIN_PROVEEDOR = "Sin asignar"
 PRODUCT_NAME = "Pollo"
 LBS_PER_KG = 2.20462
-PROVEEDORES = ["LIRIS SA", "Gallina 1", "Monze Anzules", "Medina"]
+PROVEEDORES = sucursales.valor("proveedores", ["LIRIS SA", "Gallina 1", "Monze Anzules", "Medina"])
+CLIENTES = sucursales.valor("clientes", CLIENTES)
 TIPOS_DOCUMENTO = ["Factura", "Nota de debito", "Nota de credito"]
 AGENCIAS = [
     "Cajero Automatico Pichincha", "Cajero Automatico Pacifico",
@@ -40,21 +69,6 @@ AGENCIAS = [
     "Banco Bolivariano"
 ]
 
-# Constantes del Código 2
-CLIENTES = [
-    "D. Vicente", "D. Jorge", "D. Quinde", "Sra. Isabel", "Sra. Alba",
-    "Sra Yolanda", "Sra Laura Mercado", "D. Segundo", "Legumbrero",
-    "Peruana Posorja", "Sra. Sofia", "Sra. Jessica", "Sra Alado de Jessica",
-    "Comedor Gordo Posorja", "Patitas Posorja", "Sra. Celeste", "Caro negro",
-    "Tienda Isabel Posorja", "Carnicero Posorja", "Moreira", "Senel",
-    "Chuzos Narcisa", "Eddy", "D. Jonny", "D. Sra Madelyn", "Lobo Mercado"
-]
-TIPOS_AVE = ["Pollo", "Gallina"]
-CATEGORIAS_GASTO = [
-    "G. Alimentación", "G. Transporte", "G. Producción", "G. Salud",
-    "G. Educación", "G. Mano de obra", "G. Pérdida", "G. Varios", "Otros Gastos"
-]
-
 # Columnas esperadas para los DataFrames
 COLUMNS_DATA = [
     "N", "Fecha", "Proveedor", "Producto", "Cantidad",
@@ -65,11 +79,67 @@ COLUMNS_DATA = [
 ]
 COLUMNS_DEPOSITS = ["Fecha", "Empresa", "Agencia", "Monto", "Documento", "N"]
 COLUMNS_DEBIT_NOTES = ["Fecha", "Libras calculadas", "Descuento", "Descuento posible", "Descuento real"]
-COLUMNS_VENTAS = [
-    'fecha', 'cliente', 'tipo', 'cantidad', 'libras', 'descuento',
-    'libras_netas', 'precio', 'total_a_cobrar', 'pago_cliente', 'saldo'
-]
-COLUMNS_GASTOS = ['fecha', 'calculo', 'descripcion', 'gasto', 'dinero']
+
+# Tablas guardadas en particiones mensuales (ver particiones.py):
+# clave en session_state -> (tabla, archivo único anterior, columnas, columnas de fecha)
+TABLAS_SESION = {
+    "data": ("proveedores", DATA_FILE, COLUMNS_DATA, ["Fecha"]),
+    "df": ("depositos", DEPOSITS_FILE, COLUMNS_DEPOSITS, ["Fecha"]),
+    "notas": ("notas_debito", DEBIT_NOTES_FILE, COLUMNS_DEBIT_NOTES, ["Fecha"]),
+    "ventas_raw_data": ("ventas", VENTAS_FILE, COLUMNS_VENTAS, ["fecha"]),
+    "gastos_raw_data": ("gastos", GASTOS_FILE, COLUMNS_GASTOS, ["fecha"]),
+}
+SESSION_KEY_BY_FILE = {archivo: key for key, (_, archivo, _, _) in TABLAS_SESION.items()}
+# Meses que se cargan siempre: la fila BALANCE_INICIAL (1900-01) y las filas sin fecha válida
+MESES_SIEMPRE_CARGADOS = {"1900-01", particiones.MES_SIN_FECHA}
+# Filtros de consulta por tabla en session_state: (columna de fecha, {columna de entidad: filtro del sidebar})
+FILTROS_POR_TABLA = {
+    "data": ("Fecha", {"Proveedor": "proveedores"}),
+    "df": ("Fecha", {"Empresa": "proveedores", "Agencia": "agencias"}),
+    "notas": ("Fecha", {}),
+    "ventas_raw_data": ("fecha", {"cliente": "clientes"}),
+    "gastos_raw_data": ("fecha", {"gasto": "categorias"}),
+}
+# Tabla completa en session_state que corresponde a cada tabla mostrada
+SESSION_KEY_BY_TITLE = {
+    "Tabla de Registros": "data",
+    "Depósitos Registrados": "df",
+    "Tabla de Notas de Débito": "notas",
+    "Historial de Ventas": "ventas_raw_data",
+    "Historial de Gastos": "gastos_raw_data",
+}
+# Vistas de visualización de ventas y gastos: columnas renombradas y desempate del orden
+# (fecha descendente, luego esa columna). Solo se guarda el orden de las etiquetas de la tabla.
+VISTAS_ORDENADAS = {
+    "ventas_raw_data": (RENOMBRAR_VENTAS, "cliente"),
+    "gastos_raw_data": (RENOMBRAR_GASTOS, None),
+}
+# Columna original de cada columna de visualización ('Fecha' es la fecha editable)
+COLUMNAS_ORIGINALES_POR_TITULO = {
+    "Historial de Ventas": {**{v: k for k, v in RENOMBRAR_VENTAS.items()}, 'Fecha': 'fecha'},
+    "Historial de Gastos": {**{v: k for k, v in RENOMBRAR_GASTOS.items()}, 'Fecha': 'fecha'},
+}
+
+# Flag que dispara el guardado/recálculo de cada tabla al deshacer o rehacer un cambio
+FLAG_EDICION_POR_TABLA = {
+    "data": "record_edited",
+    "df": "deposit_edited",
+    "notas": "debit_note_edited",
+    "ventas_raw_data": "ventas_edited",
+    "gastos_raw_data": "gastos_edited",
+}
+MAX_CAMBIOS_DESHACER = 50
+# Opciones que muestran los selectores de registros con búsqueda (las más recientes que coinciden)
+MAX_OPCIONES_SELECTOR = 20
+MAX_OPCIONES_ELIMINAR = 200
+# Partes de la conciliación de depósitos con compras -> clave en session_state (ver conciliacion.py)
+CONCILIACION_SESION = {
+    "proveedores": "conciliacion_proveedores",
+    "facturas": "conciliacion_facturas",
+    "asignaciones": "conciliacion_asignaciones",
+}
+# Datos de la sesión que se preparan una vez por proceso para las sesiones nuevas (ver arranque.py)
+DATOS_PREPARADOS = ("data", "df", "notas", "estado_proveedores", *CONCILIACION_SESION.values())
 
 # Configuración de la página de Streamlit
 st.set_page_config(
@@ -79,32 +149,114 @@ st.set_page_config(
 )
 
 # --- 2. FUNCIONES DE CARGA Y GUARDADO DE DATOS ---
+def _normalizar_columnas(df, default_columns, date_columns=None):
+    """Convierte las columnas de fecha a date y asegura las columnas esperadas."""
+    if date_columns:
+        for col in date_columns:
+            if col in df.columns:
+                df[col] = pd.to_datetime(df[col], errors="coerce").dt.date
+    for col in default_columns:
+        if col not in df.columns:
+            df[col] = None
+    return df[default_columns]
+
 @st.cache_data(show_spinner=False)
-def load_dataframe(file_path, default_columns, date_columns=None):
-    """Carga un DataFrame desde un archivo pickle o CSV, o crea uno vacío."""
-    if os.path.exists(file_path):
-        try:
-            if file_path.endswith('.pkl'):
-                df = pd.read_pickle(file_path)
-            else:  # CSV
-                df = pd.read_csv(file_path)
-            if date_columns:
-                for col in date_columns:
-                    if col in df.columns:
-                        df[col] = pd.to_datetime(df[col], errors="coerce").dt.date
-            for col in default_columns:
-                if col not in df.columns:
-                    df[col] = None
-            return df[default_columns]
-        except Exception as e:
-            st.error(f"Error al cargar {file_path}: {e}. Creando DataFrame vacío.")
+def _leer_particion(sucursal, tabla, mes, mtime_ns):
+    """Lee una partición; sucursal y mtime_ns son parte de la clave de caché (mtime_ns la invalida al escribir)."""
+    return particiones.leer_particion(tabla, mes)
+
+def load_dataframe(session_key, meses):
+    """Carga solo los meses indicados de una tabla particionada, o crea un DataFrame vacío."""
+    tabla, _, default_columns, date_columns = TABLAS_SESION[session_key]
+    try:
+        if tabla in ventas_gastos.TABLAS:
+            # Ventas y gastos salen de la caché compartida del proceso, sin leer el disco
+            recordar_version_compartida(tabla)
+            df = ventas_gastos.filas_de_meses(tabla, meses)
+            return _normalizar_columnas(df, default_columns, date_columns)
+        partes = []
+        for mes in sorted(meses):
+            mtime_ns = particiones.mtime_particion(tabla, mes)
+            if mtime_ns is not None:
+                partes.append(_leer_particion(SUCURSAL, tabla, mes, mtime_ns))
+        if not partes:
             return pd.DataFrame(columns=default_columns)
-    return pd.DataFrame(columns=default_columns)
+        return _normalizar_columnas(pd.concat(partes, ignore_index=True), default_columns, date_columns)
+    except Exception as e:
+        st.error(f"Error al cargar {tabla}: {e}. Creando DataFrame vacío.")
+        return pd.DataFrame(columns=default_columns)
+
+def recordar_version_compartida(tabla, versiones=None):
+    """Anota qué versión de cada mes cargado de la caché compartida de ventas y gastos ya refleja la sesión.
+
+    versiones: {mes: versión} devuelto por una escritura propia (solo actualiza esos meses).
+    """
+    recordadas = st.session_state.setdefault("versiones_compartidas", {})
+    if versiones is None:
+        recordadas[tabla] = ventas_gastos.version_meses(tabla, st.session_state.meses_cargados)
+    else:
+        recordadas.setdefault(tabla, {}).update(versiones)
+
+def descartar_tablas_compartidas_desactualizadas():
+    """Descarta de la sesión las ventas o gastos que otra página o sesión modificó en sus meses cargados.
+
+    Se vuelven a tomar de la caché compartida (no del disco); los cambios de esa
+    tabla en el historial de deshacer dejan de ser aplicables. Las escrituras en
+    otros meses no afectan a la sesión.
+    """
+    versiones = st.session_state.get("versiones_compartidas", {})
+    for session_key, (tabla, _, _, _) in TABLAS_SESION.items():
+        if tabla not in ventas_gastos.TABLAS or session_key not in st.session_state:
+            continue
+        recordadas = versiones.get(tabla)
+        if recordadas is None or recordadas != ventas_gastos.version_meses(tabla, list(recordadas)):
+            st.session_state.pop(session_key)
+            for pila in ("cambios_deshacer", "cambios_rehacer"):
+                if pila in st.session_state:
+                    st.session_state[pila] = [c for c in st.session_state[pila] if c["tabla"] != session_key]
+
+def incorporar_meses_faltantes(session_key, df):
+    """Carga en sesión los meses de df que aún no estaban cargados.
+
+    Así, al reescribir un mes fuera del rango seleccionado (por ejemplo al importar
+    o al cambiar una fecha) no se pierden las filas que ya estaban en disco.
+    """
+    columna_fecha = TABLAS_SESION[session_key][3][0]
+    if df.empty:
+        return df
+    faltantes = set(particiones.mes_de(df[columna_fecha])) - st.session_state.meses_cargados
+    if not faltantes:
+        return df
+    st.session_state.meses_cargados = st.session_state.meses_cargados | faltantes
+    for key in TABLAS_SESION:
+        if key != session_key and key not in st.session_state:
+            continue
+        en_disco = load_dataframe(key, faltantes)
+        base = df if key == session_key else st.session_state[key]
+        if not en_disco.empty:
+            # Las filas en memoria conservan sus etiquetas (las usa el historial de deshacer)
+            en_disco.index = etiquetas_nuevas(base, len(en_disco))
+            base = pd.concat([base, en_disco])
+            if key in ("data", "df", "notas"):
+                st.session_state.saldos_desactualizados = True
+        st.session_state[key] = base
+        if key == session_key:
+            df = base
+    return df
 
 def save_dataframe(df, file_path):
-    """Guarda un DataFrame en un archivo pickle o CSV."""
+    """Guarda un DataFrame; las tablas particionadas solo reescriben los meses cargados."""
     try:
-        if file_path.endswith('.pkl'):
+        session_key = SESSION_KEY_BY_FILE.get(file_path)
+        if session_key is not None:
+            df = incorporar_meses_faltantes(session_key, df)
+            tabla = TABLAS_SESION[session_key][0]
+            if tabla in ventas_gastos.TABLAS:
+                versiones = ventas_gastos.guardar_meses(tabla, df, st.session_state.meses_cargados)
+                recordar_version_compartida(tabla, versiones)
+            else:
+                particiones.programar_escritura(tabla, df, st.session_state.meses_cargados)
+        elif file_path.endswith('.pkl'):
             df.to_pickle(file_path)
         else:  # CSV
             df_to_save = df.copy()
@@ -116,21 +268,300 @@ def save_dataframe(df, file_path):
         st.error(f"Error al guardar {file_path}: {e}")
         return False
 
-def guardar_dataframes_en_archivos():
-    """Guarda los DataFrames de ventas y gastos en archivos CSV."""
-    if 'ventas_raw_data' in st.session_state and not st.session_state.ventas_raw_data.empty:
-        save_dataframe(st.session_state.ventas_raw_data, VENTAS_FILE)
-    if 'gastos_raw_data' in st.session_state and not st.session_state.gastos_raw_data.empty:
-        save_dataframe(st.session_state.gastos_raw_data, GASTOS_FILE)
+def append_dataframe(df_rows, file_path, hashes=None):
+    """Agrega filas al final de su partición mensual sin reescribir el historial.
+
+    Las filas ya deben estar agregadas al DataFrame de sesión correspondiente. Con
+    la escritura diferida, se encola solo el agregado (los agregados seguidos se
+    combinan). hashes: claves de las filas para el índice de importación (ventas y gastos).
+    """
+    try:
+        session_key = SESSION_KEY_BY_FILE[file_path]
+        tabla = TABLAS_SESION[session_key][0]
+        incorporar_meses_faltantes(session_key, st.session_state[session_key])
+        if tabla in ventas_gastos.TABLAS:
+            recordar_version_compartida(tabla, ventas_gastos.agregar_filas(tabla, df_rows, hashes))
+        else:
+            particiones.programar_agregado(tabla, df_rows)
+        return True
+    except Exception as e:
+        st.error(f"Error al guardar {file_path}: {e}")
+        return False
+
+def respaldar_antes(motivo):
+    """Toma un respaldo de todos los datos antes de una operación destructiva; False (con aviso) si no se pudo."""
+    try:
+        respaldos.tomar(motivo)
+        return True
+    except OSError as e:
+        st.error(f"No se pudo tomar el respaldo previo ({e}); la operación se canceló.")
+        return False
+
+def max_n_registrado(session_key):
+    """Mayor 'N' numérico guardado en cualquier mes, según el resumen de particiones."""
+    resumen = particiones.leer_resumen(TABLAS_SESION[session_key][0])
+    if resumen.empty:
+        return 0
+    return int(pd.to_numeric(resumen["n_max"], errors="coerce").fillna(0).max())
 
-atexit.register(guardar_dataframes_en_archivos)
+def migrar_a_particiones():
+    """Divide los archivos únicos anteriores en particiones mensuales (solo la primera vez)."""
+    for tabla, archivo, _, _ in TABLAS_SESION.values():
+        try:
+            particiones.migrar_tabla(tabla, archivo)
+        except Exception as e:
+            st.error(f"Error al migrar {archivo} a particiones mensuales: {e}")
+    if particiones.leer_saldos() is None or particiones.leer_estado_proveedores() is None:
+        reconstruir_resumen_saldos()
+
+# --- Cambios en sitio con historial para deshacer / rehacer ---
+# Cada cambio guarda solo lo necesario para invertirlo: los valores anteriores de las
+# celdas (o columnas) editadas y las filas insertadas o eliminadas, con sus etiquetas de índice.
+def etiquetas_nuevas(df, cantidad):
+    """Etiquetas de índice libres para agregar filas al final de una tabla."""
+    inicio = int(df.index.max()) + 1 if len(df.index) else 0
+    return pd.RangeIndex(inicio, inicio + cantidad)
+
+def marcar_tabla_modificada(session_key):
+    """Incrementa la versión de una tabla modificada en sitio (invalida sus índices de consulta)."""
+    versiones = st.session_state.setdefault("versiones_tablas", {})
+    versiones[session_key] = versiones.get(session_key, 0) + 1
+
+def _asignar_celda(df, etiqueta, columna, valor):
+    """Asigna un valor en sitio; si el tipo de la columna no lo admite, amplía solo esa columna."""
+    try:
+        df.at[etiqueta, columna] = valor
+    except (TypeError, ValueError):
+        es_numero = isinstance(valor, (int, float, np.number)) and not isinstance(valor, bool)
+        df[columna] = df[columna].astype("float64" if es_numero and pd.api.types.is_numeric_dtype(df[columna]) else object)
+        df.at[etiqueta, columna] = valor
+
+def _asignar_columna(df, columna, valores):
+    """Asigna en sitio, en un solo paso, una serie indexada por etiqueta; amplía el tipo si hace falta."""
+    try:
+        df.loc[valores.index, columna] = valores
+    except (TypeError, ValueError):
+        es_numero = pd.api.types.is_numeric_dtype(valores) and not pd.api.types.is_bool_dtype(valores)
+        df[columna] = df[columna].astype("float64" if es_numero and pd.api.types.is_numeric_dtype(df[columna]) else object)
+        df.loc[valores.index, columna] = valores
+
+def _aplicar_delta(session_key, celdas, insertar, eliminar, columnas=None):
+    """Aplica un delta: elimina filas, asigna celdas {etiqueta: {columna: valor}} y
+    columnas {columna: serie por etiqueta} en sitio, e inserta filas (la inserción
+    reemplaza la tabla de la sesión por una nueva)."""
+    df = anterior = st.session_state[session_key]
+    if eliminar is not None and not eliminar.empty:
+        df.drop(index=eliminar.index, inplace=True)
+    for etiqueta, valores in celdas.items():
+        for columna, valor in valores.items():
+            _asignar_celda(df, etiqueta, columna, valor)
+    for columna, valores in (columnas or {}).items():
+        _asignar_columna(df, columna, valores)
+    if insertar is not None and not insertar.empty:
+        # Una sola concatenación: insertar fila por fila copiaría la tabla completa en cada fila
+        insertar = insertar.reindex(columns=df.columns)
+        restaurar_orden = len(df.index) and insertar.index.min() < df.index.max()
+        df = pd.concat([df, insertar]) if len(df.index) else insertar.copy()
+        if restaurar_orden:
+            df = df.sort_index()
+        st.session_state[session_key] = df
+    if session_key in VISTAS_ORDENADAS:
+        # Las filas con fecha o desempate cambiados se reubican en la vista ordenada
+        columnas_orden = {"fecha", VISTAS_ORDENADAS[session_key][1]}
+        movidas = [etiqueta for etiqueta, valores in celdas.items() if columnas_orden & set(valores)]
+        for columna, valores in (columnas or {}).items():
+            if columna in columnas_orden:
+                movidas.extend(valores.index)
+        movidas = list(dict.fromkeys(movidas))
+        quitadas = movidas + (list(eliminar.index) if eliminar is not None else [])
+        agregadas = movidas + (list(insertar.index) if insertar is not None else [])
+        actualizar_orden_vista(session_key, quitar=quitadas, agregar=agregadas, reemplazada=anterior)
+    marcar_tabla_modificada(session_key)
+
+def registrar_evento(tipo, tabla, descripcion, **datos):
+    """Agrega un evento al registro de auditoría (ver eventos.py). Devuelve su id, o None (con aviso) si no se pudo escribir."""
+    try:
+        return eventos.registrar(tipo, tabla, descripcion, **datos)
+    except OSError as e:
+        st.warning(f"No se pudo registrar el cambio en la auditoría: {e}")
+        return None
+
+def _evento_de_cambio(session_key, descripcion, celdas, insertadas, eliminadas, columnas):
+    """Registra en la auditoría un cambio ya aplicado a una tabla de la sesión."""
+    tabla = TABLAS_SESION[session_key][0]
+    if insertadas is not None and not insertadas.empty:
+        return registrar_evento("agregar", tabla, descripcion, filas=eventos.filas_a_registros(insertadas))
+    if eliminadas is not None and not eliminadas.empty:
+        return registrar_evento("eliminar", tabla, descripcion, filas=eventos.filas_a_registros(eliminadas))
+    etiquetas = list(celdas)
+    for anteriores, _ in columnas.values():
+        etiquetas.extend(anteriores.index)
+    despues = st.session_state[session_key].loc[list(dict.fromkeys(etiquetas))]
+    # Las filas antes del cambio se reconstruyen con los valores anteriores guardados para deshacer
+    antes = despues.astype(object)
+    for etiqueta, valores in celdas.items():
+        for columna, (anterior, _) in valores.items():
+            antes.at[etiqueta, columna] = anterior
+    for columna, (anteriores, _) in columnas.items():
+        antes.loc[anteriores.index, columna] = anteriores.astype(object)
+    return registrar_evento("editar", tabla, descripcion, filas=eventos.cambios_filas(antes, despues))
+
+def registrar_cambio(session_key, descripcion, celdas=None, insertadas=None, eliminadas=None, columnas=None):
+    """Guarda en la pila de deshacer un cambio ya aplicado, vacía la pila de rehacer y lo registra en la auditoría."""
+    pila = st.session_state.setdefault("cambios_deshacer", [])
+    pila.append({
+        "tabla": session_key, "descripcion": descripcion, "celdas": celdas or {},
+        "insertadas": insertadas, "eliminadas": eliminadas, "columnas": columnas or {},
+        "evento": _evento_de_cambio(session_key, descripcion, celdas or {}, insertadas, eliminadas, columnas or {}),
+    })
+    del pila[:-MAX_CAMBIOS_DESHACER]
+    st.session_state.cambios_rehacer = []
+
+def limpiar_historial_cambios():
+    """Vacía las pilas de deshacer y rehacer (tras operaciones masivas que no se registran)."""
+    st.session_state.cambios_deshacer = []
+    st.session_state.cambios_rehacer = []
+
+def actualizar_celdas(session_key, cambios_por_fila, descripcion):
+    """Aplica en sitio {etiqueta: {columna: valor}} y registra los valores anteriores."""
+    df = st.session_state[session_key]
+    celdas = {
+        etiqueta: {col: (df.at[etiqueta, col], valor) for col, valor in cambios.items()}
+        for etiqueta, cambios in cambios_por_fila.items()
+    }
+    _aplicar_delta(session_key, cambios_por_fila, None, None)
+    registrar_cambio(session_key, descripcion, celdas=celdas)
+
+def actualizar_columnas(session_key, cambios_por_columna, descripcion):
+    """Aplica en sitio {columna: serie indexada por etiqueta}, una asignación por columna,
+    y registra los valores anteriores."""
+    df = st.session_state[session_key]
+    columnas = {col: (df.loc[valores.index, col].copy(), valores) for col, valores in cambios_por_columna.items()}
+    _aplicar_delta(session_key, {}, None, None, cambios_por_columna)
+    registrar_cambio(session_key, descripcion, columnas=columnas)
+
+def columnas_derivadas(session_key, filas):
+    """Recalcula de forma vectorizada las columnas que dependen de otras, solo para las filas dadas."""
+    def numero(col):
+        return pd.to_numeric(filas[col], errors="coerce").fillna(0)
+    if session_key == "data":
+        kilos = numero("Peso Salida (kg)") - numero("Peso Entrada (kg)")
+        libras = kilos * LBS_PER_KG
+        cantidad = numero("Cantidad")
+        return {
+            "Kilos Restantes": kilos, "Libras Restantes": libras,
+            "Promedio": (libras / cantidad.where(cantidad != 0)).fillna(0),
+            "Total ($)": libras * numero("Precio Unitario ($)"),
+        }
+    if session_key == "df":
+        es_cajero = filas["Agencia"].astype(str).str.contains("Cajero", regex=False)
+        return {"Documento": es_cajero.map({True: "Deposito", False: "Transferencia"})}
+    if session_key == "ventas_raw_data":
+        libras_netas = (numero("libras") - numero("descuento")).round(2)
+        total_a_cobrar = (libras_netas * numero("precio")).round(2)
+        return {
+            "libras_netas": libras_netas, "total_a_cobrar": total_a_cobrar,
+            "saldo": (total_a_cobrar - numero("pago_cliente")).round(2),
+        }
+    return {}
+
+def insertar_filas(session_key, filas, descripcion):
+    """Agrega filas al final de la tabla, con etiquetas nuevas. Devuelve las filas insertadas."""
+    df = st.session_state[session_key]
+    filas = pd.DataFrame(filas).reindex(columns=df.columns)
+    filas.index = etiquetas_nuevas(df, len(filas))
+    _aplicar_delta(session_key, {}, filas, None)
+    registrar_cambio(session_key, descripcion, insertadas=filas)
+    return filas
+
+def eliminar_filas(session_key, etiquetas, descripcion):
+    """Elimina filas por etiqueta, en sitio. Devuelve las filas eliminadas."""
+    eliminadas = st.session_state[session_key].loc[list(etiquetas)]
+    _aplicar_delta(session_key, {}, None, eliminadas)
+    registrar_cambio(session_key, descripcion, eliminadas=eliminadas)
+    return eliminadas
+
+def _invertir_cambio(cambio, hacia_atras):
+    """Aplica un cambio registrado (hacia_atras=True lo deshace), lo guarda y marca el recálculo."""
+    session_key = cambio["tabla"]
+    posicion = 0 if hacia_atras else 1
+    celdas = {e: {c: par[posicion] for c, par in cols.items()} for e, cols in cambio["celdas"].items()}
+    columnas = {c: par[posicion] for c, par in cambio.get("columnas", {}).items()}
+    insertar, eliminar = cambio["eliminadas"], cambio["insertadas"]
+    if not hacia_atras:
+        insertar, eliminar = eliminar, insertar
+    afectadas = set(celdas)
+    for valores in columnas.values():
+        afectadas |= set(valores.index)
+    for parte in (insertar, eliminar):
+        if parte is not None:
+            afectadas |= set(parte.index)
+    df = st.session_state[session_key]
+    antes = df.loc[df.index.intersection(list(afectadas))]
+    version_anterior = ventas_gastos.version_tabla("ventas") if session_key == "ventas_raw_data" else None
+    _aplicar_delta(session_key, celdas, insertar, eliminar, columnas)
+    # Tras insertar filas la tabla de la sesión es otra: se vuelve a leer
+    df = st.session_state[session_key]
+    despues = df.loc[df.index.intersection(list(afectadas))]
+    archivo = TABLAS_SESION[session_key][1]
+    if not save_dataframe(st.session_state[session_key], archivo):
+        return False
+    st.session_state[FLAG_EDICION_POR_TABLA[session_key]] = True
+    if session_key == "ventas_raw_data":
+        st.session_state.cartera_clientes = ventas_gastos.aplicar_cambios_cartera(
+            version_anterior, quitar=antes, agregar=despues
+        )
+    registrar_evento(
+        "deshacer" if hacia_atras else "rehacer", TABLAS_SESION[session_key][0],
+        f"{'Deshacer' if hacia_atras else 'Rehacer'}: {cambio['descripcion']}", evento=cambio.get("evento"),
+    )
+    return True
+
+def deshacer_cambio():
+    """Deshace el último cambio registrado."""
+    if not st.session_state.get("cambios_deshacer"):
+        return None
+    cambio = st.session_state.cambios_deshacer.pop()
+    if _invertir_cambio(cambio, hacia_atras=True):
+        st.session_state.cambios_rehacer.append(cambio)
+    return cambio["descripcion"]
+
+def rehacer_cambio():
+    """Vuelve a aplicar el último cambio deshecho."""
+    if not st.session_state.get("cambios_rehacer"):
+        return None
+    cambio = st.session_state.cambios_rehacer.pop()
+    if _invertir_cambio(cambio, hacia_atras=False):
+        st.session_state.cambios_deshacer.append(cambio)
+    return cambio["descripcion"]
+
+# Al cerrar el proceso, escritura_diferida vacía su cola (registra su propio atexit)
 
 # --- 3. FUNCIONES DE INICIALIZACIÓN DEL ESTADO ---
 def initialize_session_state():
     """Inicializa todos los DataFrames en st.session_state."""
+    migrar_a_particiones()
+    # Solo se cargan los meses del rango seleccionado (por defecto, la semana actual)
+    if "meses_cargados" not in st.session_state:
+        hoy = date.today()
+        meses = particiones.meses_en_rango(hoy - timedelta(days=hoy.weekday()), hoy)
+        st.session_state.meses_cargados = set(meses) | MESES_SIEMPRE_CARGADOS
+
+    # Sesión nueva (o rango nuevo): los datos ya preparados por otra sesión con los mismos meses
+    if all(key not in st.session_state for key in ("data", "df", "notas")):
+        preparados = arranque.obtener(st.session_state.meses_cargados)
+        if preparados is not None:
+            for key, df in preparados.items():
+                st.session_state[key] = df
+        st.session_state.setdefault("tipo_arranque", "fria" if preparados is None else "tibia")
+
     # Código 1: Proveedores, Depósitos, Notas de Débito
+    # Los saldos solo se recalculan aquí si se cargó alguna de sus tablas; los cambios
+    # posteriores los recalcula main una sola vez por ejecución (flags de edición)
+    if any(key not in st.session_state for key in ("data", "df", "notas")):
+        st.session_state.saldos_desactualizados = True
     if "data" not in st.session_state:
-        st.session_state.data = load_dataframe(DATA_FILE, COLUMNS_DATA, ["Fecha"])
+        st.session_state.data = load_dataframe("data", st.session_state.meses_cargados)
         initial_balance_row_exists = any(st.session_state.data["Proveedor"] == "BALANCE_INICIAL")
         if not initial_balance_row_exists:
             fila_inicial_saldo = {col: None for col in COLUMNS_DATA}
@@ -156,21 +587,20 @@ def initialize_session_state():
             st.session_state.data.loc[idx, "Fecha"] = datetime(1900, 1, 1).date()
 
     if "df" not in st.session_state:
-        st.session_state.df = load_dataframe(DEPOSITS_FILE, COLUMNS_DEPOSITS, ["Fecha"])
+        st.session_state.df = load_dataframe("df", st.session_state.meses_cargados)
         st.session_state.df["N"] = st.session_state.df["N"].astype(str)
 
     if "notas" not in st.session_state:
-        st.session_state.notas = load_dataframe(DEBIT_NOTES_FILE, COLUMNS_DEBIT_NOTES, ["Fecha"])
+        st.session_state.notas = load_dataframe("notas", st.session_state.meses_cargados)
 
-    # Código 2: Ventas y Gastos
+    # Código 2: Ventas y Gastos (de la caché compartida; se recargan si otra página escribió)
+    descartar_tablas_compartidas_desactualizadas()
     if 'ventas_raw_data' not in st.session_state:
-        st.session_state.ventas_raw_data = load_dataframe(VENTAS_FILE, COLUMNS_VENTAS, ['fecha'])
-    if 'ventas_data' not in st.session_state:
-        st.session_state.ventas_data = get_ventas_df_processed()
+        st.session_state.ventas_raw_data = load_dataframe("ventas_raw_data", st.session_state.meses_cargados)
+    # Cartera de clientes compartida por las páginas: cubre todo el historial aunque solo haya meses cargados
+    st.session_state.cartera_clientes = ventas_gastos.obtener_cartera()
     if 'gastos_raw_data' not in st.session_state:
-        st.session_state.gastos_raw_data = load_dataframe(GASTOS_FILE, COLUMNS_GASTOS, ['fecha'])
-    if 'gastos_data' not in st.session_state:
-        st.session_state.gastos_data = get_gastos_df_processed()
+        st.session_state.gastos_raw_data = load_dataframe("gastos_raw_data", st.session_state.meses_cargados)
 
     # Inicializar flags
     for flag in [
@@ -178,7 +608,7 @@ def initialize_session_state():
         "data_imported", "debit_note_added", "debit_note_deleted",
         "record_edited", "deposit_edited", "debit_note_edited",
         "venta_added", "venta_deleted", "gasto_added", "gasto_deleted",
-        "ventas_edited", "gastos_edited"
+        "ventas_edited", "gastos_edited", "saldos_desactualizados"
     ]:
         if flag not in st.session_state:
             st.session_state[flag] = False
@@ -195,16 +625,24 @@ def initialize_session_state():
         if key not in st.session_state:
             st.session_state[key] = value
 
-    recalculate_accumulated_balances()
+    if st.session_state.saldos_desactualizados:
+        recalculate_accumulated_balances()
+        st.session_state.saldos_desactualizados = False
+        publicar_datos_preparados(cambio=False)
+
+def publicar_datos_preparados(cambio):
+    """Deja los datos ya recalculados de la sesión en la caché de arranque para las sesiones nuevas."""
+    arranque.publicar(
+        st.session_state.meses_cargados, {key: st.session_state[key] for key in DATOS_PREPARADOS}, cambio=cambio
+    )
 
 # --- 4. FUNCIONES DE LÓGICA DE NEGOCIO Y CÁLCULOS ---
 # Funciones del Código 1
-def recalculate_accumulated_balances():
-    """Recalcula el Saldo Acumulado para los registros de proveedores."""
-    df_data = st.session_state.data.copy()
-    df_deposits = st.session_state.df.copy()
-    df_notes = st.session_state.notas.copy()
+def calcular_saldos_diarios(df_data, df_deposits, df_notes):
+    """Calcula las columnas derivadas de proveedores y el saldo diario ajustado por fecha.
 
+    Devuelve (fila BALANCE_INICIAL, operaciones con columnas derivadas, saldos por fecha).
+    """
     for df_temp in [df_data, df_deposits, df_notes]:
         if "Fecha" in df_temp.columns:
             df_temp["Fecha"] = pd.to_datetime(df_temp["Fecha"], errors="coerce").dt.date
@@ -234,6 +672,7 @@ def recalculate_accumulated_balances():
         deposits_summary = df_deposits.groupby(["Fecha", "Empresa"])["Monto"].sum().reset_index()
         deposits_summary.rename(columns={"Monto": "Monto Deposito Calculado"}, inplace=True)
         df_data_operaciones["Empresa_key"] = df_data_operaciones["Proveedor"]
+        etiquetas_operaciones = df_data_operaciones.index
         df_data_operaciones = pd.merge(
             df_data_operaciones.drop(columns=["Monto Deposito"], errors='ignore'),
             deposits_summary,
@@ -241,6 +680,8 @@ def recalculate_accumulated_balances():
             right_on=["Fecha", "Empresa"],
             how="left"
         )
+        # El merge por la izquierda conserva el orden de las filas; se recuperan sus etiquetas
+        df_data_operaciones.index = etiquetas_operaciones
         df_data_operaciones["Monto Deposito"] = df_data_operaciones["Monto Deposito Calculado"].fillna(0)
         df_data_operaciones.drop(columns=["Monto Deposito Calculado", "Empresa", "Empresa_key"], inplace=True, errors='ignore')
     else:
@@ -260,8 +701,60 @@ def recalculate_accumulated_balances():
         full_daily_balances = df_data_operaciones.groupby("Fecha")["Saldo diario"].sum().reset_index()
         full_daily_balances["SaldoDiarioAjustado"] = full_daily_balances["Saldo diario"]
 
-    full_daily_balances = full_daily_balances.sort_values("Fecha")
+    return df_initial_balance, df_data_operaciones, full_daily_balances
+
+def reconstruir_resumen_saldos():
+    """Calcula la suma mensual del saldo diario ajustado sobre todo el historial (una sola vez)."""
+    try:
+        tablas = {}
+        for key in ["data", "df", "notas"]:
+            tabla, _, default_columns, date_columns = TABLAS_SESION[key]
+            historial = particiones.leer_meses(tabla)
+            if historial.empty:
+                historial = pd.DataFrame(columns=default_columns)
+            tablas[key] = _normalizar_columnas(historial, default_columns, date_columns)
+        _, df_data_operaciones, full_daily_balances = calcular_saldos_diarios(tablas["data"], tablas["df"], tablas["notas"])
+        meses = particiones.mes_de(full_daily_balances["Fecha"]).to_numpy()
+        saldos = full_daily_balances.groupby(meses)["SaldoDiarioAjustado"].sum()
+        particiones.guardar_saldos(saldos, saldos.index)
+        movimientos = calcular_movimientos_proveedores(df_data_operaciones, tablas["df"], tablas["notas"])
+        por_mes = resumir_movimientos_por_mes(movimientos)
+        particiones.guardar_estado_proveedores(por_mes, por_mes["mes"].unique())
+    except Exception as e:
+        st.error(f"Error al calcular el resumen de saldos: {e}")
+
+def recalculate_accumulated_balances():
+    """Recalcula el Saldo Acumulado para los registros de proveedores."""
+    df_deposits = st.session_state.df.copy()
+    df_notes = st.session_state.notas.copy()
+    df_initial_balance, df_data_operaciones, full_daily_balances = calcular_saldos_diarios(
+        st.session_state.data.copy(), df_deposits, df_notes
+    )
+    actualizar_estado_proveedores(df_data_operaciones, df_deposits, df_notes)
+
+    # Los meses no cargados aportan su suma mensual guardada, para que el
+    # Saldo Acumulado no dependa de cuánto historial hay en memoria.
+    meses_cargados = st.session_state.meses_cargados
+    meses_operaciones = particiones.mes_de(full_daily_balances["Fecha"]).to_numpy()
+    particiones.guardar_saldos(
+        full_daily_balances.groupby(meses_operaciones)["SaldoDiarioAjustado"].sum(), meses_cargados
+    )
+    saldos_guardados = particiones.leer_saldos()
+    saldos_no_cargados = saldos_guardados[
+        ~saldos_guardados.index.isin(list(meses_cargados | {particiones.MES_SIN_FECHA}))
+    ]
+    aperturas = pd.DataFrame({
+        "Fecha": pd.to_datetime(saldos_no_cargados.index, format="%Y-%m").date,
+        "SaldoDiarioAjustado": saldos_no_cargados.to_numpy(),
+        "Resumen": True
+    })
+    full_daily_balances["Resumen"] = False
+    if not aperturas.empty:
+        full_daily_balances = pd.concat([full_daily_balances, aperturas], ignore_index=True)
+
+    full_daily_balances = full_daily_balances.sort_values("Fecha", kind="mergesort")
     full_daily_balances["Saldo Acumulado"] = INITIAL_ACCUMULATED_BALANCE + full_daily_balances["SaldoDiarioAjustado"].cumsum()
+    full_daily_balances = full_daily_balances[~full_daily_balances["Resumen"].astype(bool)]
 
     saldo_diario_map = full_daily_balances.set_index("Fecha")["SaldoDiarioAjustado"].to_dict()
     saldo_acumulado_map = full_daily_balances.set_index("Fecha")["Saldo Acumulado"].to_dict()
@@ -277,35 +770,130 @@ def recalculate_accumulated_balances():
         df_initial_balance.loc[:, "Total ($)"] = 0.0
         df_initial_balance.loc[:, "N"] = "00"
         df_initial_balance.loc[:, "Fecha"] = datetime(1900, 1, 1).date()
-        df_data = pd.concat([df_initial_balance, df_data_operaciones], ignore_index=True)
+        df_data = pd.concat([df_initial_balance, df_data_operaciones])
     else:
         df_data = df_data_operaciones
 
+    # Se conservan las etiquetas de índice: el historial de deshacer se refiere a ellas
     df_data = df_data[COLUMNS_DATA]
     df_data["N"] = df_data["N"].astype(str)
-    df_data = df_data.sort_values(by=["Fecha", "N"], ascending=[True, True]).reset_index(drop=True)
+    df_data = df_data.sort_values(by=["Fecha", "N"], ascending=[True, True])
     st.session_state.data = df_data
     save_dataframe(st.session_state.data, DATA_FILE)
 
+# --- Estado de cuenta por proveedor ---
+def calcular_movimientos_proveedores(df_data_operaciones, df_deposits, df_notes):
+    """Arma los movimientos por proveedor: compras como cargo, depósitos y notas de débito como abono.
+
+    Las notas de débito no indican proveedor: se reparten entre los proveedores del día
+    según sus Libras Restantes, que son las mismas libras con las que se calcula la nota.
+    """
+    compras = pd.DataFrame({
+        "Fecha": df_data_operaciones["Fecha"],
+        "Proveedor": df_data_operaciones["Proveedor"],
+        "Movimiento": "Compra",
+        "Referencia": df_data_operaciones["N"].astype(str),
+        "Cargo": pd.to_numeric(df_data_operaciones["Total ($)"], errors="coerce").fillna(0),
+        "Abono": 0.0,
+        "Orden": 0,
+    })
+    depositos = pd.DataFrame({
+        "Fecha": df_deposits["Fecha"],
+        "Proveedor": df_deposits["Empresa"],
+        "Movimiento": "Depósito",
+        "Referencia": df_deposits["N"].astype(str),
+        "Cargo": 0.0,
+        "Abono": pd.to_numeric(df_deposits["Monto"], errors="coerce").fillna(0),
+        "Orden": 1,
+    })
+    libras = df_data_operaciones.groupby(["Fecha", "Proveedor"])["Libras Restantes"].sum().reset_index()
+    total_dia = libras.groupby("Fecha")["Libras Restantes"].transform("sum")
+    proveedores_dia = libras.groupby("Fecha")["Proveedor"].transform("size")
+    # Si ese día no quedaron libras, la nota se reparte en partes iguales
+    libras["Participacion"] = (libras["Libras Restantes"] / total_dia.replace(0, np.nan)).fillna(1 / proveedores_dia)
+    notas = pd.DataFrame({
+        "Fecha": df_notes["Fecha"],
+        "Descuento real": pd.to_numeric(df_notes["Descuento real"], errors="coerce").fillna(0),
+    }).merge(libras[["Fecha", "Proveedor", "Participacion"]], on="Fecha", how="left")
+    notas = pd.DataFrame({
+        "Fecha": notas["Fecha"],
+        "Proveedor": notas["Proveedor"].fillna(SIN_PROVEEDOR),
+        "Movimiento": "Nota de débito",
+        "Referencia": "",
+        "Cargo": 0.0,
+        "Abono": notas["Descuento real"] * notas["Participacion"].fillna(1.0),
+        "Orden": 2,
+    })
+    partes = [parte for parte in (compras, depositos, notas) if not parte.empty]
+    if not partes:
+        return pd.DataFrame(columns=list(compras.columns))
+    return pd.concat(partes, ignore_index=True)
+
+def resumir_movimientos_por_mes(movimientos):
+    """Suma los cargos y abonos por mes y proveedor."""
+    return (
+        movimientos.assign(mes=particiones.mes_de(movimientos["Fecha"]).to_numpy())
+        .groupby(["mes", "Proveedor"], as_index=False)[["Cargo", "Abono"]].sum()
+    )
+
+def calcular_estado_cuenta(movimientos, aperturas):
+    """Saldo corrido por proveedor (abonos menos cargos) con un único groupby-cumsum."""
+    movimientos = movimientos.assign(Resumen=False)
+    if not aperturas.empty:
+        movimientos = pd.concat([movimientos, aperturas.assign(Resumen=True)], ignore_index=True)
+    movimientos["Fecha_orden"] = pd.to_datetime(movimientos["Fecha"], errors="coerce")
+    movimientos = movimientos.sort_values(["Proveedor", "Fecha_orden", "Orden"], kind="mergesort")
+    # astype: sin movimientos (una sucursal nueva) las columnas vacías son de tipo object
+    movimientos["Saldo"] = (movimientos["Abono"] - movimientos["Cargo"]).astype(float).groupby(movimientos["Proveedor"]).cumsum()
+    movimientos = movimientos[~movimientos["Resumen"].astype(bool)]
+    return movimientos[["Proveedor", "Fecha", "Movimiento", "Referencia", "Cargo", "Abono", "Saldo"]].reset_index(drop=True)
+
+def actualizar_estado_proveedores(df_data_operaciones, df_deposits, df_notes):
+    """Actualiza el estado de cuenta por proveedor recalculando solo los meses cargados."""
+    movimientos = calcular_movimientos_proveedores(df_data_operaciones, df_deposits, df_notes)
+    meses_cargados = st.session_state.meses_cargados
+    particiones.guardar_estado_proveedores(resumir_movimientos_por_mes(movimientos), meses_cargados)
+    # Los meses no cargados entran como un movimiento de apertura por proveedor y mes
+    por_mes = particiones.leer_estado_proveedores()
+    por_mes = por_mes[~por_mes["mes"].isin(list(meses_cargados | {particiones.MES_SIN_FECHA}))]
+    aperturas = pd.DataFrame({
+        "Fecha": pd.to_datetime(por_mes["mes"], format="%Y-%m").dt.date,
+        "Proveedor": por_mes["Proveedor"],
+        "Movimiento": "Saldo de meses no cargados",
+        "Referencia": "",
+        "Cargo": por_mes["Cargo"],
+        "Abono": por_mes["Abono"],
+        "Orden": -1,
+    })
+    st.session_state.estado_proveedores = calcular_estado_cuenta(movimientos, aperturas)
+    actualizar_conciliacion(pd.concat([movimientos, aperturas], ignore_index=True) if not aperturas.empty else movimientos)
+
+def actualizar_conciliacion(movimientos):
+    """Concilia los depósitos con las compras, recalculando solo los proveedores cuyos movimientos cambiaron."""
+    anterior = None
+    if all(key in st.session_state for key in CONCILIACION_SESION.values()):
+        anterior = {parte: st.session_state[key] for parte, key in CONCILIACION_SESION.items()}
+    nueva, _ = conciliacion.actualizar(anterior, movimientos)
+    for parte, key in CONCILIACION_SESION.items():
+        st.session_state[key] = nueva[parte]
+
 def get_next_n(df, current_date):
     """Genera el siguiente número 'N' para un registro."""
-    df_filtered = df[df["Proveedor"] != "BALANCE_INICIAL"].copy()
-    if not df_filtered.empty:
-        df_filtered["N_numeric"] = pd.to_numeric(df_filtered["N"], errors='coerce').fillna(0)
-        max_n_global = df_filtered["N_numeric"].max()
-        return f"{int(max_n_global) + 1:02}"
-    return "01"
+    n_registrados = pd.to_numeric(df.loc[df["Proveedor"] != "BALANCE_INICIAL", "N"], errors='coerce').fillna(0)
+    # Los meses no cargados también cuentan: su mayor N viene del resumen de particiones
+    max_n_global = max_n_registrado("data")
+    if not n_registrados.empty:
+        max_n_global = max(max_n_global, int(n_registrados.max()))
+    return f"{int(max_n_global) + 1:02}"
 
 def add_deposit_record(fecha_d, empresa, agencia, monto):
     """Agrega un nuevo registro de depósito."""
-    df_actual = st.session_state.df.copy()
-    df_actual["N"] = df_actual["N"].astype(str)
-    if not df_actual.empty:
-        valid_n_deposits = df_actual[df_actual["N"].str.isdigit()]["N"].astype(int)
-        max_n_deposit = valid_n_deposits.max() if not valid_n_deposits.empty else 0
-        numero = f"{max_n_deposit + 1:02}"
-    else:
-        numero = "01"
+    n_depositos = st.session_state.df["N"].astype(str)
+    max_n_deposit = max_n_registrado("df")
+    valid_n_deposits = n_depositos[n_depositos.str.isdigit()].astype(int)
+    if not valid_n_deposits.empty:
+        max_n_deposit = max(max_n_deposit, valid_n_deposits.max())
+    numero = f"{max_n_deposit + 1:02}"
     documento = "Deposito" if "Cajero" in agencia else "Transferencia"
     nuevo_registro = {
         "Fecha": fecha_d,
@@ -315,7 +903,7 @@ def add_deposit_record(fecha_d, empresa, agencia, monto):
         "Documento": documento,
         "N": numero
     }
-    st.session_state.df = pd.concat([df_actual, pd.DataFrame([nuevo_registro])], ignore_index=True)
+    insertar_filas("df", [nuevo_registro], f"Agregar depósito N° {numero}")
     if save_dataframe(st.session_state.df, DEPOSITS_FILE):
         st.session_state.deposit_added = True
         st.success("Depósito agregado exitosamente. Recalculando saldos...")
@@ -325,7 +913,7 @@ def add_deposit_record(fecha_d, empresa, agencia, monto):
 def delete_deposit_record(index_to_delete):
     """Elimina un registro de depósito."""
     try:
-        st.session_state.df = st.session_state.df.drop(index=index_to_delete).reset_index(drop=True)
+        eliminar_filas("df", [index_to_delete], f"Eliminar depósito N° {st.session_state.df.loc[index_to_delete, 'N']}")
         if save_dataframe(st.session_state.df, DEPOSITS_FILE):
             st.session_state.deposit_deleted = True
             st.success("Depósito eliminado correctamente. Recalculando saldos...")
@@ -337,19 +925,20 @@ def delete_deposit_record(index_to_delete):
 def edit_deposit_record(index_to_edit, updated_data):
     """Edita un registro de depósito."""
     try:
-        current_df = st.session_state.df.copy()
-        if index_to_edit not in current_df.index:
+        df = st.session_state.df
+        if index_to_edit not in df.index:
             st.error("El índice de depósito a editar no es válido.")
             return
+        valores = {}
         for key, value in updated_data.items():
             if key == "Monto":
-                current_df.loc[index_to_edit, key] = float(value)
+                valores[key] = float(value)
             elif key == "Fecha":
-                current_df.loc[index_to_edit, key] = pd.to_datetime(value).date()
+                valores[key] = pd.to_datetime(value).date()
             else:
-                current_df.loc[index_to_edit, key] = value
-        current_df.loc[index_to_edit, "Documento"] = "Deposito" if "Cajero" in str(updated_data.get("Agencia", current_df.loc[index_to_edit, "Agencia"])) else "Transferencia"
-        st.session_state.df = current_df
+                valores[key] = value
+        valores["Documento"] = "Deposito" if "Cajero" in str(updated_data.get("Agencia", df.loc[index_to_edit, "Agencia"])) else "Transferencia"
+        actualizar_celdas("df", {index_to_edit: valores}, f"Editar depósito N° {df.loc[index_to_edit, 'N']}")
         if save_dataframe(st.session_state.df, DEPOSITS_FILE):
             st.session_state.deposit_edited = True
             st.success("Depósito editado exitosamente. Recalculando saldos...")
@@ -358,9 +947,8 @@ def edit_deposit_record(index_to_edit, updated_data):
     except Exception as e:
         st.error(f"Error al editar el depósito: {e}")
 
-def add_supplier_record(fecha, proveedor, cantidad, peso_salida, peso_entrada, tipo_documento, gavetas, precio_unitario):
+def add_supplier_record(fecha, proveedor, cantidad, peso_salida, peso_entrada, tipo_documento, gavetas, precio_unitario, producto=PRODUCT_NAME):
     """Agrega un nuevo registro de proveedor."""
-    df = st.session_state.data.copy()
     if not all(isinstance(val, (int, float)) and val >= 0 for val in [cantidad, peso_salida, peso_entrada, precio_unitario, gavetas]):
         st.error("Los valores numéricos no pueden ser negativos.")
         return False
@@ -374,18 +962,16 @@ def add_supplier_record(fecha, proveedor, cantidad, peso_salida, peso_entrada, t
     libras_restantes = kilos_restantes * LBS_PER_KG
     promedio = libras_restantes / cantidad if cantidad != 0 else 0
     total = libras_restantes * precio_unitario
-    enumeracion = get_next_n(df, fecha)
+    enumeracion = get_next_n(st.session_state.data, fecha)
     nueva_fila = {
-        "N": enumeracion, "Fecha": fecha, "Proveedor": proveedor, "Producto": PRODUCT_NAME,
+        "N": enumeracion, "Fecha": fecha, "Proveedor": proveedor, "Producto": producto,
         "Cantidad": int(cantidad), "Peso Salida (kg)": float(peso_salida), "Peso Entrada (kg)": float(peso_entrada),
         "Tipo Documento": tipo_documento, "Cantidad de gavetas": int(gavetas), "Precio Unitario ($)": float(precio_unitario),
         "Promedio": promedio, "Kilos Restantes": kilos_restantes, "Libras Restantes": libras_restantes,
         "Total ($)": total, "Monto Deposito": 0.0, "Saldo diario": 0.0, "Saldo Acumulado": 0.0
     }
-    df_balance = df[df["Proveedor"] == "BALANCE_INICIAL"].copy()
-    df_temp = df[df["Proveedor"] != "BALANCE_INICIAL"].copy()
-    df_temp = pd.concat([df_temp, pd.DataFrame([nueva_fila])], ignore_index=True)
-    st.session_state.data = pd.concat([df_balance, df_temp], ignore_index=True)
+    # El orden por fecha lo restablece recalculate_accumulated_balances
+    insertar_filas("data", [nueva_fila], f"Agregar registro N° {enumeracion} ({proveedor})")
     if save_dataframe(st.session_state.data, DATA_FILE):
         st.session_state.record_added = True
         st.success("Registro agregado correctamente. Recalculando saldos...")
@@ -399,7 +985,7 @@ def delete_record(index_to_delete):
         if st.session_state.data.loc[index_to_delete, "Proveedor"] == "BALANCE_INICIAL":
             st.error("No se puede eliminar la fila de BALANCE_INICIAL.")
             return
-        st.session_state.data = st.session_state.data.drop(index=index_to_delete).reset_index(drop=True)
+        eliminar_filas("data", [index_to_delete], f"Eliminar registro N° {st.session_state.data.loc[index_to_delete, 'N']}")
         if save_dataframe(st.session_state.data, DATA_FILE):
             st.session_state.record_deleted = True
             st.success("Registro eliminado correctamente. Recalculando saldos...")
@@ -411,32 +997,33 @@ def delete_record(index_to_delete):
 def edit_supplier_record(index_to_edit, updated_data):
     """Edita un registro de proveedor."""
     try:
-        current_df = st.session_state.data.copy()
-        if current_df.loc[index_to_edit, "Proveedor"] == "BALANCE_INICIAL":
+        fila = st.session_state.data.loc[index_to_edit]
+        if fila["Proveedor"] == "BALANCE_INICIAL":
             st.error("No se puede editar la fila de BALANCE_INICIAL.")
             return
+        valores = {}
         for key, value in updated_data.items():
             if key == "Fecha":
-                current_df.loc[index_to_edit, key] = pd.to_datetime(value).date()
+                valores[key] = pd.to_datetime(value).date()
             elif key in ["Cantidad", "Cantidad de gavetas"]:
-                current_df.loc[index_to_edit, key] = int(value)
+                valores[key] = int(value)
             elif key in ["Peso Salida (kg)", "Peso Entrada (kg)", "Precio Unitario ($)"]:
-                current_df.loc[index_to_edit, key] = float(value)
+                valores[key] = float(value)
             else:
-                current_df.loc[index_to_edit, key] = value
-        peso_salida = current_df.loc[index_to_edit, "Peso Salida (kg)"]
-        peso_entrada = current_df.loc[index_to_edit, "Peso Entrada (kg)"]
-        cantidad = current_df.loc[index_to_edit, "Cantidad"]
-        precio_unitario = current_df.loc[index_to_edit, "Precio Unitario ($)"]
+                valores[key] = value
+        peso_salida = valores.get("Peso Salida (kg)", fila["Peso Salida (kg)"])
+        peso_entrada = valores.get("Peso Entrada (kg)", fila["Peso Entrada (kg)"])
+        cantidad = valores.get("Cantidad", fila["Cantidad"])
+        precio_unitario = valores.get("Precio Unitario ($)", fila["Precio Unitario ($)"])
         kilos_restantes = peso_salida - peso_entrada
         libras_restantes = kilos_restantes * LBS_PER_KG
         promedio = libras_restantes / cantidad if cantidad != 0 else 0
         total = libras_restantes * precio_unitario
-        current_df.loc[index_to_edit, "Kilos Restantes"] = kilos_restantes
-        current_df.loc[index_to_edit, "Libras Restantes"] = libras_restantes
-        current_df.loc[index_to_edit, "Promedio"] = promedio
-        current_df.loc[index_to_edit, "Total ($)"] = total
-        st.session_state.data = current_df
+        valores.update({
+            "Kilos Restantes": kilos_restantes, "Libras Restantes": libras_restantes,
+            "Promedio": promedio, "Total ($)": total
+        })
+        actualizar_celdas("data", {index_to_edit: valores}, f"Editar registro N° {fila['N']}")
         if save_dataframe(st.session_state.data, DATA_FILE):
             st.session_state.record_edited = True
             st.success("Registro editado exitosamente. Recalculando saldos...")
@@ -445,13 +1032,15 @@ def edit_supplier_record(index_to_edit, updated_data):
     except Exception as e:
         st.error(f"Error al editar el registro: {e}")
 
+def libras_del_dia(fecha):
+    """Suma las Libras Restantes de los registros de proveedores de una fecha."""
+    df_data = st.session_state.data
+    del_dia = (df_data["Fecha"] == fecha) & (df_data["Proveedor"] != "BALANCE_INICIAL")
+    return pd.to_numeric(df_data.loc[del_dia, "Libras Restantes"], errors='coerce').fillna(0).sum()
+
 def add_debit_note(fecha_nota, descuento, descuento_real):
     """Agrega una nueva nota de débito."""
-    df_data = st.session_state.data.copy()
-    df_data["Libras Restantes"] = pd.to_numeric(df_data["Libras Restantes"], errors='coerce').fillna(0)
-    libras_calculadas = df_data[
-        (df_data["Fecha"] == fecha_nota) & (df_data["Proveedor"] != "BALANCE_INICIAL")
-    ]["Libras Restantes"].sum()
+    libras_calculadas = libras_del_dia(fecha_nota)
     descuento_posible = libras_calculadas * descuento
     nueva_nota = {
         "Fecha": fecha_nota,
@@ -460,7 +1049,7 @@ def add_debit_note(fecha_nota, descuento, descuento_real):
         "Descuento posible": descuento_posible,
         "Descuento real": float(descuento_real)
     }
-    st.session_state.notas = pd.concat([st.session_state.notas, pd.DataFrame([nueva_nota])], ignore_index=True)
+    insertar_filas("notas", [nueva_nota], f"Agregar nota de débito del {fecha_nota}")
     if save_dataframe(st.session_state.notas, DEBIT_NOTES_FILE):
         st.session_state.debit_note_added = True
         st.success("Nota de débito agregada correctamente. Recalculando saldos...")
@@ -470,7 +1059,7 @@ def add_debit_note(fecha_nota, descuento, descuento_real):
 def delete_debit_note_record(index_to_delete):
     """Elimina una nota de débito."""
     try:
-        st.session_state.notas = st.session_state.notas.drop(index=index_to_delete).reset_index(drop=True)
+        eliminar_filas("notas", [index_to_delete], f"Eliminar nota de débito del {st.session_state.notas.loc[index_to_delete, 'Fecha']}")
         if save_dataframe(st.session_state.notas, DEBIT_NOTES_FILE):
             st.session_state.debit_note_deleted = True
             st.success("Nota de débito eliminada correctamente. Recalculando saldos...")
@@ -482,27 +1071,24 @@ def delete_debit_note_record(index_to_delete):
 def edit_debit_note_record(index_to_edit, updated_data):
     """Edita una nota de débito."""
     try:
-        current_df = st.session_state.notas.copy()
-        if index_to_edit not in current_df.index:
+        notas = st.session_state.notas
+        if index_to_edit not in notas.index:
             st.error("El índice de nota de débito a editar no es válido.")
             return
+        valores = {}
         for key, value in updated_data.items():
             if key == "Fecha":
-                current_df.loc[index_to_edit, key] = pd.to_datetime(value).date()
+                valores[key] = pd.to_datetime(value).date()
             elif key in ["Descuento", "Descuento real"]:
-                current_df.loc[index_to_edit, key] = float(value)
+                valores[key] = float(value)
             else:
-                current_df.loc[index_to_edit, key] = value
-        fecha_nota_actual = current_df.loc[index_to_edit, "Fecha"]
-        descuento_actual = current_df.loc[index_to_edit, "Descuento"]
-        df_data_for_calc = st.session_state.data.copy()
-        df_data_for_calc["Libras Restantes"] = pd.to_numeric(df_data_for_calc["Libras Restantes"], errors='coerce').fillna(0)
-        libras_calculadas_recalc = df_data_for_calc[
-            (df_data_for_calc["Fecha"] == fecha_nota_actual) & (df_data_for_calc["Proveedor"] != "BALANCE_INICIAL")
-        ]["Libras Restantes"].sum()
-        current_df.loc[index_to_edit, "Libras calculadas"] = libras_calculadas_recalc
-        current_df.loc[index_to_edit, "Descuento posible"] = libras_calculadas_recalc * descuento_actual
-        st.session_state.notas = current_df
+                valores[key] = value
+        fecha_nota_actual = valores.get("Fecha", notas.loc[index_to_edit, "Fecha"])
+        descuento_actual = valores.get("Descuento", notas.loc[index_to_edit, "Descuento"])
+        libras_calculadas_recalc = libras_del_dia(fecha_nota_actual)
+        valores["Libras calculadas"] = libras_calculadas_recalc
+        valores["Descuento posible"] = libras_calculadas_recalc * descuento_actual
+        actualizar_celdas("notas", {index_to_edit: valores}, f"Editar nota de débito del {fecha_nota_actual}")
         if save_dataframe(st.session_state.notas, DEBIT_NOTES_FILE):
             st.session_state.debit_note_edited = True
             st.success("Nota de débito editada exitosamente. Recalculando saldos...")
@@ -511,155 +1097,197 @@ def edit_debit_note_record(index_to_edit, updated_data):
     except Exception as e:
         st.error(f"Error al editar la nota de débito: {e}")
 
+def catalogos_importacion():
+    """Listas de valores permitidos para validar las hojas importadas (ver validacion.py)."""
+    return {
+        "proveedores": PROVEEDORES, "agencias": AGENCIAS, "tipos_documento": TIPOS_DOCUMENTO,
+        "clientes": CLIENTES, "tipos_ave": TIPOS_AVE, "categorias": CATEGORIAS_GASTO,
+    }
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def _leer_libro_importado(contenido, hojas, catalogos):
+    """Hojas leídas y validadas del libro (en paralelo si hay varias hojas grandes); se guardan para no releerlo al pulsar "Cargar"."""
+    return validacion.leer_libro(contenido, list(hojas), catalogos)
+
+def hoja_importada(leidas, hoja, columnas, reportes):
+    """Filas válidas de una hoja leída (vacío si el libro no la tiene o le faltan columnas); los errores van a reportes."""
+    if hoja not in leidas:
+        return pd.DataFrame(columns=columnas)
+    validas, errores, faltantes = leidas[hoja]
+    if faltantes:
+        st.warning(f"La hoja '{hoja}' no contiene todas las columnas requeridas (faltan: {', '.join(faltantes)}).")
+        return pd.DataFrame(columns=columnas)
+    reportes.append(errores)
+    return validas
+
+def render_reporte_validacion(reportes, nombre_archivo):
+    """Muestra el resumen de errores de validación y el botón para descargar el reporte por fila."""
+    reporte = pd.concat(reportes, ignore_index=True) if reportes else pd.DataFrame(columns=validacion.COLUMNAS_REPORTE)
+    if reporte.empty:
+        return
+    filas_con_error = reporte.drop_duplicates(["Hoja", "Fila"]).groupby("Hoja").size()
+    st.warning(
+        "Se omitirán las filas con errores: "
+        + ", ".join(f"{n} en '{hoja}'" for hoja, n in filas_con_error.items())
+        + ". Las demás filas se pueden importar."
+    )
+    st.dataframe(reporte.head(100), use_container_width=True, hide_index=True)
+    st.download_button(
+        "⬇️ Descargar reporte de errores (CSV)", validacion.reporte_csv(reporte),
+        file_name=f"errores_{nombre_archivo}.csv", mime="text/csv", key=f"reporte_errores_{nombre_archivo}"
+    )
+
 def import_excel_data(archivo_excel):
     """Importa datos desde un archivo Excel."""
     try:
-        xls = pd.ExcelFile(archivo_excel)
-        sheet_names = xls.sheet_names
+        contenido = archivo_excel.getvalue()
+        sheet_names = pd.ExcelFile(io.BytesIO(contenido)).sheet_names
+        # Cada hoja se lee y valida (en procesos propios si son grandes); se agregan a los registros juntas al final
+        hojas = tuple(hoja for hoja in validacion.ESQUEMAS if hoja in sheet_names)
+        with st.spinner("Leyendo y validando las hojas del libro..."):
+            leidas = _leer_libro_importado(contenido, hojas, catalogos_importacion())
+        # Errores por fila de todas las hojas (las filas con errores no se importan)
+        reportes = []
 
         # Proveedores
-        df_proveedores_importado = pd.DataFrame(columns=COLUMNS_DATA)
-        if "registro de proveedores" in sheet_names:
-            df_proveedores_importado = pd.read_excel(xls, sheet_name="registro de proveedores")
-            columnas_requeridas_proveedores = [
-                "Fecha", "Proveedor", "Cantidad", "Peso Salida (kg)", "Peso Entrada (kg)",
-                "Tipo Documento", "Cantidad de gavetas", "Precio Unitario ($)"
-            ]
-            if not all(col in df_proveedores_importado.columns for col in columnas_requeridas_proveedores):
-                st.warning(f"La hoja 'registro de proveedores' no contiene todas las columnas requeridas.")
-            else:
-                df_proveedores_importado["Fecha"] = pd.to_datetime(df_proveedores_importado["Fecha"], errors="coerce").dt.date
-                df_proveedores_importado.dropna(subset=["Fecha"], inplace=True)
-                for col in ["Cantidad", "Peso Salida (kg)", "Peso Entrada (kg)", "Precio Unitario ($)", "Cantidad de gavetas"]:
-                    df_proveedores_importado[col] = pd.to_numeric(df_proveedores_importado[col], errors='coerce').fillna(0)
-                df_proveedores_importado["Kilos Restantes"] = df_proveedores_importado["Peso Salida (kg)"] - df_proveedores_importado["Peso Entrada (kg)"]
-                df_proveedores_importado["Libras Restantes"] = df_proveedores_importado["Kilos Restantes"] * LBS_PER_KG
-                df_proveedores_importado["Promedio"] = df_proveedores_importado.apply(
-                    lambda row: row["Libras Restantes"] / row["Cantidad"] if row["Cantidad"] != 0 else 0, axis=1
+        df_proveedores_importado = hoja_importada(leidas, "registro de proveedores", COLUMNS_DATA, reportes)
+        if not df_proveedores_importado.empty:
+            df_proveedores_importado["Kilos Restantes"] = df_proveedores_importado["Peso Salida (kg)"] - df_proveedores_importado["Peso Entrada (kg)"]
+            df_proveedores_importado["Libras Restantes"] = df_proveedores_importado["Kilos Restantes"] * LBS_PER_KG
+            df_proveedores_importado["Promedio"] = (
+                df_proveedores_importado["Libras Restantes"] / df_proveedores_importado["Cantidad"]
+            ).where(df_proveedores_importado["Cantidad"] != 0, 0.0)
+            df_proveedores_importado["Total ($)"] = df_proveedores_importado["Libras Restantes"] * df_proveedores_importado["Precio Unitario ($)"]
+            current_ops_data = st.session_state.data[st.session_state.data["Proveedor"] != "BALANCE_INICIAL"].copy()
+            max_n_existing_proveedores = max_n_registrado("data")
+            if not current_ops_data.empty:
+                max_n_existing_proveedores = max(
+                    max_n_existing_proveedores,
+                    current_ops_data["N"].apply(lambda x: int(x) if isinstance(x, str) and x.isdigit() else 0).max()
                 )
-                df_proveedores_importado["Total ($)"] = df_proveedores_importado["Libras Restantes"] * df_proveedores_importado["Precio Unitario ($)"]
-                current_ops_data = st.session_state.data[st.session_state.data["Proveedor"] != "BALANCE_INICIAL"].copy()
-                max_n_existing_proveedores = 0
-                if not current_ops_data.empty:
-                    max_n_existing_proveedores = current_ops_data["N"].apply(lambda x: int(x) if isinstance(x, str) and x.isdigit() else 0).max()
-                new_n_counter_proveedores = max_n_existing_proveedores + 1
-                df_proveedores_importado["N"] = [f"{new_n_counter_proveedores + i:02}" for i in range(len(df_proveedores_importado))]
-                df_proveedores_importado["Monto Deposito"] = 0.0
-                df_proveedores_importado["Saldo diario"] = 0.0
-                df_proveedores_importado["Saldo Acumulado"] = 0.0
-                df_proveedores_importado["Producto"] = PRODUCT_NAME
-                df_proveedores_importado = df_proveedores_importado[COLUMNS_DATA]
+            new_n_counter_proveedores = max_n_existing_proveedores + 1
+            df_proveedores_importado["N"] = [f"{new_n_counter_proveedores + i:02}" for i in range(len(df_proveedores_importado))]
+            df_proveedores_importado["Monto Deposito"] = 0.0
+            df_proveedores_importado["Saldo diario"] = 0.0
+            df_proveedores_importado["Saldo Acumulado"] = 0.0
+            df_proveedores_importado = df_proveedores_importado[COLUMNS_DATA]
 
         # Depósitos
-        df_depositos_importado = pd.DataFrame(columns=COLUMNS_DEPOSITS)
-        if "registro de depositos" in sheet_names:
-            df_depositos_importado = pd.read_excel(xls, sheet_name="registro de depositos")
-            columnas_requeridas_depositos = ["Fecha", "Empresa", "Agencia", "Monto"]
-            if not all(col in df_depositos_importado.columns for col in columnas_requeridas_depositos):
-                st.warning(f"La hoja 'registro de depositos' no contiene todas las columnas requeridas.")
-            else:
-                df_depositos_importado["Fecha"] = pd.to_datetime(df_depositos_importado["Fecha"], errors="coerce").dt.date
-                df_depositos_importado.dropna(subset=["Fecha"], inplace=True)
-                df_depositos_importado["Monto"] = pd.to_numeric(df_depositos_importado["Monto"], errors='coerce').fillna(0)
-                current_deposits_data = st.session_state.df.copy()
-                max_n_existing_deposits = 0
-                if not current_deposits_data.empty:
-                    valid_n_deposits = current_deposits_data[current_deposits_data["N"].str.isdigit()]["N"].astype(int)
-                    max_n_existing_deposits = valid_n_deposits.max() if not valid_n_deposits.empty else 0
-                new_n_counter_deposits = max_n_existing_deposits + 1
-                df_depositos_importado["N"] = [f"{new_n_counter_deposits + i:02}" for i in range(len(df_depositos_importado))]
-                df_depositos_importado["Documento"] = df_depositos_importado["Agencia"].apply(
-                    lambda x: "Deposito" if "Cajero" in str(x) else "Transferencia"
-                )
-                df_depositos_importado = df_depositos_importado[COLUMNS_DEPOSITS]
+        df_depositos_importado = hoja_importada(leidas, "registro de depositos", COLUMNS_DEPOSITS, reportes)
+        if not df_depositos_importado.empty:
+            current_deposits_data = st.session_state.df.copy()
+            max_n_existing_deposits = max_n_registrado("df")
+            if not current_deposits_data.empty:
+                valid_n_deposits = current_deposits_data[current_deposits_data["N"].str.isdigit()]["N"].astype(int)
+                if not valid_n_deposits.empty:
+                    max_n_existing_deposits = max(max_n_existing_deposits, valid_n_deposits.max())
+            new_n_counter_deposits = max_n_existing_deposits + 1
+            df_depositos_importado["N"] = [f"{new_n_counter_deposits + i:02}" for i in range(len(df_depositos_importado))]
+            df_depositos_importado["Documento"] = np.where(
+                df_depositos_importado["Agencia"].str.contains("Cajero", regex=False), "Deposito", "Transferencia"
+            )
+            df_depositos_importado = df_depositos_importado[COLUMNS_DEPOSITS]
 
         # Notas de Débito
-        df_notas_debito_importado = pd.DataFrame(columns=COLUMNS_DEBIT_NOTES)
-        if "registro de notas de debito" in sheet_names:
-            df_notas_debito_importado = pd.read_excel(xls, sheet_name="registro de notas de debito")
-            columnas_requeridas_notas = ["Fecha", "Descuento", "Descuento real"]
-            if not all(col in df_notas_debito_importado.columns for col in columnas_requeridas_notas):
-                st.warning(f"La hoja 'registro de notas de debito' no contiene todas las columnas requeridas.")
+        df_notas_debito_importado = hoja_importada(leidas, "registro de notas de debito", COLUMNS_DEBIT_NOTES, reportes)
+        if not df_notas_debito_importado.empty:
+            if not st.session_state.data.empty:
+                df_data_for_calc_notes = st.session_state.data.copy()
+                df_data_for_calc_notes["Libras Restantes"] = pd.to_numeric(df_data_for_calc_notes["Libras Restantes"], errors='coerce').fillna(0)
+                libras_por_fecha = df_data_for_calc_notes[
+                    df_data_for_calc_notes["Proveedor"] != "BALANCE_INICIAL"
+                ].groupby("Fecha")["Libras Restantes"].sum()
+                df_notas_debito_importado["Libras calculadas"] = (
+                    df_notas_debito_importado["Fecha"].map(libras_por_fecha).fillna(0.0)
+                )
+                df_notas_debito_importado["Descuento posible"] = df_notas_debito_importado["Libras calculadas"] * df_notas_debito_importado["Descuento"]
             else:
-                df_notas_debito_importado["Fecha"] = pd.to_datetime(df_notas_debito_importado["Fecha"], errors="coerce").dt.date
-                df_notas_debito_importado.dropna(subset=["Fecha"], inplace=True)
-                df_notas_debito_importado["Descuento"] = pd.to_numeric(df_notas_debito_importado["Descuento"], errors='coerce').fillna(0)
-                df_notas_debito_importado["Descuento real"] = pd.to_numeric(df_notas_debito_importado["Descuento real"], errors='coerce').fillna(0)
-                if not df_notas_debito_importado.empty and not st.session_state.data.empty:
-                    df_data_for_calc_notes = st.session_state.data.copy()
-                    df_data_for_calc_notes["Libras Restantes"] = pd.to_numeric(df_data_for_calc_notes["Libras Restantes"], errors='coerce').fillna(0)
-                    df_notas_debito_importado["Libras calculadas"] = df_notas_debito_importado["Fecha"].apply(
-                        lambda f: df_data_for_calc_notes[
-                            (df_data_for_calc_notes["Fecha"] == f) & (df_data_for_calc_notes["Proveedor"] != "BALANCE_INICIAL")
-                        ]["Libras Restantes"].sum()
-                    )
-                    df_notas_debito_importado["Descuento posible"] = df_notas_debito_importado["Libras calculadas"] * df_notas_debito_importado["Descuento"]
-                else:
-                    df_notas_debito_importado["Libras calculadas"] = 0.0
-                    df_notas_debito_importado["Descuento posible"] = 0.0
-                df_notas_debito_importado = df_notas_debito_importado[COLUMNS_DEBIT_NOTES]
+                df_notas_debito_importado["Libras calculadas"] = 0.0
+                df_notas_debito_importado["Descuento posible"] = 0.0
+            df_notas_debito_importado = df_notas_debito_importado[COLUMNS_DEBIT_NOTES]
 
         # Ventas
-        df_ventas_importado = pd.DataFrame(columns=COLUMNS_VENTAS)
-        if "ventas" in sheet_names:
-            df_ventas_importado = pd.read_excel(xls, sheet_name="ventas")
-            expected_cols_ventas = COLUMNS_VENTAS
-            df_ventas_importado.columns = df_ventas_importado.columns.str.lower().str.replace(' ', '_')
-            if not all(col in df_ventas_importado.columns for col in expected_cols_ventas):
-                st.warning(f"La hoja 'ventas' no contiene todas las columnas requeridas: {', '.join(expected_cols_ventas)}.")
-            else:
-                for col in ['cantidad']:
-                    df_ventas_importado[col] = pd.to_numeric(df_ventas_importado[col], errors='coerce').fillna(0).astype(int)
-                for col in ['libras', 'descuento', 'libras_netas', 'precio', 'total_a_cobrar', 'pago_cliente', 'saldo']:
-                    df_ventas_importado[col] = pd.to_numeric(df_ventas_importado[col], errors='coerce').fillna(0.0).round(2)
-                df_ventas_importado['fecha'] = pd.to_datetime(df_ventas_importado['fecha'], errors='coerce').dt.date
-                df_ventas_importado.dropna(subset=['fecha'], inplace=True)
-                df_ventas_importado = df_ventas_importado[expected_cols_ventas]
+        df_ventas_importado = hoja_importada(leidas, "ventas", COLUMNS_VENTAS, reportes)
+        if not df_ventas_importado.empty:
+            columnas_montos = ['libras', 'descuento', 'libras_netas', 'precio', 'total_a_cobrar', 'pago_cliente', 'saldo']
+            df_ventas_importado[columnas_montos] = df_ventas_importado[columnas_montos].round(2)
+            df_ventas_importado = df_ventas_importado[COLUMNS_VENTAS]
 
         # Gastos
-        df_gastos_importado = pd.DataFrame(columns=COLUMNS_GASTOS)
-        if "gastos" in sheet_names:
-            df_gastos_importado = pd.read_excel(xls, sheet_name="gastos")
-            expected_cols_gastos = COLUMNS_GASTOS
-            df_gastos_importado.columns = df_gastos_importado.columns.str.lower().str.replace(' ', '_')
-            if not all(col in df_gastos_importado.columns for col in expected_cols_gastos):
-                st.warning(f"La hoja 'gastos' no contiene todas las columnas requeridas: {', '.join(expected_cols_gastos)}.")
-            else:
-                for col in ['calculo', 'dinero']:
-                    df_gastos_importado[col] = pd.to_numeric(df_gastos_importado[col], errors='coerce').fillna(0.0).round(2)
-                df_gastos_importado['fecha'] = pd.to_datetime(df_gastos_importado['fecha'], errors='coerce').dt.date
-                df_gastos_importado.dropna(subset=['fecha'], inplace=True)
-                df_gastos_importado = df_gastos_importado[expected_cols_gastos]
+        df_gastos_importado = hoja_importada(leidas, "gastos", COLUMNS_GASTOS, reportes)
+        if not df_gastos_importado.empty:
+            df_gastos_importado[['calculo', 'dinero']] = df_gastos_importado[['calculo', 'dinero']].round(2)
+            df_gastos_importado = df_gastos_importado[COLUMNS_GASTOS]
+
+        nombre_archivo = getattr(archivo_excel, "name", "importacion")
+        render_reporte_validacion(reportes, nombre_archivo.rsplit(".", 1)[0])
+
+        # Los duplicados se cuentan antes de importar, igual que los errores de validación se muestran antes
+        reporte_duplicados = []
+        df_ventas_nuevas, hashes_ventas = df_ventas_importado, None
+        if not df_ventas_importado.empty:
+            claves_ventas = cargar_indice_claves(VENTAS_KEYS_FILE, "ventas", KEY_COLUMNS_VENTAS)
+            df_ventas_nuevas, duplicados_ventas, hashes_ventas = filtrar_duplicados(
+                df_ventas_importado, claves_ventas, KEY_COLUMNS_VENTAS
+            )
+            reporte_duplicados.append({
+                "Hoja": "ventas", "Filas leídas": len(df_ventas_importado),
+                "Filas nuevas": len(df_ventas_nuevas), "Duplicados omitidos": duplicados_ventas
+            })
+        df_gastos_nuevos, hashes_gastos = df_gastos_importado, None
+        if not df_gastos_importado.empty:
+            claves_gastos = cargar_indice_claves(GASTOS_KEYS_FILE, "gastos", KEY_COLUMNS_GASTOS)
+            df_gastos_nuevos, duplicados_gastos, hashes_gastos = filtrar_duplicados(
+                df_gastos_importado, claves_gastos, KEY_COLUMNS_GASTOS
+            )
+            reporte_duplicados.append({
+                "Hoja": "gastos", "Filas leídas": len(df_gastos_importado),
+                "Filas nuevas": len(df_gastos_nuevos), "Duplicados omitidos": duplicados_gastos
+            })
+        if reporte_duplicados:
+            st.write("**Resumen de duplicados por hoja (se omitirán al importar):**")
+            st.dataframe(pd.DataFrame(reporte_duplicados), use_container_width=True, hide_index=True)
 
-        if st.button("Cargar datos a registros desde Excel"):
+        def registrar_importacion(tabla, filas):
+            registrar_evento("importar", tabla, f"Importar {len(filas)} fila(s) de {nombre_archivo}",
+                             filas=eventos.filas_a_registros(filas))
+
+        if st.button("Cargar datos a registros desde Excel") and respaldar_antes("antes de importar un Excel"):
             if not df_proveedores_importado.empty:
                 df_balance = st.session_state.data[st.session_state.data["Proveedor"] == "BALANCE_INICIAL"].copy()
                 df_temp = st.session_state.data[st.session_state.data["Proveedor"] != "BALANCE_INICIAL"].copy()
                 st.session_state.data = pd.concat([df_balance, df_temp, df_proveedores_importado], ignore_index=True)
                 save_dataframe(st.session_state.data, DATA_FILE)
+                registrar_importacion("proveedores", df_proveedores_importado)
                 st.session_state.data_imported = True
             if not df_depositos_importado.empty:
                 st.session_state.df = pd.concat([st.session_state.df, df_depositos_importado], ignore_index=True)
                 st.session_state.df["N"] = st.session_state.df["N"].astype(str)
                 save_dataframe(st.session_state.df, DEPOSITS_FILE)
+                registrar_importacion("depositos", df_depositos_importado)
                 st.session_state.data_imported = True
             if not df_notas_debito_importado.empty:
                 st.session_state.notas = pd.concat([st.session_state.notas, df_notas_debito_importado], ignore_index=True)
                 save_dataframe(st.session_state.notas, DEBIT_NOTES_FILE)
+                registrar_importacion("notas_debito", df_notas_debito_importado)
                 st.session_state.data_imported = True
-            if not df_ventas_importado.empty:
-                st.session_state.ventas_raw_data = pd.concat([st.session_state.ventas_raw_data, df_ventas_importado], ignore_index=True)
-                st.session_state.ventas_raw_data.drop_duplicates(subset=['fecha', 'cliente', 'tipo', 'cantidad', 'libras', 'precio'], keep='first', inplace=True)
-                save_dataframe(st.session_state.ventas_raw_data, VENTAS_FILE)
+            if not df_ventas_nuevas.empty:
+                st.session_state.ventas_raw_data = pd.concat([st.session_state.ventas_raw_data, df_ventas_nuevas], ignore_index=True)
+                version_anterior = ventas_gastos.version_tabla("ventas")
+                if append_dataframe(df_ventas_nuevas, VENTAS_FILE, hashes_ventas):
+                    st.session_state.cartera_clientes = ventas_gastos.aplicar_cambios_cartera(
+                        version_anterior, agregar=df_ventas_nuevas
+                    )
+                    registrar_importacion("ventas", df_ventas_nuevas)
                 st.session_state.data_imported = True
-                st.session_state.ventas_data = get_ventas_df_processed()
-            if not df_gastos_importado.empty:
-                st.session_state.gastos_raw_data = pd.concat([st.session_state.gastos_raw_data, df_gastos_importado], ignore_index=True)
-                st.session_state.gastos_raw_data.drop_duplicates(subset=['fecha', 'gasto', 'dinero'], keep='first', inplace=True)
-                save_dataframe(st.session_state.gastos_raw_data, GASTOS_FILE)
+            if not df_gastos_nuevos.empty:
+                st.session_state.gastos_raw_data = pd.concat([st.session_state.gastos_raw_data, df_gastos_nuevos], ignore_index=True)
+                if append_dataframe(df_gastos_nuevos, GASTOS_FILE, hashes_gastos):
+                    registrar_importacion("gastos", df_gastos_nuevos)
                 st.session_state.data_imported = True
-                st.session_state.gastos_data = get_gastos_df_processed()
             if st.session_state.data_imported:
+                # La importación renumera las filas: el historial anterior ya no es aplicable
+                limpiar_historial_cambios()
                 st.success("Datos importados correctamente. Recalculando saldos...")
             else:
                 st.info("No se importaron datos válidos de ninguna hoja.")
@@ -667,102 +1295,90 @@ def import_excel_data(archivo_excel):
         st.error(f"Error al cargar el archivo Excel: {e}")
 
 # Funciones del Código 2
-def get_ventas_df_processed():
-    """Procesa el DataFrame de ventas para visualización."""
-    df = st.session_state.ventas_raw_data.copy()
-    if not df.empty:
-        if 'fecha' in df.columns:
-            df['Fecha'] = pd.to_datetime(df['fecha']).dt.date
-        else:
-            df['Fecha'] = date.today()
-            st.warning("Columna 'fecha' no encontrada en ventas_raw_data. Usando fecha actual.")
-        df = df.rename(columns={
-            'fecha': 'Fecha DB', 'cliente': 'Cliente', 'tipo': 'Tipo', 'cantidad': 'Cantidad',
-            'libras': 'Libras', 'descuento': 'Descuento', 'libras_netas': 'Libras_netas',
-            'precio': 'Precio', 'total_a_cobrar': 'Total_a_cobrar', 'pago_cliente': 'Pago_Cliente',
-            'saldo': 'Saldo'
-        })
-        df = df.sort_values(by=['Fecha', 'Cliente'], ascending=[False, True])
-    return df
+def get_ventas_df_processed(filtros=None):
+    """Vista de ventas para visualización: filas filtradas, ordenadas por fecha y cliente, columnas renombradas."""
+    return obtener_vista_ordenada("ventas_raw_data", filtros)
 
-def get_gastos_df_processed():
-    """Procesa el DataFrame de gastos para visualización."""
-    df = st.session_state.gastos_raw_data.copy()
-    if not df.empty:
-        if 'fecha' in df.columns:
-            df['Fecha'] = pd.to_datetime(df['fecha']).dt.date
-        else:
-            df['Fecha'] = date.today()
-            st.warning("Columna 'fecha' no encontrada en gastos_raw_data. Usando fecha actual.")
-        df = df.rename(columns={
-            'fecha': 'Fecha DB', 'calculo': 'Calculo', 'descripcion': 'Descripcion',
-            'gasto': 'Gasto', 'dinero': 'Dinero'
-        })
-        df = df.sort_values(by='Fecha', ascending=False)
-    return df
+def get_gastos_df_processed(filtros=None):
+    """Vista de gastos para visualización: filas filtradas, ordenadas por fecha, columnas renombradas."""
+    return obtener_vista_ordenada("gastos_raw_data", filtros)
 
 def guardar_venta(venta_data):
     """Guarda una nueva venta."""
-    nueva_venta_df = pd.DataFrame([venta_data])
-    st.session_state.ventas_raw_data = pd.concat([nueva_venta_df, st.session_state.ventas_raw_data], ignore_index=True)
-    if save_dataframe(st.session_state.ventas_raw_data, VENTAS_FILE):
+    # Las ventas nuevas van al final; el orden de visualización lo mantiene su vista ordenada
+    nueva_venta_df = insertar_filas("ventas_raw_data", [venta_data], f"Registrar venta de {venta_data['cliente']}")
+    version_anterior = ventas_gastos.version_tabla("ventas")
+    if append_dataframe(nueva_venta_df, VENTAS_FILE, calcular_hash_claves(nueva_venta_df, KEY_COLUMNS_VENTAS)):
+        st.session_state.cartera_clientes = ventas_gastos.aplicar_cambios_cartera(
+            version_anterior, agregar=[venta_data]
+        )
         st.session_state.venta_added = True
-        st.session_state.ventas_data = get_ventas_df_processed()
         return True
     return False
 
 def guardar_gasto(gasto_data):
     """Guarda un nuevo gasto."""
-    nuevo_gasto_df = pd.DataFrame([gasto_data])
-    st.session_state.gastos_raw_data = pd.concat([nuevo_gasto_df, st.session_state.gastos_raw_data], ignore_index=True)
-    if save_dataframe(st.session_state.gastos_raw_data, GASTOS_FILE):
+    # Los gastos nuevos van al final; el orden de visualización lo mantiene su vista ordenada
+    nuevo_gasto_df = insertar_filas("gastos_raw_data", [gasto_data], f"Registrar gasto '{gasto_data['descripcion']}'")
+    if append_dataframe(nuevo_gasto_df, GASTOS_FILE, calcular_hash_claves(nuevo_gasto_df, KEY_COLUMNS_GASTOS)):
         st.session_state.gasto_added = True
-        st.session_state.gastos_data = get_gastos_df_processed()
         return True
     return False
 
 def limpiar_ventas():
     """Elimina todas las ventas."""
+    if not respaldar_antes("antes de eliminar todas las ventas"):
+        return False
+    filas_eliminadas = int(particiones.leer_resumen("ventas")["filas"].sum())
     st.session_state.ventas_raw_data = pd.DataFrame(columns=COLUMNS_VENTAS)
-    if save_dataframe(st.session_state.ventas_raw_data, VENTAS_FILE):
-        if os.path.exists(VENTAS_FILE):
-            os.remove(VENTAS_FILE)
-        st.session_state.ventas_data = get_ventas_df_processed()
-        return True
-    return False
+    try:
+        ventas_gastos.eliminar_tabla("ventas")
+    except OSError as e:
+        st.error(f"Error al eliminar las ventas: {e}")
+        return False
+    recordar_version_compartida("ventas")
+    st.session_state.cartera_clientes = ventas_gastos.recargar_cartera()
+    limpiar_historial_cambios()
+    registrar_evento("vaciar", "ventas", "Eliminar todas las ventas",
+                     filas_eliminadas=filas_eliminadas, respaldo=respaldos.ultima())
+    return True
 
 def limpiar_gastos():
     """Elimina todos los gastos."""
+    if not respaldar_antes("antes de eliminar todos los gastos"):
+        return False
+    filas_eliminadas = int(particiones.leer_resumen("gastos")["filas"].sum())
     st.session_state.gastos_raw_data = pd.DataFrame(columns=COLUMNS_GASTOS)
-    if save_dataframe(st.session_state.gastos_raw_data, GASTOS_FILE):
-        if os.path.exists(GASTOS_FILE):
-            os.remove(GASTOS_FILE)
-        st.session_state.gastos_data = get_gastos_df_processed()
-        return True
-    return False
+    try:
+        ventas_gastos.eliminar_tabla("gastos")
+    except OSError as e:
+        st.error(f"Error al eliminar los gastos: {e}")
+        return False
+    recordar_version_compartida("gastos")
+    limpiar_historial_cambios()
+    registrar_evento("vaciar", "gastos", "Eliminar todos los gastos",
+                     filas_eliminadas=filas_eliminadas, respaldo=respaldos.ultima())
+    return True
 
 def actualizar_venta(index, updated_data):
     """Actualiza una venta existente."""
     try:
-        for col, val in updated_data.items():
-            if col == 'fecha':
-                st.session_state.ventas_raw_data.loc[index, col] = pd.to_datetime(val).date()
-            else:
-                st.session_state.ventas_raw_data.loc[index, col] = val
-        libras = st.session_state.ventas_raw_data.loc[index, 'libras']
-        descuento = st.session_state.ventas_raw_data.loc[index, 'descuento']
-        precio = st.session_state.ventas_raw_data.loc[index, 'precio']
-        pago_cliente = st.session_state.ventas_raw_data.loc[index, 'pago_cliente']
-        st.session_state.ventas_raw_data.loc[index, 'libras_netas'] = calcular_libras_netas(libras, descuento)
-        st.session_state.ventas_raw_data.loc[index, 'total_a_cobrar'] = calcular_total_cobrar(
-            st.session_state.ventas_raw_data.loc[index, 'libras_netas'], precio
-        )
-        st.session_state.ventas_raw_data.loc[index, 'saldo'] = calcular_saldo(
-            st.session_state.ventas_raw_data.loc[index, 'total_a_cobrar'], pago_cliente
-        )
+        venta_anterior = st.session_state.ventas_raw_data.loc[index].to_dict()
+        valores = {
+            col: pd.to_datetime(val).date() if col == 'fecha' else val for col, val in updated_data.items()
+        }
+        venta = {**venta_anterior, **valores}
+        valores['libras_netas'] = calcular_libras_netas(venta['libras'], venta['descuento'])
+        valores['total_a_cobrar'] = calcular_total_cobrar(valores['libras_netas'], venta['precio'])
+        valores['saldo'] = calcular_saldo(valores['total_a_cobrar'], venta['pago_cliente'])
+        actualizar_celdas("ventas_raw_data", {index: valores}, f"Editar venta de {venta['cliente']}")
+        version_anterior = ventas_gastos.version_tabla("ventas")
         if save_dataframe(st.session_state.ventas_raw_data, VENTAS_FILE):
+            st.session_state.cartera_clientes = ventas_gastos.aplicar_cambios_cartera(
+                version_anterior,
+                quitar=[venta_anterior], agregar=[{**venta, **valores}]
+            )
             st.session_state.ventas_edited = True
-            st.session_state.ventas_data = get_ventas_df_processed()
             return True
         return False
     except Exception as e:
@@ -772,10 +1388,13 @@ def actualizar_venta(index, updated_data):
 def eliminar_ventas_seleccionadas(indices):
     """Elimina ventas seleccionadas."""
     try:
-        st.session_state.ventas_raw_data = st.session_state.ventas_raw_data.drop(indices).reset_index(drop=True)
+        ventas_quitadas = eliminar_filas("ventas_raw_data", indices, f"Eliminar {len(indices)} venta(s)")
+        version_anterior = ventas_gastos.version_tabla("ventas")
         if save_dataframe(st.session_state.ventas_raw_data, VENTAS_FILE):
+            st.session_state.cartera_clientes = ventas_gastos.aplicar_cambios_cartera(
+                version_anterior, quitar=ventas_quitadas
+            )
             st.session_state.venta_deleted = True
-            st.session_state.ventas_data = get_ventas_df_processed()
             return True
         return False
     except Exception as e:
@@ -785,14 +1404,14 @@ def eliminar_ventas_seleccionadas(indices):
 def actualizar_gasto(index, updated_data):
     """Actualiza un gasto existente."""
     try:
-        for col, val in updated_data.items():
-            if col == 'fecha':
-                st.session_state.gastos_raw_data.loc[index, col] = pd.to_datetime(val).date()
-            else:
-                st.session_state.gastos_raw_data.loc[index, col] = val
+        valores = {
+            col: pd.to_datetime(val).date() if col == 'fecha' else val for col, val in updated_data.items()
+        }
+        actualizar_celdas(
+            "gastos_raw_data", {index: valores}, f"Editar gasto '{st.session_state.gastos_raw_data.loc[index, 'descripcion']}'"
+        )
         if save_dataframe(st.session_state.gastos_raw_data, GASTOS_FILE):
             st.session_state.gastos_edited = True
-            st.session_state.gastos_data = get_gastos_df_processed()
             return True
         return False
     except Exception as e:
@@ -802,90 +1421,472 @@ def actualizar_gasto(index, updated_data):
 def eliminar_gastos_seleccionados(indices):
     """Elimina gastos seleccionados."""
     try:
-        st.session_state.gastos_raw_data = st.session_state.gastos_raw_data.drop(indices).reset_index(drop=True)
+        eliminar_filas("gastos_raw_data", indices, f"Eliminar {len(indices)} gasto(s)")
         if save_dataframe(st.session_state.gastos_raw_data, GASTOS_FILE):
             st.session_state.gasto_deleted = True
-            st.session_state.gastos_data = get_gastos_df_processed()
             return True
         return False
     except Exception as e:
         st.error(f"Error al eliminar gastos: {e}")
         return False
 
-def formatear_moneda(valor):
-    """Formatea un valor numérico como moneda."""
-    try:
-        return f"${float(valor):,.2f}"
-    except (ValueError, TypeError):
-        return "$0.00"
+# --- Capa de consulta: índices de fecha y de entidad ---
+def construir_indice_consulta(df, columna_fecha, columnas_entidad):
+    """Construye las fechas ordenadas y las posiciones por entidad de una tabla."""
+    fechas = pd.to_datetime(df[columna_fecha], errors="coerce").to_numpy(dtype="datetime64[ns]")
+    orden = np.argsort(fechas, kind="mergesort")
+    return {
+        "fechas": fechas[orden],
+        "orden": orden,
+        "entidades": {
+            col: df.groupby(col, sort=False).indices for col in columnas_entidad if col in df.columns
+        },
+    }
 
-def calcular_libras_netas(libras, descuento):
-    """Calcula las libras netas."""
-    try:
-        return round(float(libras) - float(descuento), 2)
-    except:
-        return 0.0
+def obtener_indice_consulta(session_key):
+    """Devuelve el índice de consulta de una tabla, reconstruyéndolo solo si la tabla cambió."""
+    df = st.session_state[session_key]
+    indices = st.session_state.setdefault("indices_consulta", {})
+    guardado = indices.get(session_key)
+    # Un DataFrame nuevo o modificado en sitio (nueva versión) invalida el índice
+    version = st.session_state.get("versiones_tablas", {}).get(session_key, 0)
+    if guardado is None or guardado[0] is not df or guardado[1] != version:
+        columna_fecha, filtros_entidad = FILTROS_POR_TABLA[session_key]
+        indices[session_key] = (df, version, construir_indice_consulta(df, columna_fecha, filtros_entidad))
+    return indices[session_key][2]
+
+def filtros_activos():
+    """Lee los filtros de consulta seleccionados en la barra lateral."""
+    rango = st.session_state.get("filtro_fechas") or ()
+    return {
+        "fechas": (rango[0], rango[-1]) if rango else None,
+        "proveedores": st.session_state.get("filtro_proveedores", []),
+        "clientes": st.session_state.get("filtro_clientes", []),
+        "agencias": st.session_state.get("filtro_agencias", []),
+        "categorias": st.session_state.get("filtro_categorias", []),
+    }
 
-def calcular_total_cobrar(libras_netas, precio):
-    """Calcula el total a cobrar."""
-    try:
-        return round(float(libras_netas) * float(precio), 2)
-    except:
-        return 0.0
+def consultar_tabla(session_key, filtros=None):
+    """Devuelve las filas de una tabla que cumplen los filtros, en el orden de la tabla."""
+    df = st.session_state[session_key]
+    filtros = filtros_activos() if filtros is None else filtros
+    _, filtros_entidad = FILTROS_POR_TABLA[session_key]
+    if df.empty or not (filtros["fechas"] or any(filtros.get(f) for f in filtros_entidad.values())):
+        return df
+    indice = obtener_indice_consulta(session_key)
+    posiciones = None
+    if filtros["fechas"]:
+        # Búsqueda binaria sobre las fechas ordenadas; las fechas vacías (NaT) quedan al final
+        inicio, fin = filtros["fechas"]
+        desde = np.searchsorted(indice["fechas"], np.datetime64(inicio, "ns"), side="left")
+        hasta = np.searchsorted(indice["fechas"], np.datetime64(fin + timedelta(days=1), "ns"), side="left")
+        posiciones = indice["orden"][desde:hasta]
+    for columna, filtro in filtros_entidad.items():
+        valores = filtros.get(filtro)
+        if not valores:
+            continue
+        por_valor = indice["entidades"].get(columna, {})
+        seleccion = np.concatenate([por_valor.get(v, np.empty(0, dtype=np.intp)) for v in valores])
+        posiciones = seleccion if posiciones is None else np.intersect1d(posiciones, seleccion, assume_unique=True)
+    return df.iloc[np.sort(posiciones)]
+
+def filtrar_resumen(resumen, filtros, columna_grupo, filtro):
+    """Aplica los filtros de consulta a un resumen mensual de particiones."""
+    if resumen.empty:
+        return resumen
+    mascara = pd.Series(True, index=resumen.index)
+    if filtros["fechas"]:
+        mascara &= resumen["mes"].isin(particiones.meses_en_rango(*filtros["fechas"]))
+    if filtros.get(filtro):
+        mascara &= resumen[columna_grupo].isin(filtros[filtro])
+    return resumen[mascara]
+
+# --- Selectores de registros con búsqueda ---
+# Cada tabla con selector guarda, por versión, la etiqueta visible de cada fila, sus fechas
+# ordenadas, sus montos y las palabras de las etiquetas ordenadas con la posición de su fila:
+# buscar es una búsqueda binaria por prefijo de palabra y por fecha, y solo se muestran las primeras filas.
+def _montos(valores):
+    return pd.to_numeric(valores, errors="coerce").fillna(0).map("{:.2f}".format)
+
+def etiquetas_depositos(df):
+    """Etiqueta visible de cada depósito (vectorizada)."""
+    return df.index.astype(str) + " - " + df["Fecha"].astype(str) + " - " + df["Empresa"].astype(str) + " - $" + _montos(df["Monto"])
+
+def etiquetas_notas_debito(df):
+    """Etiqueta visible de cada nota de débito (vectorizada)."""
+    return df.index.astype(str) + " - " + df["Fecha"].astype(str) + " - Descuento real: $" + _montos(df["Descuento real"])
+
+def etiquetas_ventas(df):
+    """Etiqueta visible de cada venta (vectorizada)."""
+    return df["cliente"].astype(str) + " - " + df["fecha"].astype(str) + " - $" + _montos(df["total_a_cobrar"])
+
+def etiquetas_gastos(df):
+    """Etiqueta visible de cada gasto (vectorizada)."""
+    return df["descripcion"].astype(str) + " - " + df["fecha"].astype(str) + " - $" + _montos(df["dinero"])
+
+# Tabla en session_state -> (etiquetas, columna de monto para filtrar)
+SELECTORES = {
+    "df": (etiquetas_depositos, "Monto"),
+    "notas": (etiquetas_notas_debito, "Descuento real"),
+    "ventas_raw_data": (etiquetas_ventas, "total_a_cobrar"),
+    "gastos_raw_data": (etiquetas_gastos, "dinero"),
+}
+
+def _palabras(textos):
+    """Palabras en minúsculas de cada texto (separadores: espacios, '$', ':' y guiones sueltos)."""
+    return pd.Series(textos, dtype=object).str.lower().str.findall(r"[^\s$:]+")
+
+def construir_indice_etiquetas(df, formato, columna_fecha, columna_monto):
+    """Etiquetas, fechas ordenadas, montos y palabras ordenadas (con la posición de su fila) de una tabla."""
+    etiquetas = np.asarray(formato(df), dtype=object)
+    fechas = pd.to_datetime(df[columna_fecha], errors="coerce").to_numpy(dtype="datetime64[ns]")
+    palabras = _palabras(etiquetas).explode()
+    palabras = palabras[palabras.notna() & (palabras != "-")]
+    texto_palabras = palabras.to_numpy(dtype=str)
+    orden_palabras = np.argsort(texto_palabras, kind="mergesort")
+    return {
+        "etiquetas": etiquetas,
+        "orden": np.argsort(fechas, kind="mergesort"),
+        "fechas": np.sort(fechas, kind="mergesort"),
+        "montos": pd.to_numeric(df[columna_monto], errors="coerce").to_numpy(dtype=float),
+        "palabras": texto_palabras[orden_palabras],
+        "posiciones": palabras.index.to_numpy()[orden_palabras],
+    }
 
-def calcular_saldo(total_cobrar, pago_cliente):
-    """Calcula el saldo pendiente."""
-    try:
-        return round(float(total_cobrar) - float(pago_cliente), 2)
-    except:
-        return 0.0
-
-def analizar_alertas_clientes(ventas_df):
-    """Analiza el DataFrame de ventas para identificar clientes con alertas."""
-    if ventas_df.empty:
-        return pd.DataFrame()
-    df_temp = ventas_df.copy()
-    if 'Fecha' in df_temp.columns:
-        df_temp['Fecha'] = pd.to_datetime(df_temp['Fecha'])
-    else:
-        df_temp['Fecha'] = pd.to_datetime(df_temp['Fecha DB'])
-    alertas = []
-    for cliente in df_temp['Cliente'].unique():
-        cliente_ventas = df_temp[df_temp['Cliente'] == cliente].copy()
-        cliente_ventas = cliente_ventas.sort_values('Fecha')
-        cliente_ventas['Saldo_num'] = cliente_ventas['Saldo'].apply(
-            lambda x: float(str(x).replace('$', '').replace(',', '')) if isinstance(x, (str, float, int)) else x
+def obtener_indice_etiquetas(session_key):
+    """Devuelve el índice de etiquetas de una tabla, reconstruyéndolo solo si la tabla cambió."""
+    df = st.session_state[session_key]
+    indices = st.session_state.setdefault("indices_etiquetas", {})
+    guardado = indices.get(session_key)
+    version = st.session_state.get("versiones_tablas", {}).get(session_key, 0)
+    if guardado is None or guardado[0] is not df or guardado[1] != version:
+        formato, columna_monto = SELECTORES[session_key]
+        indices[session_key] = (
+            df, version, construir_indice_etiquetas(df, formato, FILTROS_POR_TABLA[session_key][0], columna_monto)
         )
-        saldo_total = cliente_ventas['Saldo_num'].sum()
-        debe_mas_10 = saldo_total > 10
-        dias_consecutivos = 0
-        fechas_con_saldo = cliente_ventas[cliente_ventas['Saldo_num'] > 0]['Fecha'].dt.date.unique()
-        if len(fechas_con_saldo) >= 2:
-            fechas_ordenadas = sorted(list(fechas_con_saldo))
-            consecutivos_actual = 1
-            max_consecutivos = 1
-            for i in range(1, len(fechas_ordenadas)):
-                if (fechas_ordenadas[i] - fechas_ordenadas[i-1]).days == 1:
-                    consecutivos_actual += 1
-                    max_consecutivos = max(max_consecutivos, consecutivos_actual)
-                else:
-                    consecutivos_actual = 1
-            dias_consecutivos = max_consecutivos
-        if debe_mas_10 or dias_consecutivos >= 2:
-            ultima_fecha = cliente_ventas['Fecha'].max().strftime('%Y-%m-%d')
-            motivos = []
-            if debe_mas_10:
-                motivos.append(f"Debe más de ${saldo_total:.2f}")
-            if dias_consecutivos >= 2:
-                motivos.append(f"Saldo por {dias_consecutivos} día(s) consecutivo(s)")
-            alertas.append({
-                'Cliente': cliente,
-                'Saldo_Total': saldo_total,
-                'Ultima_Venta': ultima_fecha,
-                'Motivo_Alerta': " | ".join(motivos),
-                'Prioridad': 'Alta' if debe_mas_10 and dias_consecutivos >= 2 else 'Media'
-            })
-    return pd.DataFrame(alertas)
+    return indices[session_key][2]
+
+def buscar_registros(indice, texto="", fechas=None, montos=None):
+    """Posiciones de las filas cuya etiqueta tiene una palabra que empieza con cada término del texto,
+    con la fecha en el rango (inicio, fin) y el monto en (mínimo, máximo) (None: sin límite),
+    de la más reciente a la más antigua.
+    """
+    orden = indice["orden"]
+    if fechas:
+        inicio, fin = fechas
+        desde = np.searchsorted(indice["fechas"], np.datetime64(inicio, "ns"), side="left")
+        hasta = np.searchsorted(indice["fechas"], np.datetime64(fin + timedelta(days=1), "ns"), side="left")
+        orden = orden[desde:hasta]
+    orden = orden[::-1]
+    minimo, maximo = montos or (None, None)
+    if minimo is not None:
+        orden = orden[indice["montos"][orden] >= minimo]
+    if maximo is not None:
+        orden = orden[indice["montos"][orden] <= maximo]
+    for termino in _palabras([texto]).iloc[0]:
+        if termino == "-":
+            continue
+        desde = np.searchsorted(indice["palabras"], termino, side="left")
+        hasta = np.searchsorted(indice["palabras"], termino + "\uffff", side="left")
+        orden = orden[np.isin(orden, indice["posiciones"][desde:hasta])]
+    return orden
+
+def _filtros_busqueda(key, contenedor, placeholder, con_montos=False):
+    """Campos de búsqueda de un selector: texto, rango de fechas y, si se pide, rango de montos."""
+    texto = contenedor.text_input(
+        "🔎 Buscar", key=f"{key}_buscar", placeholder=placeholder,
+        help="Cada palabra debe coincidir con el comienzo de una palabra del registro (por ejemplo: 'liris 2024-05')."
+    )
+    rango = contenedor.date_input("Fechas (opcional)", value=(), key=f"{key}_fechas")
+    fechas = (rango[0], rango[-1]) if isinstance(rango, (list, tuple)) and rango else None
+    montos = None
+    if con_montos:
+        col1, col2 = contenedor.columns(2)
+        montos = (
+            col1.number_input("Monto desde ($)", value=None, min_value=0.0, format="%.2f", key=f"{key}_monto_min"),
+            col2.number_input("Monto hasta ($)", value=None, min_value=0.0, format="%.2f", key=f"{key}_monto_max"),
+        )
+    return texto, fechas, montos
+
+def selector_registros(session_key, titulo, key, contenedor=st):
+    """Selector con búsqueda de una fila de la tabla (en la barra lateral con contenedor=st.sidebar).
+
+    Solo ofrece las MAX_OPCIONES_SELECTOR filas más recientes que coinciden con el
+    texto y el rango de fechas. Devuelve la etiqueta de índice elegida, o None.
+    """
+    indice = obtener_indice_etiquetas(session_key)
+    texto, fechas, _ = _filtros_busqueda(key, contenedor, "Fecha, nombre o monto")
+    coincidencias = buscar_registros(indice, texto, fechas)
+    if not len(coincidencias):
+        contenedor.info("Ningún registro coincide con la búsqueda.")
+        return None
+    posiciones = coincidencias[:MAX_OPCIONES_SELECTOR]
+    if len(coincidencias) > len(posiciones):
+        contenedor.caption(f"Se muestran los {len(posiciones)} más recientes de {len(coincidencias)}; escribe más para acotar.")
+    etiquetas = st.session_state[session_key].index[posiciones]
+    textos = dict(zip(etiquetas, indice["etiquetas"][posiciones]))
+    return contenedor.selectbox(titulo, list(etiquetas), key=key, format_func=textos.get)
+
+def selector_eliminacion(session_key, titulo, key, placeholder):
+    """Búsqueda por texto, fechas y monto con selección múltiple de las filas a eliminar.
+
+    Solo se listan las MAX_OPCIONES_ELIMINAR coincidencias más recientes; la casilla
+    de todas las coincidencias las elige sin listarlas. Devuelve las etiquetas elegidas.
+    """
+    indice = obtener_indice_etiquetas(session_key)
+    texto, fechas, montos = _filtros_busqueda(key, st, placeholder, con_montos=True)
+    coincidencias = buscar_registros(indice, texto, fechas, montos)
+    if not len(coincidencias):
+        st.info("Ningún registro coincide con la búsqueda.")
+        return []
+    etiquetas = st.session_state[session_key].index
+    if st.checkbox(f"Seleccionar las {len(coincidencias)} coincidencias", key=f"{key}_todas"):
+        return list(etiquetas[np.sort(coincidencias)])
+    posiciones = coincidencias[:MAX_OPCIONES_ELIMINAR]
+    if len(coincidencias) > len(posiciones):
+        st.caption(f"Se muestran las {len(posiciones)} más recientes de {len(coincidencias)}; acota la búsqueda para ver otras.")
+    textos = dict(zip(etiquetas[posiciones], indice["etiquetas"][posiciones]))
+    return st.multiselect(titulo, list(textos), key=key, format_func=textos.get)
+
+# --- Vistas ordenadas de ventas y gastos ---
+# Por tabla solo se guarda el orden de sus etiquetas con las claves de ese orden (fecha
+# descendente, columna de desempate, etiqueta). Los cambios en sitio se ubican por búsqueda
+# binaria; las filas renombradas se arman al mostrarlas, solo para las filas consultadas.
+def _claves_orden(filas, columna_desempate):
+    """Claves de orden (-fecha, desempate, etiqueta) de las filas; las fechas vacías van al final."""
+    dias = pd.to_datetime(filas["fecha"], errors="coerce").to_numpy(dtype="datetime64[D]")
+    fechas = -dias.astype(np.int64)
+    fechas[np.isnat(dias)] = np.iinfo(np.int64).max
+    desempate = None
+    if columna_desempate:
+        desempate = filas[columna_desempate].fillna("\uffff").astype(str).to_numpy(dtype=object)
+    return fechas, desempate, filas.index.to_numpy()
+
+def _ordenar_claves(fechas, desempate, etiquetas):
+    """Posiciones que ordenan las claves (np.lexsort toma la clave principal al final)."""
+    claves = [etiquetas] + ([pd.factorize(desempate, sort=True)[0]] if desempate is not None else []) + [fechas]
+    return np.lexsort(claves)
+
+def construir_orden_vista(session_key):
+    """Ordena una vez todas las etiquetas de la tabla según su vista."""
+    df = st.session_state[session_key]
+    _, columna_desempate = VISTAS_ORDENADAS[session_key]
+    fechas, desempate, etiquetas = _claves_orden(df, columna_desempate)
+    orden = _ordenar_claves(fechas, desempate, etiquetas)
+    return {
+        "df": df, "fechas": fechas[orden], "etiquetas": etiquetas[orden],
+        "desempate": desempate[orden] if desempate is not None else None,
+    }
+
+def obtener_orden_vista(session_key):
+    """Devuelve el orden de la vista; se reconstruye solo si la tabla se reemplazó por otra."""
+    vistas = st.session_state.setdefault("orden_vistas", {})
+    vista = vistas.get(session_key)
+    if vista is None or vista["df"] is not st.session_state[session_key]:
+        vista = vistas[session_key] = construir_orden_vista(session_key)
+    return vista
+
+def _posicion_en_orden(vista, fecha, desempate, etiqueta):
+    """Posición donde va una fila en el orden de la vista (búsqueda binaria por clave)."""
+    desde = np.searchsorted(vista["fechas"], fecha, side="left")
+    hasta = np.searchsorted(vista["fechas"], fecha, side="right")
+    if vista["desempate"] is not None:
+        tramo = vista["desempate"][desde:hasta]
+        desde, hasta = desde + np.searchsorted(tramo, desempate, side="left"), desde + np.searchsorted(tramo, desempate, side="right")
+    return desde + np.searchsorted(vista["etiquetas"][desde:hasta], etiqueta)
+
+def actualizar_orden_vista(session_key, quitar=(), agregar=(), reemplazada=None):
+    """Quita etiquetas del orden de la vista y ubica otras en su posición, sin reordenar el resto.
+
+    reemplazada: la tabla anterior, si el cambio la reemplazó por una nueva (como al
+    insertar filas); la vista construida sobre ella pasa a la nueva.
+    """
+    vista = st.session_state.get("orden_vistas", {}).get(session_key)
+    df = st.session_state[session_key]
+    if vista is not None and reemplazada is not None and vista["df"] is reemplazada:
+        vista["df"] = df
+    if vista is None or vista["df"] is not df:
+        return  # Se construye completa la próxima vez que se consulte
+    campos = [campo for campo in ("fechas", "desempate", "etiquetas") if vista[campo] is not None]
+    if len(quitar):
+        mantener = ~np.isin(vista["etiquetas"], np.asarray(list(quitar)))
+        for campo in campos:
+            vista[campo] = vista[campo][mantener]
+    if len(agregar):
+        _, columna_desempate = VISTAS_ORDENADAS[session_key]
+        nuevas = dict(zip(("fechas", "desempate", "etiquetas"), _claves_orden(df.loc[list(agregar)], columna_desempate)))
+        orden = _ordenar_claves(nuevas["fechas"], nuevas["desempate"], nuevas["etiquetas"])
+        nuevas = {campo: valores[orden] for campo, valores in nuevas.items() if valores is not None}
+        posiciones = [
+            _posicion_en_orden(vista, nuevas["fechas"][i], nuevas["desempate"][i] if "desempate" in nuevas else None,
+                               nuevas["etiquetas"][i])
+            for i in range(len(orden))
+        ]
+        for campo in campos:
+            vista[campo] = np.insert(vista[campo], posiciones, nuevas[campo])
+
+def obtener_vista_ordenada(session_key, filtros=None):
+    """Filas de la tabla en el orden de su vista, filtradas y con las columnas de visualización."""
+    df = st.session_state[session_key]
+    renombrar, _ = VISTAS_ORDENADAS[session_key]
+    etiquetas = obtener_orden_vista(session_key)["etiquetas"]
+    seleccion = consultar_tabla(session_key, filtros)
+    if len(seleccion) < len(df):
+        etiquetas = etiquetas[np.isin(etiquetas, seleccion.index.to_numpy())]
+    vista = df.loc[etiquetas].rename(columns=renombrar)
+    vista["Fecha"] = pd.to_datetime(vista["Fecha DB"], errors="coerce").dt.date
+    return vista
+
+# --- Cubo de reportes: agregados por día ---
+# Los reportes salen del cubo diario de cada tabla (particiones.leer_cubo), que cada escritura
+# actualiza solo en sus meses. Los cortes por año, mes, semana o día y el detalle de un
+# periodo son agrupaciones sobre esos agregados: no se leen filas.
+NIVELES_CUBO = {"Año": "Y", "Mes": "M", "Semana": "W", "Día": "D"}
+# Nivel al que se detalla un periodo de cada nivel
+DETALLE_NIVEL = {"Año": "Mes", "Mes": "Día", "Semana": "Día"}
+# Dimensiones del cubo que responden a los filtros de la barra lateral
+FILTROS_CUBO = {
+    "ventas": {"cliente": "clientes"},
+    "gastos": {"gasto": "categorias"},
+    "proveedores": {"Proveedor": "proveedores"},
+    "notas_debito": {},
+}
+
+@st.cache_data(show_spinner=False)
+def _leer_cubo(sucursal, tabla, mtime_ns):
+    """Lee el cubo diario; sucursal y mtime_ns son parte de la clave de caché (mtime_ns la invalida al escribir)."""
+    return particiones.leer_cubo(tabla)
+
+def consultar_cubo(tabla, filtros, nivel, por=(), periodo=None):
+    """Suma el cubo diario por periodo del nivel y por las dimensiones pedidas.
+
+    Con periodo (un pd.Period) solo se suman sus días, para detallarlo a otro nivel.
+    """
+    cubo = _leer_cubo(SUCURSAL, tabla, particiones.mtime_cubo(tabla))
+    sumas = ["filas"] + particiones.TABLAS[tabla]["sumas"]
+    if cubo.empty:
+        return pd.DataFrame(columns=["Periodo", *por, *sumas])
+    mascara = pd.Series(True, index=cubo.index)
+    if tabla == "proveedores":
+        mascara &= cubo["Proveedor"] != "BALANCE_INICIAL"
+    if filtros.get("fechas"):
+        inicio, fin = filtros["fechas"]
+        mascara &= cubo["dia"].between(pd.Timestamp(inicio), pd.Timestamp(fin))
+    if periodo is not None:
+        mascara &= cubo["dia"].between(periodo.start_time, periodo.end_time)
+    for columna, filtro in FILTROS_CUBO[tabla].items():
+        if filtros.get(filtro):
+            mascara &= cubo[columna].isin(filtros[filtro])
+    cubo = cubo[mascara]
+    periodos = cubo["dia"].dt.to_period(NIVELES_CUBO[nivel]).rename("Periodo")
+    return cubo.groupby([periodos, *por])[sumas].sum().reset_index()
+
+def estado_resultados(filtros, nivel, periodo=None):
+    """Ventas menos costo de compras (neto de notas de débito) menos gastos, por periodo."""
+    solo_fechas = {"fechas": filtros.get("fechas")}
+    def total(tabla, columna):
+        return consultar_cubo(tabla, solo_fechas, nivel, periodo=periodo).set_index("Periodo")[columna]
+    resultados = pd.DataFrame({
+        "Ventas": total("ventas", "total_a_cobrar"),
+        "Compras": total("proveedores", "Total ($)"),
+        "Notas de débito": total("notas_debito", "Descuento real"),
+        "Gastos": total("gastos", "dinero"),
+    }).fillna(0.0).sort_index()
+    resultados["Costo neto"] = resultados["Compras"] - resultados["Notas de débito"]
+    resultados["Utilidad"] = resultados["Ventas"] - resultados["Costo neto"] - resultados["Gastos"]
+    return resultados.rename_axis("Periodo").reset_index()
+
+# --- Conciliación de inventario: comprado vs vendido ---
+# Por tipo de ave y día se cruzan las compras (cubo de proveedores) con las ventas (cubo de
+# ventas). Las aves salen en orden de llegada; las que siguen sin venderse más de
+# DIAS_MAX_INVENTARIO días después de comprarse se cuentan como perdidas. Las libras en
+# arrastre son las aves en arrastre por el peso promedio de la última compra del tipo, y las
+# libras perdidas son lo que falta para cuadrar el día (merma de peso más aves perdidas).
+DIAS_MAX_INVENTARIO = 1
+FLUJOS_INVENTARIO = ["Aves compradas", "Aves vendidas", "Aves perdidas",
+                     "Libras compradas", "Libras vendidas", "Libras perdidas"]
+COLUMNAS_CONCILIACION = ["Tipo", "Periodo", "Aves arrastre inicial", "Aves compradas", "Aves vendidas",
+                         "Aves perdidas", "Aves arrastre final", "Libras arrastre inicial", "Libras compradas",
+                         "Libras vendidas", "Libras perdidas", "Libras arrastre final"]
+
+def conciliar_inventario(dias_max=DIAS_MAX_INVENTARIO):
+    """Conciliación diaria por tipo de ave de todo el historial (el arrastre depende de los días previos)."""
+    compras = consultar_cubo("proveedores", {}, "Día", ["Producto"]).rename(columns={
+        "Producto": "Tipo", "Cantidad": "Aves compradas", "Libras Restantes": "Libras compradas"})
+    # Los registros de proveedor sin un tipo de ave válido son del producto por defecto
+    compras["Tipo"] = compras["Tipo"].where(compras["Tipo"].isin(TIPOS_AVE), PRODUCT_NAME)
+    ventas = consultar_cubo("ventas", {}, "Día", ["tipo"]).rename(columns={
+        "tipo": "Tipo", "cantidad": "Aves vendidas", "libras_netas": "Libras vendidas"})
+    flujos = pd.concat([
+        compras.groupby(["Tipo", "Periodo"])[["Aves compradas", "Libras compradas"]].sum(),
+        ventas.groupby(["Tipo", "Periodo"])[["Aves vendidas", "Libras vendidas"]].sum(),
+    ], axis=1).fillna(0.0)
+    if flujos.empty:
+        return pd.DataFrame(columns=COLUMNAS_CONCILIACION)
+    # Calendario completo por tipo, para que desplazar filas sea desplazar días
+    dias = flujos.index.get_level_values("Periodo")
+    calendario = pd.MultiIndex.from_product(
+        [flujos.index.unique("Tipo"), pd.period_range(dias.min(), dias.max(), freq="D")], names=["Tipo", "Periodo"]
+    )
+    df = flujos.reindex(calendario, fill_value=0.0)
+    por_tipo = df.groupby(level="Tipo")
+    compradas = por_tipo["Aves compradas"].cumsum()
+    vendidas = por_tipo["Aves vendidas"].cumsum()
+    # Perdidas acumuladas: lo comprado hasta hace dias_max días que al cierre aún no se vendió
+    vencidas = compradas.groupby(level="Tipo").shift(dias_max, fill_value=0.0)
+    perdidas = (vencidas - vendidas).clip(lower=0).groupby(level="Tipo").cummax()
+    df["Aves perdidas"] = perdidas.groupby(level="Tipo").diff().fillna(perdidas)
+    df["Aves arrastre final"] = compradas - vendidas - perdidas
+    df["Aves arrastre inicial"] = df.groupby(level="Tipo")["Aves arrastre final"].shift(1, fill_value=0.0)
+    promedio = (df["Libras compradas"] / df["Aves compradas"]).where(df["Aves compradas"] > 0)
+    promedio = promedio.groupby(level="Tipo").ffill().fillna(0.0)
+    df["Libras arrastre final"] = df["Aves arrastre final"] * promedio
+    df["Libras arrastre inicial"] = df.groupby(level="Tipo")["Libras arrastre final"].shift(1, fill_value=0.0)
+    df["Libras perdidas"] = (df["Libras arrastre inicial"] + df["Libras compradas"]
+                             - df["Libras vendidas"] - df["Libras arrastre final"])
+    return df.reset_index()[COLUMNAS_CONCILIACION]
+
+def conciliacion_por_periodo(diaria, nivel, fechas=None):
+    """Agrupa la conciliación diaria por día o semana y la limita al rango de fechas."""
+    if fechas:
+        inicio, fin = pd.Period(fechas[0], "D"), pd.Period(fechas[1], "D")
+        diaria = diaria[(diaria["Periodo"] >= inicio) & (diaria["Periodo"] <= fin)]
+    if diaria.empty or nivel == "Día":
+        return diaria
+    periodos = diaria["Periodo"].dt.asfreq(NIVELES_CUBO[nivel])
+    agregaciones = {col: (col, "sum") for col in FLUJOS_INVENTARIO}
+    for col in ("Aves arrastre inicial", "Libras arrastre inicial"):
+        agregaciones[col] = (col, "first")
+    for col in ("Aves arrastre final", "Libras arrastre final"):
+        agregaciones[col] = (col, "last")
+    resumen = diaria.groupby([diaria["Tipo"], periodos]).agg(**agregaciones).reset_index()
+    return resumen[COLUMNAS_CONCILIACION]
+
+# --- Pronóstico de demanda ---
+@st.cache_data(show_spinner=False)
+def _pronosticar_ventas(sucursal, mtime_ns, desde, dias, tipos):
+    """Pronóstico de ventas por cliente; mtime_ns del cubo de ventas renueva la caché al llegar ventas."""
+    return pronostico.pronosticar(_leer_cubo(sucursal, "ventas", mtime_ns), desde, dias, list(tipos) if tipos else None)
+
+def obtener_pronostico(desde, dias=7, tipos=None):
+    """Pronóstico por cliente y fecha de libras y cantidad vendidas (ver pronostico.py)."""
+    return _pronosticar_ventas(SUCURSAL, particiones.mtime_cubo("ventas"), pd.Timestamp(desde), dias,
+                               tuple(tipos) if tipos else None)
+
+def sugerencia_compra(fecha):
+    """(aves, libras) del producto a comprar para una fecha: pronóstico del día menos el arrastre del día anterior."""
+    totales = pronostico.totales_por_fecha(obtener_pronostico(fecha, 1, [PRODUCT_NAME]))
+    if totales.empty:
+        return None
+    aves, libras = totales["Cantidad"].iloc[0], totales["Libras"].iloc[0]
+    inventario = conciliar_inventario()
+    anterior = inventario[(inventario["Tipo"] == PRODUCT_NAME)
+                          & (inventario["Periodo"] == pd.Period(fecha, "D") - 1)]
+    if not anterior.empty:
+        # Un arrastre negativo (ventas sin compra registrada) no se suma a la compra
+        aves -= max(anterior["Aves arrastre final"].iloc[0], 0.0)
+        libras -= max(anterior["Libras arrastre final"].iloc[0], 0.0)
+    return max(aves, 0.0), max(libras, 0.0)
 
 # --- 5. FUNCIONES DE INTERFAZ DE USUARIO (UI) ---
 def render_deposit_registration_form():
@@ -907,22 +1908,16 @@ def render_delete_deposit_section():
     """Renderiza la sección para eliminar depósitos."""
     st.sidebar.subheader("🗑️ Eliminar Depósito")
     if not st.session_state.df.empty:
-        df_display_deposits = st.session_state.df.copy()
-        df_display_deposits["Display"] = df_display_deposits.apply(
-            lambda row: f"{row.name} - {row['Fecha']} - {row['Empresa']} - ${row['Monto']:.2f}", axis=1
+        index_to_delete = selector_registros(
+            "df", "Selecciona un depósito a eliminar", "delete_deposit_select", st.sidebar
         )
-        if not df_display_deposits["Display"].empty:
-            deposito_seleccionado_info = st.sidebar.selectbox(
-                "Selecciona un depósito a eliminar", df_display_deposits["Display"], key="delete_deposit_select"
-            )
-            index_to_delete = int(deposito_seleccionado_info.split(' - ')[0]) if deposito_seleccionado_info else None
-            if st.sidebar.button("🗑️ Eliminar depósito seleccionado", key="delete_deposit_button"):
-                if index_to_delete is not None and st.sidebar.checkbox("✅ Confirmar eliminación del depósito"):
-                    delete_deposit_record(index_to_delete)
-                else:
-                    st.sidebar.warning("Por favor, marca la casilla para confirmar la eliminación.")
-        else:
-            st.sidebar.info("No hay depósitos para eliminar.")
+        # La confirmación va antes del botón: dentro de él se perdería en la siguiente ejecución
+        confirmar = st.sidebar.checkbox("✅ Confirmar eliminación del depósito", key="confirmar_eliminar_deposito")
+        if index_to_delete is not None and st.sidebar.button("🗑️ Eliminar depósito seleccionado", key="delete_deposit_button"):
+            if not confirmar:
+                st.sidebar.warning("Por favor, marca la casilla para confirmar la eliminación.")
+            else:
+                delete_deposit_record(index_to_delete)
     else:
         st.sidebar.info("No hay depósitos para eliminar.")
 
@@ -930,38 +1925,28 @@ def render_edit_deposit_section():
     """Renderiza la sección para editar depósitos."""
     st.sidebar.subheader("✏️ Editar Depósito")
     if not st.session_state.df.empty:
-        df_display_deposits = st.session_state.df.copy()
-        df_display_deposits["Display"] = df_display_deposits.apply(
-            lambda row: f"{row.name} - {row['Fecha']} - {row['Empresa']} - ${row['Monto']:.2f}", axis=1
-        )
-        if not df_display_deposits["Display"].empty:
-            deposito_seleccionado_info = st.sidebar.selectbox(
-                "Selecciona un depósito para editar", df_display_deposits["Display"], key="edit_deposit_select"
-            )
-            index_to_edit = int(deposito_seleccionado_info.split(' - ')[0]) if deposito_seleccionado_info else None
-            if index_to_edit is not None and index_to_edit in st.session_state.df.index:
-                deposit_to_edit = st.session_state.df.loc[index_to_edit].to_dict()
-                with st.sidebar.form(f"edit_deposit_form_{index_to_edit}", clear_on_submit=False):
-                    st.write(f"Editando depósito: **ID {index_to_edit}**")
-                    default_empresa_idx = PROVEEDORES.index(deposit_to_edit["Empresa"]) if deposit_to_edit["Empresa"] in PROVEEDORES else 0
-                    default_agencia_idx = AGENCIAS.index(deposit_to_edit["Agencia"]) if deposit_to_edit["Agencia"] in AGENCIAS else 0
-                    edited_fecha = st.date_input("Fecha", value=deposit_to_edit["Fecha"], key=f"edit_fecha_d_{index_to_edit}")
-                    edited_empresa = st.selectbox("Empresa (Proveedor)", PROVEEDORES, index=default_empresa_idx, key=f"edit_empresa_{index_to_edit}")
-                    edited_agencia = st.selectbox("Agencia", AGENCIAS, index=default_agencia_idx, key=f"edit_agencia_{index_to_edit}")
-                    edited_monto = st.number_input("Monto ($)", value=float(deposit_to_edit["Monto"]), min_value=0.0, format="%.2f", key=f"edit_monto_{index_to_edit}")
-                    submit_edit_deposit = st.form_submit_button("💾 Guardar Cambios del Depósito")
-                    if submit_edit_deposit and edited_monto > 0:
-                        updated_data = {
-                            "Fecha": edited_fecha, "Empresa": edited_empresa,
-                            "Agencia": edited_agencia, "Monto": edited_monto
-                        }
-                        edit_deposit_record(index_to_edit, updated_data)
-                    elif submit_edit_deposit:
-                        st.error("El monto del depósito debe ser mayor que cero.")
-            else:
-                st.sidebar.info("Selecciona un depósito para ver sus detalles de edición.")
-        else:
-            st.sidebar.info("No hay depósitos para editar.")
+        index_to_edit = selector_registros("df", "Selecciona un depósito para editar", "edit_deposit_select", st.sidebar)
+        if index_to_edit is not None and index_to_edit in st.session_state.df.index:
+            deposit_to_edit = st.session_state.df.loc[index_to_edit].to_dict()
+            with st.sidebar.form(f"edit_deposit_form_{index_to_edit}", clear_on_submit=False):
+                st.write(f"Editando depósito: **ID {index_to_edit}**")
+                default_empresa_idx = PROVEEDORES.index(deposit_to_edit["Empresa"]) if deposit_to_edit["Empresa"] in PROVEEDORES else 0
+                default_agencia_idx = AGENCIAS.index(deposit_to_edit["Agencia"]) if deposit_to_edit["Agencia"] in AGENCIAS else 0
+                edited_fecha = st.date_input("Fecha", value=deposit_to_edit["Fecha"], key=f"edit_fecha_d_{index_to_edit}")
+                edited_empresa = st.selectbox("Empresa (Proveedor)", PROVEEDORES, index=default_empresa_idx, key=f"edit_empresa_{index_to_edit}")
+                edited_agencia = st.selectbox("Agencia", AGENCIAS, index=default_agencia_idx, key=f"edit_agencia_{index_to_edit}")
+                edited_monto = st.number_input("Monto ($)", value=float(deposit_to_edit["Monto"]), min_value=0.0, format="%.2f", key=f"edit_monto_{index_to_edit}")
+                submit_edit_deposit = st.form_submit_button("💾 Guardar Cambios del Depósito")
+                if submit_edit_deposit and edited_monto > 0:
+                    updated_data = {
+                        "Fecha": edited_fecha, "Empresa": edited_empresa,
+                        "Agencia": edited_agencia, "Monto": edited_monto
+                    }
+                    edit_deposit_record(index_to_edit, updated_data)
+                elif submit_edit_deposit:
+                    st.error("El monto del depósito debe ser mayor que cero.")
+        elif index_to_edit is not None:
+            st.sidebar.info("Selecciona un depósito para ver sus detalles de edición.")
     else:
         st.sidebar.info("No hay depósitos para editar.")
 
@@ -969,11 +1954,12 @@ def render_import_excel_section():
     """Renderiza la sección para importar datos desde Excel."""
     st.subheader("📁 Importar datos desde Excel")
     st.info("Asegúrate de que tu archivo Excel tenga las siguientes hojas y columnas (nombres exactos):")
-    st.markdown("- **Hoja 'registro de proveedores':** `Fecha`, `Proveedor`, `Cantidad`, `Peso Salida (kg)`, `Peso Entrada (kg)`, `Tipo Documento`, `Cantidad de gavetas`, `Precio Unitario ($)`")
+    st.markdown("- **Hoja 'registro de proveedores':** `Fecha`, `Proveedor`, `Producto` (opcional: Pollo o Gallina; vacío = Pollo), `Cantidad`, `Peso Salida (kg)`, `Peso Entrada (kg)`, `Tipo Documento`, `Cantidad de gavetas`, `Precio Unitario ($)`")
     st.markdown("- **Hoja 'registro de depositos':** `Fecha`, `Empresa`, `Agencia`, `Monto`")
     st.markdown("- **Hoja 'registro de notas de debito':** `Fecha`, `Descuento`, `Descuento real`")
     st.markdown("- **Hoja 'ventas':** `fecha`, `cliente`, `tipo`, `cantidad`, `libras`, `descuento`, `libras_netas`, `precio`, `total_a_cobrar`, `pago_cliente`, `saldo`")
     st.markdown("- **Hoja 'gastos':** `fecha`, `calculo`, `descripcion`, `gasto`, `dinero`")
+    st.caption("Cada fila se valida (fechas, números, rangos y listas de proveedores, agencias, clientes, tipos de ave y categorías); las filas con errores se omiten y se listan en un reporte descargable.")
     archivo_excel = st.file_uploader("Sube tu archivo Excel (.xlsx)", type=["xlsx"], key="excel_uploader")
     if archivo_excel:
         import_excel_data(archivo_excel)
@@ -981,11 +1967,19 @@ def render_import_excel_section():
 def render_supplier_registration_form():
     """Renderiza el formulario de registro de proveedores."""
     st.subheader("➕ Registro de Proveedores")
+    sugerencia = sugerencia_compra(datetime.today().date())
+    if sugerencia and sugerencia[0] > 0:
+        aves, libras = sugerencia
+        st.caption(
+            f"📦 Compra sugerida para hoy: ~{aves:,.0f} aves, ~{libras:,.1f} lb (~{libras / LBS_PER_KG:,.1f} kg), "
+            "según el pronóstico de ventas menos el arrastre de ayer."
+        )
     with st.form("formulario_registro_proveedor", clear_on_submit=True):
         col1, col2, col3, col4 = st.columns(4)
         with col1:
             fecha = st.date_input("Fecha", value=datetime.today().date(), key="fecha_input_form")
             proveedor = st.selectbox("Proveedor", PROVEEDORES, key="proveedor_select_form")
+            producto = st.selectbox("Tipo de Ave", TIPOS_AVE, key="producto_select_form")
         with col2:
             cantidad = st.number_input("Cantidad", min_value=0, step=1, key="cantidad_input_form")
             peso_salida = st.number_input("Peso Salida (kg)", min_value=0.0, step=0.1, format="%.2f", key="peso_salida_input_form")
@@ -997,7 +1991,7 @@ def render_supplier_registration_form():
             precio_unitario = st.number_input("Precio Unitario ($)", min_value=0.0, step=0.01, format="%.2f", key="precio_unitario_input_form")
         enviar = st.form_submit_button("➕ Agregar Registro")
         if enviar:
-            add_supplier_record(fecha, proveedor, cantidad, peso_salida, peso_entrada, documento, gavetas, precio_unitario)
+            add_supplier_record(fecha, proveedor, cantidad, peso_salida, peso_entrada, documento, gavetas, precio_unitario, producto)
 
 def render_debit_note_form():
     """Renderiza el formulario para agregar notas de débito."""
@@ -1020,22 +2014,16 @@ def render_delete_debit_note_section():
     """Renderiza la sección para eliminar notas de débito."""
     st.subheader("🗑️ Eliminar Nota de Débito")
     if not st.session_state.notas.empty:
-        df_display_notes = st.session_state.notas.copy()
-        df_display_notes["Display"] = df_display_notes.apply(
-            lambda row: f"{row.name} - {row['Fecha']} - Descuento real: ${row['Descuento real']:.2f}", axis=1
+        index_to_delete = selector_registros(
+            "notas", "Selecciona una nota de débito para eliminar", "delete_debit_note_select"
         )
-        if not df_display_notes["Display"].empty:
-            nota_seleccionada_info = st.selectbox(
-                "Selecciona una nota de débito para eliminar", df_display_notes["Display"], key="delete_debit_note_select"
-            )
-            index_to_delete = int(nota_seleccionada_info.split(' - ')[0]) if nota_seleccionada_info else None
-            if st.button("🗑️ Eliminar Nota de Débito seleccionada", key="delete_debit_note_button"):
-                if index_to_delete is not None and st.checkbox("✅ Confirmar eliminación de la nota de débito"):
-                    delete_debit_note_record(index_to_delete)
-                else:
-                    st.warning("Por favor, marca la casilla para confirmar la eliminación.")
-        else:
-            st.info("No hay notas de débito para eliminar.")
+        # La confirmación va antes del botón: dentro de él se perdería en la siguiente ejecución
+        confirmar = st.checkbox("✅ Confirmar eliminación de la nota de débito", key="confirmar_eliminar_nota_debito")
+        if index_to_delete is not None and st.button("🗑️ Eliminar Nota de Débito seleccionada", key="delete_debit_note_button"):
+            if not confirmar:
+                st.warning("Por favor, marca la casilla para confirmar la eliminación.")
+            else:
+                delete_debit_note_record(index_to_delete)
     else:
         st.info("No hay notas de débito para eliminar.")
 
@@ -1043,142 +2031,161 @@ def render_edit_debit_note_section():
     """Renderiza la sección para editar notas de débito."""
     st.subheader("✏️ Editar Nota de Débito")
     if not st.session_state.notas.empty:
-        df_display_notes = st.session_state.notas.copy()
-        df_display_notes["Display"] = df_display_notes.apply(
-            lambda row: f"{row.name} - {row['Fecha']} - Descuento real: ${row['Descuento real']:.2f}", axis=1
-        )
-        if not df_display_notes["Display"].empty:
-            nota_seleccionada_info = st.selectbox(
-                "Selecciona una nota de débito para editar", df_display_notes["Display"], key="edit_debit_note_select"
-            )
-            index_to_edit = int(nota_seleccionada_info.split(' - ')[0]) if nota_seleccionada_info else None
-            if index_to_edit is not None and index_to_edit in st.session_state.notas.index:
-                note_to_edit = st.session_state.notas.loc[index_to_edit].to_dict()
-                with st.form(f"edit_debit_note_form_{index_to_edit}", clear_on_submit=False):
-                    st.write(f"Editando nota de débito: **ID {index_to_edit}**")
-                    edited_fecha_nota = st.date_input("Fecha de Nota", value=note_to_edit["Fecha"], key=f"edit_fecha_nota_{index_to_edit}")
-                    edited_descuento = st.number_input("Descuento (%)", value=float(note_to_edit["Descuento"]), min_value=0.0, max_value=1.0, step=0.01, format="%.2f", key=f"edit_descuento_{index_to_edit}")
-                    edited_descuento_real = st.number_input("Descuento Real ($)", value=float(note_to_edit["Descuento real"]), min_value=0.0, step=0.01, format="%.2f", key=f"edit_descuento_real_{index_to_edit}")
-                    submit_edit_note = st.form_submit_button("💾 Guardar Cambios de Nota de Débito")
-                    if submit_edit_note and (edited_descuento_real > 0 or edited_descuento > 0):
-                        updated_data = {
-                            "Fecha": edited_fecha_nota, "Descuento": edited_descuento,
-                            "Descuento real": edited_descuento_real
-                        }
-                        edit_debit_note_record(index_to_edit, updated_data)
-                    elif submit_edit_note:
-                        st.error("Ingresa un valor para Descuento (%) o Descuento Real ($) mayor que cero.")
-            else:
-                st.info("Selecciona una nota de débito para ver sus detalles de edición.")
-        else:
-            st.info("No hay notas de débito para editar.")
+        index_to_edit = selector_registros("notas", "Selecciona una nota de débito para editar", "edit_debit_note_select")
+        if index_to_edit is not None and index_to_edit in st.session_state.notas.index:
+            note_to_edit = st.session_state.notas.loc[index_to_edit].to_dict()
+            with st.form(f"edit_debit_note_form_{index_to_edit}", clear_on_submit=False):
+                st.write(f"Editando nota de débito: **ID {index_to_edit}**")
+                edited_fecha_nota = st.date_input("Fecha de Nota", value=note_to_edit["Fecha"], key=f"edit_fecha_nota_{index_to_edit}")
+                edited_descuento = st.number_input("Descuento (%)", value=float(note_to_edit["Descuento"]), min_value=0.0, max_value=1.0, step=0.01, format="%.2f", key=f"edit_descuento_{index_to_edit}")
+                edited_descuento_real = st.number_input("Descuento Real ($)", value=float(note_to_edit["Descuento real"]), min_value=0.0, step=0.01, format="%.2f", key=f"edit_descuento_real_{index_to_edit}")
+                submit_edit_note = st.form_submit_button("💾 Guardar Cambios de Nota de Débito")
+                if submit_edit_note and (edited_descuento_real > 0 or edited_descuento > 0):
+                    updated_data = {
+                        "Fecha": edited_fecha_nota, "Descuento": edited_descuento,
+                        "Descuento real": edited_descuento_real
+                    }
+                    edit_debit_note_record(index_to_edit, updated_data)
+                elif submit_edit_note:
+                    st.error("Ingresa un valor para Descuento (%) o Descuento Real ($) mayor que cero.")
+        elif index_to_edit is not None:
+            st.info("Selecciona una nota de débito para ver sus detalles de edición.")
     else:
         st.info("No hay notas de débito para editar.")
 
+def agrupar_ediciones_por_columna(edited_rows, etiquetas):
+    """Convierte edited_rows {posición: {columna: valor}} en {columna: serie indexada por etiqueta}."""
+    por_columna = {}
+    for posicion, cambios in edited_rows.items():
+        for col, valor in cambios.items():
+            posiciones, valores = por_columna.setdefault(col, ([], []))
+            posiciones.append(int(posicion))
+            valores.append(valor)
+    return {
+        col: pd.Series(valores, index=etiquetas[np.asarray(posiciones, dtype=int)], dtype=object)
+        for col, (posiciones, valores) in por_columna.items()
+    }
+
+def convertir_columna_editada(valores, tipo):
+    """Convierte de una vez los valores editados de una columna a su tipo. Devuelve (válidos, cantidad de inválidos)."""
+    if tipo == "date":
+        convertidos = pd.to_datetime(valores, errors="coerce")
+        validos = convertidos.notna()
+        return convertidos[validos].dt.date, int((~validos).sum())
+    if tipo in ("number", "number_int"):
+        convertidos = pd.to_numeric(valores, errors="coerce")
+        validos = convertidos.notna()
+        convertidos = convertidos[validos]
+        convertidos = convertidos.round().astype("int64") if tipo == "number_int" else convertidos.astype("float64")
+        return convertidos, int((~validos).sum())
+    return valores, 0
+
 def display_formatted_dataframe(df_source, title, columns_to_format=None, key_suffix="", editable_cols=None):
     """Muestra un DataFrame con formato y capacidad de edición."""
     st.subheader(title)
+    editable_cols = editable_cols or {}
     df_display = df_source.copy()
+    # Las columnas editables conservan su tipo (el editor las formatea); las demás se muestran como texto
+    for col, col_type in editable_cols.items():
+        if col in df_display.columns and col_type in ("number", "number_int"):
+            df_display[col] = pd.to_numeric(df_display[col], errors='coerce')
     if columns_to_format:
         for col in columns_to_format:
-            if col in df_display.columns:
+            if col in df_display.columns and col not in editable_cols:
                 df_display[col] = pd.to_numeric(df_display[col], errors='coerce')
                 df_display[col] = df_display[col].apply(lambda x: f"${x:,.2f}" if pd.notna(x) else "")
     if "Fecha" in df_display.columns:
-        df_display["Fecha"] = df_display["Fecha"].apply(lambda x: x.strftime('%Y-%m-%d') if pd.notna(x) else "")
+        if editable_cols.get("Fecha") == "date":
+            df_display["Fecha"] = pd.to_datetime(df_display["Fecha"], errors="coerce").dt.date
+        else:
+            df_display["Fecha"] = df_display["Fecha"].apply(lambda x: x.strftime('%Y-%m-%d') if pd.notna(x) else "")
     column_config = {}
-    if editable_cols:
-        for col_name, col_type in editable_cols.items():
-            if col_type == "text":
-                column_config[col_name] = st.column_config.TextColumn(col_name)
-            elif col_type == "number":
-                column_config[col_name] = st.column_config.NumberColumn(col_name, format="%.2f")
-            elif col_type == "date":
-                column_config[col_name] = st.column_config.DateColumn(col_name, format="YYYY-MM-DD")
-            elif col_type == "selectbox_proveedores":
-                column_config[col_name] = st.column_config.SelectboxColumn(col_name, options=PROVEEDORES)
-            elif col_type == "selectbox_documento":
-                column_config[col_name] = st.column_config.SelectboxColumn(col_name, options=TIPOS_DOCUMENTO)
-            elif col_type == "selectbox_agencias":
-                column_config[col_name] = st.column_config.SelectboxColumn(col_name, options=AGENCIAS)
-            elif col_type == "selectbox_clientes":
-                column_config[col_name] = st.column_config.SelectboxColumn(col_name, options=CLIENTES)
-            elif col_type == "selectbox_tipos_ave":
-                column_config[col_name] = st.column_config.SelectboxColumn(col_name, options=TIPOS_AVE)
-            elif col_type == "selectbox_categorias_gasto":
-                column_config[col_name] = st.column_config.SelectboxColumn(col_name, options=CATEGORIAS_GASTO)
-            elif col_type == "number_int":
-                column_config[col_name] = st.column_config.NumberColumn(col_name, format="%d", step=1)
-    edited_df = st.dataframe(
-        df_display, use_container_width=True, key=f"editable_df_{key_suffix}", hide_index=False, column_config=column_config
+    for col_name, col_type in editable_cols.items():
+        if col_type == "text":
+            column_config[col_name] = st.column_config.TextColumn(col_name)
+        elif col_type == "number":
+            column_config[col_name] = st.column_config.NumberColumn(col_name, format="%.2f")
+        elif col_type == "date":
+            column_config[col_name] = st.column_config.DateColumn(col_name, format="YYYY-MM-DD")
+        elif col_type == "selectbox_proveedores":
+            column_config[col_name] = st.column_config.SelectboxColumn(col_name, options=PROVEEDORES)
+        elif col_type == "selectbox_documento":
+            column_config[col_name] = st.column_config.SelectboxColumn(col_name, options=TIPOS_DOCUMENTO)
+        elif col_type == "selectbox_agencias":
+            column_config[col_name] = st.column_config.SelectboxColumn(col_name, options=AGENCIAS)
+        elif col_type == "selectbox_clientes":
+            column_config[col_name] = st.column_config.SelectboxColumn(col_name, options=CLIENTES)
+        elif col_type == "selectbox_tipos_ave":
+            column_config[col_name] = st.column_config.SelectboxColumn(col_name, options=TIPOS_AVE)
+        elif col_type == "selectbox_categorias_gasto":
+            column_config[col_name] = st.column_config.SelectboxColumn(col_name, options=CATEGORIAS_GASTO)
+        elif col_type == "number_int":
+            column_config[col_name] = st.column_config.NumberColumn(col_name, format="%d", step=1)
+    session_key = SESSION_KEY_BY_TITLE[title]
+    # La clave cambia con la versión de la tabla: tras guardar, el editor se reinicia con los datos nuevos
+    version = st.session_state.get("versiones_tablas", {}).get(session_key, 0)
+    editor_key = f"editable_df_{key_suffix}_{version}"
+    st.data_editor(
+        df_display, use_container_width=True, key=editor_key, hide_index=False, column_config=column_config,
+        disabled=[col for col in df_display.columns if col not in editable_cols]
     )
-    if f"editable_df_{key_suffix}" in st.session_state and st.session_state[f"editable_df_{key_suffix}"]["edited_rows"]:
+    if editor_key in st.session_state and st.session_state[editor_key]["edited_rows"]:
         st.info("¡Se han detectado cambios en la tabla! Presiona 'Guardar Cambios' para aplicar.")
         if st.button(f"💾 Guardar Cambios en {title}", key=f"save_changes_{key_suffix}"):
             try:
-                df_updated_rows = st.session_state[f"editable_df_{key_suffix}"]["edited_rows"]
-                original_df_to_update = df_source.copy()
-                for idx_str, changes in df_updated_rows.items():
-                    idx = int(idx_str)
-                    if title == "Tabla de Registros" and original_df_to_update.loc[idx, "Proveedor"] == "BALANCE_INICIAL":
-                        st.warning(f"No se pueden editar las propiedades de la fila de BALANCE_INICIAL (ID: {idx}).")
-                        continue
-                    for col, value in changes.items():
-                        original_type = df_source[col].dtype
-                        if pd.api.types.is_datetime64_any_dtype(original_type) or isinstance(df_source.loc[idx, col], (date, datetime)):
-                            try:
-                                original_df_to_update.loc[idx, col] = pd.to_datetime(value).date()
-                            except (ValueError, TypeError):
-                                st.warning(f"Formato de fecha inválido para '{col}' en la fila {idx}.")
-                                original_df_to_update.loc[idx, col] = df_source.loc[idx, col]
-                        elif pd.api.types.is_numeric_dtype(original_type):
-                            try:
-                                if editable_cols and editable_cols.get(col) == "number_int":
-                                    original_df_to_update.loc[idx, col] = int(value)
-                                else:
-                                    original_df_to_update.loc[idx, col] = float(value)
-                            except (ValueError, TypeError):
-                                st.warning(f"Valor numérico inválido para '{col}' en la fila {idx}.")
-                                original_df_to_update.loc[idx, col] = df_source.loc[idx, col]
-                        else:
-                            original_df_to_update.loc[idx, col] = value
+                # Los cambios se agrupan por columna y se aplican con una asignación tipada por columna;
+                # df_source puede ser un subconjunto filtrado, así que se trabaja con etiquetas
+                por_columna = agrupar_ediciones_por_columna(st.session_state[editor_key]["edited_rows"], df_source.index)
                 if title == "Tabla de Registros":
-                    st.session_state.data = original_df_to_update
-                    if save_dataframe(st.session_state.data, DATA_FILE):
-                        st.session_state.record_edited = True
-                        st.success("Cambios en Tabla de Registros guardados exitosamente.")
-                elif title == "Depósitos Registrados":
-                    st.session_state.df = original_df_to_update
-                    if save_dataframe(st.session_state.df, DEPOSITS_FILE):
-                        st.session_state.deposit_edited = True
-                        st.success("Cambios en Depósitos Registrados guardados exitosamente.")
-                elif title == "Tabla de Notas de Débito":
-                    st.session_state.notas = original_df_to_update
-                    if save_dataframe(st.session_state.notas, DEBIT_NOTES_FILE):
-                        st.session_state.debit_note_edited = True
-                        st.success("Cambios en Tabla de Notas de Débito guardados exitosamente.")
-                elif title == "Historial de Ventas":
-                    st.session_state.ventas_raw_data = original_df_to_update
-                    if save_dataframe(st.session_state.ventas_raw_data, VENTAS_FILE):
-                        st.session_state.ventas_edited = True
-                        st.session_state.ventas_data = get_ventas_df_processed()
-                        st.success("Cambios en Historial de Ventas guardados exitosamente.")
-                elif title == "Historial de Gastos":
-                    st.session_state.gastos_raw_data = original_df_to_update
-                    if save_dataframe(st.session_state.gastos_raw_data, GASTOS_FILE):
-                        st.session_state.gastos_edited = True
-                        st.session_state.gastos_data = get_gastos_df_processed()
-                        st.success("Cambios en Historial de Gastos guardados exitosamente.")
+                    etiquetas_balance = df_source.index[(df_source["Proveedor"] == "BALANCE_INICIAL").to_numpy()]
+                    if any(valores.index.isin(etiquetas_balance).any() for valores in por_columna.values()):
+                        st.warning("No se pueden editar las propiedades de la fila de BALANCE_INICIAL.")
+                    por_columna = {col: valores[~valores.index.isin(etiquetas_balance)] for col, valores in por_columna.items()}
+                columnas_originales = COLUMNAS_ORIGINALES_POR_TITULO.get(title, {})
+                cambios_por_columna = {}
+                for col, valores in por_columna.items():
+                    convertidos, invalidos = convertir_columna_editada(valores, editable_cols.get(col))
+                    if invalidos:
+                        st.warning(f"Se omitieron {invalidos} valor(es) inválido(s) en '{col}'.")
+                    if not convertidos.empty:
+                        cambios_por_columna[columnas_originales.get(col, col)] = convertidos
+                if not cambios_por_columna:
+                    return
+                # Las columnas derivadas se recalculan solo para las filas tocadas y entran en el mismo cambio
+                etiquetas = pd.Index(sorted(set().union(*(valores.index for valores in cambios_por_columna.values()))))
+                filas_anteriores = st.session_state[session_key].loc[etiquetas]
+                filas_editadas = filas_anteriores.copy()
+                for col, valores in cambios_por_columna.items():
+                    _asignar_columna(filas_editadas, col, valores)
+                cambios_por_columna.update(columnas_derivadas(session_key, filas_editadas))
+                version_anterior = ventas_gastos.version_tabla("ventas") if session_key == "ventas_raw_data" else None
+                actualizar_columnas(session_key, cambios_por_columna, f"Editar {len(etiquetas)} fila(s) en {title}")
+                if not save_dataframe(st.session_state[session_key], TABLAS_SESION[session_key][1]):
+                    return
+                # Un solo guardado; el recálculo de saldos (solo para proveedores, depósitos y notas) lo hace main
+                st.session_state[FLAG_EDICION_POR_TABLA[session_key]] = True
+                if session_key == "ventas_raw_data":
+                    st.session_state.cartera_clientes = ventas_gastos.aplicar_cambios_cartera(
+                        version_anterior,
+                        quitar=filas_anteriores, agregar=st.session_state.ventas_raw_data.loc[etiquetas]
+                    )
+                st.success(f"Cambios en {title} guardados exitosamente.")
             except Exception as e:
                 st.error(f"Error al procesar los cambios en la tabla: {e}")
 
 def render_tables_and_download():
     """Renderiza las tablas principales y proporciona opciones de descarga."""
+    filtros = filtros_activos()
+    data_filtrada = consultar_tabla("data", filtros)
+    depositos_filtrados = consultar_tabla("df", filtros)
+    notas_filtradas = consultar_tabla("notas", filtros)
+
     # Tabla de Registros (Proveedores)
     columns_to_format_proveedores = ["Precio Unitario ($)", "Total ($)", "Monto Deposito", "Saldo diario", "Saldo Acumulado"]
     editable_cols_proveedores = {
         "Fecha": "date",
         "Proveedor": "selectbox_proveedores",
+        "Producto": "selectbox_tipos_ave",
         "Cantidad": "number_int",
         "Peso Salida (kg)": "number",
         "Peso Entrada (kg)": "number",
@@ -1187,7 +2194,7 @@ def render_tables_and_download():
         "Precio Unitario ($)": "number"
     }
     display_formatted_dataframe(
-        st.session_state.data,
+        data_filtrada,
         "Tabla de Registros",
         columns_to_format=columns_to_format_proveedores,
         key_suffix="proveedores",
@@ -1203,7 +2210,7 @@ def render_tables_and_download():
         "Monto": "number"
     }
     display_formatted_dataframe(
-        st.session_state.df,
+        depositos_filtrados,
         "Depósitos Registrados",
         columns_to_format=columns_to_format_depositos,
         key_suffix="depositos",
@@ -1218,7 +2225,7 @@ def render_tables_and_download():
         "Descuento real": "number"
     }
     display_formatted_dataframe(
-        st.session_state.notas,
+        notas_filtradas,
         "Tabla de Notas de Débito",
         columns_to_format=columns_to_format_notas,
         key_suffix="notas_debito",
@@ -1231,7 +2238,7 @@ def render_tables_and_download():
     with col1:
         if st.button("📄 Descargar Proveedores (Excel)", key="download_proveedores"):
             output = BytesIO()
-            st.session_state.data.to_excel(output, index=False, sheet_name="registro de proveedores")
+            data_filtrada.to_excel(output, index=False, sheet_name="registro de proveedores")
             st.download_button(
                 label="📥 Descargar Proveedores",
                 data=output.getvalue(),
@@ -1241,7 +2248,7 @@ def render_tables_and_download():
     with col2:
         if st.button("📄 Descargar Depósitos (Excel)", key="download_depositos"):
             output = BytesIO()
-            st.session_state.df.to_excel(output, index=False, sheet_name="registro de depositos")
+            depositos_filtrados.to_excel(output, index=False, sheet_name="registro de depositos")
             st.download_button(
                 label="📥 Descargar Depósitos",
                 data=output.getvalue(),
@@ -1251,7 +2258,7 @@ def render_tables_and_download():
     with col3:
         if st.button("📄 Descargar Notas de Débito (Excel)", key="download_notas"):
             output = BytesIO()
-            st.session_state.notas.to_excel(output, index=False, sheet_name="registro de notas de debito")
+            notas_filtradas.to_excel(output, index=False, sheet_name="registro de notas de debito")
             st.download_button(
                 label="📥 Descargar Notas de Débito",
                 data=output.getvalue(),
@@ -1335,6 +2342,9 @@ def render_expenses_form():
 
 def render_sales_and_expenses_tables():
     """Renderiza las tablas de ventas y gastos con opciones de edición y eliminación."""
+    filtros = filtros_activos()
+    ventas_filtradas = get_ventas_df_processed(filtros)
+    gastos_filtrados = get_gastos_df_processed(filtros)
     st.subheader("📊 Historial de Ventas")
     columns_to_format_ventas = ["Libras", "Descuento", "Libras_netas", "Precio", "Total_a_cobrar", "Pago_Cliente", "Saldo"]
     editable_cols_ventas = {
@@ -1347,29 +2357,28 @@ def render_sales_and_expenses_tables():
         "Precio": "number",
         "Pago_Cliente": "number"
     }
-    if not st.session_state.ventas_data.empty:
+    if not ventas_filtradas.empty:
         display_formatted_dataframe(
-            st.session_state.ventas_data,
+            ventas_filtradas,
             "Historial de Ventas",
             columns_to_format=columns_to_format_ventas,
             key_suffix="ventas",
             editable_cols=editable_cols_ventas
         )
         st.subheader("🗑️ Eliminar Ventas")
-        indices_ventas = st.multiselect(
-            "Selecciona las ventas a eliminar (basado en Cliente y Fecha)",
-            options=st.session_state.ventas_data.index,
-            format_func=lambda x: f"{st.session_state.ventas_data.loc[x, 'Cliente']} - {st.session_state.ventas_data.loc[x, 'Fecha']}"
+        indices_ventas = selector_eliminacion(
+            "ventas_raw_data", "Selecciona las ventas a eliminar", "eliminar_ventas_select", "Cliente, fecha o total"
         )
-        if st.button("🗑️ Eliminar Ventas Seleccionadas", key="eliminar_ventas"):
-            if indices_ventas and st.checkbox("✅ Confirmar eliminación de ventas"):
-                if eliminar_ventas_seleccionadas(indices_ventas):
-                    st.success("Ventas eliminadas exitosamente.")
-            elif indices_ventas:
+        # La confirmación va antes del botón: dentro de él se perdería en la siguiente ejecución
+        confirmar = st.checkbox(f"✅ Confirmar eliminación de {len(indices_ventas)} ventas", key="confirmar_eliminar_ventas")
+        if st.button("🗑️ Eliminar Ventas Seleccionadas", key="eliminar_ventas", disabled=not indices_ventas):
+            if not confirmar:
                 st.warning("Por favor, confirma la eliminación.")
+            elif eliminar_ventas_seleccionadas(indices_ventas):
+                st.success("Ventas eliminadas exitosamente.")
         if st.button("📥 Descargar Ventas (CSV)", key="download_ventas"):
             output = BytesIO()
-            st.session_state.ventas_raw_data.to_csv(output, index=False)
+            st.session_state.ventas_raw_data.loc[ventas_filtradas.index.sort_values()].to_csv(output, index=False)
             st.download_button(
                 label="📥 Descargar Ventas",
                 data=output.getvalue(),
@@ -1388,29 +2397,28 @@ def render_sales_and_expenses_tables():
         "Gasto": "selectbox_categorias_gasto",
         "Dinero": "number"
     }
-    if not st.session_state.gastos_data.empty:
+    if not gastos_filtrados.empty:
         display_formatted_dataframe(
-            st.session_state.gastos_data,
+            gastos_filtrados,
             "Historial de Gastos",
             columns_to_format=columns_to_format_gastos,
             key_suffix="gastos",
             editable_cols=editable_cols_gastos
         )
         st.subheader("🗑️ Eliminar Gastos")
-        indices_gastos = st.multiselect(
-            "Selecciona los gastos a eliminar (basado en Descripción y Fecha)",
-            options=st.session_state.gastos_data.index,
-            format_func=lambda x: f"{st.session_state.gastos_data.loc[x, 'Descripcion']} - {st.session_state.gastos_data.loc[x, 'Fecha']}"
+        indices_gastos = selector_eliminacion(
+            "gastos_raw_data", "Selecciona los gastos a eliminar", "eliminar_gastos_select", "Descripción, fecha o monto"
         )
-        if st.button("🗑️ Eliminar Gastos Seleccionados", key="eliminar_gastos"):
-            if indices_gastos and st.checkbox("✅ Confirmar eliminación de gastos"):
-                if eliminar_gastos_seleccionados(indices_gastos):
-                    st.success("Gastos eliminados exitosamente.")
-            elif indices_gastos:
+        # La confirmación va antes del botón: dentro de él se perdería en la siguiente ejecución
+        confirmar = st.checkbox(f"✅ Confirmar eliminación de {len(indices_gastos)} gastos", key="confirmar_eliminar_gastos")
+        if st.button("🗑️ Eliminar Gastos Seleccionados", key="eliminar_gastos", disabled=not indices_gastos):
+            if not confirmar:
                 st.warning("Por favor, confirma la eliminación.")
+            elif eliminar_gastos_seleccionados(indices_gastos):
+                st.success("Gastos eliminados exitosamente.")
         if st.button("📥 Descargar Gastos (CSV)", key="download_gastos"):
             output = BytesIO()
-            st.session_state.gastos_raw_data.to_csv(output, index=False)
+            st.session_state.gastos_raw_data.loc[gastos_filtrados.index.sort_values()].to_csv(output, index=False)
             st.download_button(
                 label="📥 Descargar Gastos",
                 data=output.getvalue(),
@@ -1420,10 +2428,39 @@ def render_sales_and_expenses_tables():
     else:
         st.info("No hay gastos registrados.")
 
+def cartera_filtrada():
+    """Resumen de la cartera de clientes restringido al filtro de clientes."""
+    resumen = cartera.resumen_cartera(st.session_state.cartera_clientes)
+    clientes = filtros_activos()["clientes"]
+    if clientes:
+        resumen = resumen[resumen["Cliente"].isin(clientes)]
+    return resumen
+
+def render_receivables_section():
+    """Renderiza la cartera de clientes (cuentas por cobrar) de todo el historial."""
+    st.subheader("💳 Cartera de Clientes")
+    resumen = cartera_filtrada()
+    if resumen.empty:
+        st.info("No hay cuentas por cobrar registradas.")
+        return
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Total Facturado", formatear_moneda(resumen["Facturado"].sum()))
+    col2.metric("Total Pagado", formatear_moneda(resumen["Pagado"].sum()))
+    col3.metric("Saldo Pendiente", formatear_moneda(resumen["Pendiente"].sum()))
+    resumen = resumen.sort_values("Pendiente", ascending=False)
+    resumen_formateado = resumen.copy()
+    for col in ["Facturado", "Pagado", "Pendiente"]:
+        resumen_formateado[col] = resumen_formateado[col].apply(formatear_moneda)
+    st.dataframe(resumen_formateado, use_container_width=True, hide_index=True)
+
 def render_alerts_section():
     """Renderiza la sección de alertas de clientes."""
     st.subheader("🚨 Alertas de Clientes")
-    alertas_df = analizar_alertas_clientes(st.session_state.ventas_data)
+    try:
+        alertas_df = analizar_alertas_clientes(get_ventas_df_processed(), cartera_filtrada())
+    except ValueError as e:
+        st.error(f"Error en las reglas de alertas: {e}")
+        return
     if not alertas_df.empty:
         st.write("**Clientes con saldos pendientes o patrones de deuda:**")
         alertas_df['Saldo_Total'] = alertas_df['Saldo_Total'].apply(formatear_moneda)
@@ -1440,15 +2477,237 @@ def render_alerts_section():
     else:
         st.info("No hay alertas de clientes en este momento.")
 
+def render_supplier_statement_section():
+    """Renderiza el estado de cuenta por proveedor con su saldo corrido y la opción de exportarlo."""
+    st.subheader("📒 Estado de Cuenta por Proveedor")
+    estado = st.session_state.get("estado_proveedores", pd.DataFrame())
+    filtros = filtros_activos()
+    if not estado.empty:
+        mascara = pd.Series(True, index=estado.index)
+        if filtros["proveedores"]:
+            mascara &= estado["Proveedor"].isin(filtros["proveedores"])
+        if filtros["fechas"]:
+            fechas = pd.to_datetime(estado["Fecha"], errors="coerce")
+            inicio, fin = filtros["fechas"]
+            mascara &= (fechas >= pd.Timestamp(inicio)) & (fechas <= pd.Timestamp(fin))
+        estado = estado[mascara]
+    if estado.empty:
+        st.info("No hay movimientos de proveedores en los meses cargados.")
+        return
+    st.caption("Saldo = depósitos y notas de débito menos compras; un saldo negativo es lo que se le debe al proveedor.")
+    resumen = estado.groupby("Proveedor").agg(
+        Compras=("Cargo", "sum"), Abonos=("Abono", "sum"), Saldo=("Saldo", "last")
+    ).reset_index()
+    for col in ["Compras", "Abonos", "Saldo"]:
+        resumen[col] = resumen[col].apply(formatear_moneda)
+    st.dataframe(resumen, use_container_width=True, hide_index=True)
+    estado_formateado = estado.copy()
+    for col in ["Cargo", "Abono", "Saldo"]:
+        estado_formateado[col] = estado_formateado[col].apply(formatear_moneda)
+    st.dataframe(estado_formateado, use_container_width=True, hide_index=True)
+    output = BytesIO()
+    estado.to_excel(output, index=False, sheet_name="estado de cuenta")
+    st.download_button(
+        label="📥 Descargar Estado de Cuenta (Excel)",
+        data=output.getvalue(),
+        file_name="estado_cuenta_proveedores.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        key="download_estado_proveedores"
+    )
+
+def render_deposit_allocation_section():
+    """Renderiza la conciliación FIFO de depósitos con compras: compras abiertas, parciales y saldadas por proveedor."""
+    st.subheader("🧾 Conciliación de Depósitos con Compras")
+    if not all(key in st.session_state for key in CONCILIACION_SESION.values()):
+        st.info("No hay movimientos de proveedores para conciliar.")
+        return
+    partes = {parte: st.session_state[key] for parte, key in CONCILIACION_SESION.items()}
+    filtros = filtros_activos()
+    if filtros["proveedores"]:
+        partes = {parte: df[df["Proveedor"].isin(filtros["proveedores"])] for parte, df in partes.items()}
+    resumen = partes["proveedores"][conciliacion.COLUMNAS_PROVEEDORES]
+    resumen = resumen[resumen["Proveedor"] != SIN_PROVEEDOR]
+    if resumen.empty:
+        st.info("No hay movimientos de proveedores para conciliar.")
+        return
+    st.caption(
+        "Cada depósito y nota de débito paga primero las compras más antiguas de su proveedor (FIFO), "
+        "aunque sean de otro día. 'A favor' es lo abonado que aún no cubre ninguna compra."
+    )
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Compras Abiertas", int(resumen["Abiertas"].sum()))
+    col2.metric("Compras Parciales", int(resumen["Parciales"].sum()))
+    col3.metric("Pendiente de Pago", formatear_moneda(resumen["Pendiente"].sum()))
+    resumen_formateado = resumen.copy()
+    for col in ["Comprado", "Abonado", "Pendiente", "A favor"]:
+        resumen_formateado[col] = resumen_formateado[col].apply(formatear_moneda)
+    st.dataframe(resumen_formateado, use_container_width=True, hide_index=True)
+
+    estados = st.multiselect(
+        "Estado de las compras", conciliacion.ESTADOS, default=["Abierta", "Parcial"], key="conciliacion_estados"
+    )
+    facturas = partes["facturas"]
+    facturas = facturas[facturas["Estado"].isin(estados)]
+    if filtros["fechas"]:
+        fechas = pd.to_datetime(facturas["Fecha"], errors="coerce")
+        inicio, fin = filtros["fechas"]
+        facturas = facturas[(fechas >= pd.Timestamp(inicio)) & (fechas <= pd.Timestamp(fin))]
+    if facturas.empty:
+        st.info("Ninguna compra con esos estados.")
+    else:
+        facturas_formateadas = facturas.copy()
+        for col in ["Importe", "Pagado", "Pendiente"]:
+            facturas_formateadas[col] = facturas_formateadas[col].apply(formatear_moneda)
+        st.dataframe(facturas_formateadas, use_container_width=True, hide_index=True)
+    with st.expander("🔗 Qué depósito pagó cada compra"):
+        asignaciones = partes["asignaciones"]
+        if asignaciones.empty:
+            st.info("Aún no hay abonos asignados a compras.")
+        else:
+            st.dataframe(
+                asignaciones.assign(Importe=asignaciones["Importe"].apply(formatear_moneda)),
+                use_container_width=True, hide_index=True
+            )
+    output = BytesIO()
+    with pd.ExcelWriter(output) as writer:
+        resumen.to_excel(writer, index=False, sheet_name="proveedores")
+        partes["facturas"].to_excel(writer, index=False, sheet_name="compras")
+        partes["asignaciones"].to_excel(writer, index=False, sheet_name="asignaciones")
+    st.download_button(
+        label="📥 Descargar Conciliación (Excel)",
+        data=output.getvalue(),
+        file_name="conciliacion_depositos.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        key="download_conciliacion"
+    )
+
+def _mostrar_corte(corte):
+    """Muestra un corte del cubo con los periodos como texto y los importes redondeados."""
+    corte = corte.rename(columns={"filas": "Registros"})
+    corte["Periodo"] = corte["Periodo"].astype(str)
+    st.dataframe(corte.round(2), use_container_width=True, hide_index=True)
+
+def _elegir_periodo_detalle(corte, nivel, key):
+    """Selector del periodo a detallar al nivel siguiente; devuelve None si no se eligió ninguno."""
+    if nivel not in DETALLE_NIVEL or corte.empty:
+        return None
+    periodos = sorted(corte["Periodo"].unique())
+    elegido = st.selectbox(
+        f"🔎 Detallar un periodo por {DETALLE_NIVEL[nivel].lower()}",
+        ["—"] + [str(p) for p in periodos], key=key
+    )
+    return next((p for p in periodos if str(p) == elegido), None)
+
+def render_cube_slice(tabla, dimensiones, filtros, nivel):
+    """Renderiza el corte de una tabla del cubo por periodo y dimensiones, con su detalle."""
+    por = [dimensiones[d] for d in st.multiselect("Agrupar por", list(dimensiones), key=f"cubo_por_{tabla}")]
+    corte = consultar_cubo(tabla, filtros, nivel, por)
+    if corte.empty:
+        st.info("No hay registros en el rango seleccionado.")
+        return
+    _mostrar_corte(corte)
+    periodo = _elegir_periodo_detalle(corte, nivel, f"cubo_detalle_{tabla}")
+    if periodo is not None:
+        _mostrar_corte(consultar_cubo(tabla, filtros, DETALLE_NIVEL[nivel], por, periodo=periodo))
+
+def render_rollup_section():
+    """Renderiza los reportes por periodo: estado de resultados y cortes de ventas, gastos y compras."""
+    st.subheader("🧮 Reportes por Periodo")
+    st.caption("Calculados desde agregados diarios: abren igual de rápido con cualquier tamaño de historial.")
+    filtros = filtros_activos()
+    nivel = st.radio("Nivel", list(NIVELES_CUBO), index=1, horizontal=True, key="cubo_nivel")
+    tab_resultados, tab_ventas, tab_gastos, tab_compras = st.tabs(
+        ["Estado de Resultados", "Ventas", "Gastos", "Compras"]
+    )
+    with tab_resultados:
+        resultados = estado_resultados(filtros, nivel)
+        if resultados.empty:
+            st.info("No hay movimientos en el rango seleccionado.")
+        else:
+            st.caption("Utilidad = ventas − (compras − notas de débito) − gastos.")
+            _mostrar_corte(resultados)
+            fig, ax = plt.subplots(figsize=(10, 4))
+            ax.bar(resultados["Periodo"].astype(str), resultados["Utilidad"],
+                   color=["tab:green" if u >= 0 else "tab:red" for u in resultados["Utilidad"]])
+            ax.set_title(f"Utilidad por {nivel.lower()}")
+            ax.set_ylabel("Utilidad ($)")
+            ax.yaxis.set_major_formatter(mticker.StrMethodFormatter("${x:,.0f}"))
+            plt.xticks(rotation=45)
+            st.pyplot(fig)
+            periodo = _elegir_periodo_detalle(resultados, nivel, "cubo_detalle_resultados")
+            if periodo is not None:
+                _mostrar_corte(estado_resultados(filtros, DETALLE_NIVEL[nivel], periodo=periodo))
+    with tab_ventas:
+        render_cube_slice("ventas", {"Cliente": "cliente", "Tipo": "tipo"}, filtros, nivel)
+    with tab_gastos:
+        render_cube_slice("gastos", {"Categoría": "gasto"}, filtros, nivel)
+    with tab_compras:
+        render_cube_slice("proveedores", {"Proveedor": "Proveedor"}, filtros, nivel)
+
+def render_inventory_reconciliation_section():
+    """Renderiza la conciliación de inventario comprado vs vendido por tipo de ave."""
+    st.subheader("⚖️ Conciliación de Inventario")
+    st.caption("Compras de proveedores frente a ventas a clientes, por tipo de ave.")
+    col_nivel, col_dias = st.columns(2)
+    with col_nivel:
+        nivel = st.radio("Periodo", ["Día", "Semana"], horizontal=True, key="conciliacion_nivel")
+    with col_dias:
+        dias_max = st.number_input(
+            "Días máximos en inventario", min_value=0, value=DIAS_MAX_INVENTARIO, step=1,
+            key="conciliacion_dias_max",
+            help="Las aves que siguen sin venderse después de estos días se cuentan como perdidas."
+        )
+    inventario = conciliacion_por_periodo(conciliar_inventario(int(dias_max)), nivel, filtros_activos()["fechas"])
+    if inventario.empty:
+        st.info("No hay compras ni ventas en el rango seleccionado.")
+        return
+    totales = inventario.groupby("Tipo")[FLUJOS_INVENTARIO].sum()
+    for tipo, columna in zip(totales.index, st.columns(len(totales))):
+        fila = totales.loc[tipo]
+        merma = fila["Libras perdidas"] / fila["Libras compradas"] * 100 if fila["Libras compradas"] else 0.0
+        columna.metric(f"Libras perdidas ({tipo})", f"{fila['Libras perdidas']:,.2f}", f"{merma:.2f}% de lo comprado",
+                       delta_color="inverse")
+    inventario = inventario.assign(Periodo=inventario["Periodo"].astype(str))
+    st.dataframe(inventario.round(2), use_container_width=True, hide_index=True)
+
+def render_demand_forecast_section():
+    """Renderiza el pronóstico de demanda por cliente para los próximos días."""
+    st.subheader("🔮 Pronóstico de Demanda")
+    st.caption(
+        f"Media móvil exponencial de las últimas {pronostico.SEMANAS_HISTORIA} semanas de ventas, "
+        "ajustada por día de la semana."
+    )
+    dias = st.number_input("Días a pronosticar", min_value=1, max_value=30, value=7, step=1, key="pronostico_dias")
+    proyeccion = obtener_pronostico(datetime.today().date(), int(dias))
+    clientes = filtros_activos()["clientes"]
+    if clientes:
+        proyeccion = proyeccion[proyeccion["Cliente"].isin(clientes)]
+    if proyeccion.empty:
+        st.info("No hay ventas recientes para pronosticar.")
+        return
+    totales = pronostico.totales_por_fecha(proyeccion)
+    col1, col2 = st.columns(2)
+    col1.metric("Libras esperadas (primer día)", f"{totales['Libras'].iloc[0]:,.1f}")
+    col2.metric("Aves esperadas (primer día)", f"{totales['Cantidad'].iloc[0]:,.0f}")
+    medida = st.radio("Medida", ["Libras", "Cantidad"], horizontal=True, key="pronostico_medida")
+    por_cliente = proyeccion.pivot_table(index="Cliente", columns="Fecha", values=medida, aggfunc="sum")
+    por_cliente.loc["TOTAL"] = por_cliente.sum()
+    por_cliente.columns = [f.strftime("%a %d/%m") for f in por_cliente.columns]
+    st.dataframe(por_cliente.round(1 if medida == "Libras" else 0), use_container_width=True)
+
 def render_charts():
     """Renderiza gráficos de análisis."""
     st.subheader("📈 Análisis Gráfico")
-    if not st.session_state.data.empty:
-        df_data = st.session_state.data[st.session_state.data["Proveedor"] != "BALANCE_INICIAL"].copy()
-        df_data["Fecha"] = pd.to_datetime(df_data["Fecha"], errors="coerce")
-        df_data = df_data.dropna(subset=["Fecha"])
-        df_data["Mes"] = df_data["Fecha"].dt.to_period("M").dt.to_timestamp()
-        saldo_por_mes = df_data.groupby("Mes")["Saldo diario"].sum().reset_index()
+    # Los gráficos usan los resúmenes mensuales de las particiones (todo el historial);
+    # los filtros se aplican a nivel de mes y de proveedor/cliente.
+    filtros = filtros_activos()
+    resumen_proveedores = filtrar_resumen(particiones.leer_resumen("proveedores"), filtros, "Proveedor", "proveedores")
+    resumen_proveedores = resumen_proveedores[
+        (resumen_proveedores["Proveedor"] != "BALANCE_INICIAL") & (resumen_proveedores["mes"] != particiones.MES_SIN_FECHA)
+    ]
+    if not resumen_proveedores.empty:
+        saldo_por_mes = resumen_proveedores.groupby("mes")["Saldo diario"].sum().reset_index()
+        saldo_por_mes["Mes"] = pd.to_datetime(saldo_por_mes["mes"], format="%Y-%m")
 
         fig, ax = plt.subplots(figsize=(10, 5))
         ax.plot(saldo_por_mes["Mes"], saldo_por_mes["Saldo diario"], marker="o")
@@ -1460,8 +2719,10 @@ def render_charts():
         plt.xticks(rotation=45)
         st.pyplot(fig)
 
-    if not st.session_state.ventas_data.empty:
-        ventas_por_cliente = st.session_state.ventas_data.groupby("Cliente")["Total_a_cobrar"].sum().reset_index()
+    resumen_ventas = filtrar_resumen(particiones.leer_resumen("ventas"), filtros, "cliente", "clientes")
+    if not resumen_ventas.empty:
+        ventas_por_cliente = resumen_ventas.groupby("cliente")["total_a_cobrar"].sum().reset_index()
+        ventas_por_cliente.columns = ["Cliente", "Total_a_cobrar"]
         fig, ax = plt.subplots(figsize=(10, 5))
         ax.bar(ventas_por_cliente["Cliente"], ventas_por_cliente["Total_a_cobrar"])
         ax.set_title("Ventas Totales por Cliente")
@@ -1490,10 +2751,216 @@ def render_clear_data_section():
             else:
                 st.warning("Por favor, confirma la eliminación.")
 
+def render_query_filters():
+    """Renderiza los filtros de fecha y entidad que usan las tablas, los gráficos y las alertas."""
+    with st.sidebar.expander("🔎 Filtros de consulta"):
+        st.date_input("Fechas", value=(), key="filtro_fechas")
+        st.multiselect("Proveedores", PROVEEDORES, key="filtro_proveedores")
+        st.multiselect("Clientes", CLIENTES, key="filtro_clientes")
+        st.multiselect("Agencias", AGENCIAS, key="filtro_agencias")
+        st.multiselect("Categorías de gasto", CATEGORIAS_GASTO, key="filtro_categorias")
+        st.caption("Las tablas y alertas se filtran sobre los meses cargados.")
+
+def render_undo_redo_controls():
+    """Renderiza los botones para deshacer y rehacer los últimos cambios."""
+    pila_deshacer = st.session_state.get("cambios_deshacer", [])
+    pila_rehacer = st.session_state.get("cambios_rehacer", [])
+    col1, col2 = st.sidebar.columns(2)
+    with col1:
+        if st.button("↩️ Deshacer", key="deshacer_cambio", disabled=not pila_deshacer,
+                     help=pila_deshacer[-1]["descripcion"] if pila_deshacer else None):
+            descripcion = deshacer_cambio()
+            if descripcion:
+                st.sidebar.success(f"Deshecho: {descripcion}")
+    with col2:
+        if st.button("↪️ Rehacer", key="rehacer_cambio", disabled=not pila_rehacer,
+                     help=pila_rehacer[-1]["descripcion"] if pila_rehacer else None):
+            descripcion = rehacer_cambio()
+            if descripcion:
+                st.sidebar.success(f"Rehecho: {descripcion}")
+
+def vaciar_al_desactivar():
+    """Al apagar la escritura en segundo plano, escribe lo que haya quedado en cola."""
+    if not st.session_state.escritura_diferida:
+        escritura_diferida.vaciar(timeout=60)
+
+def render_persistence_toggle():
+    """Renderiza el interruptor de escritura en segundo plano de la sesión (antes de cualquier guardado)."""
+    diferida = st.sidebar.toggle(
+        "💾 Guardar en segundo plano", value=ESCRITURA_DIFERIDA_POR_DEFECTO, key="escritura_diferida",
+        on_change=vaciar_al_desactivar,
+        help="Los cambios se ven al instante y se escriben en disco en un hilo de fondo. Solo afecta a esta sesión."
+    )
+    escritura_diferida.activar(diferida)
+
+@st.fragment(run_every=2)
+def render_persistence_status():
+    """Muestra si todo está guardado o cuántas escrituras quedan pendientes (se refresca solo)."""
+    pendientes, errores, ultimo_guardado = escritura_diferida.estado()
+    for clave, error in errores.items():
+        st.error(f"No se pudo guardar {clave}: {error}")
+    if pendientes:
+        st.caption(f"⏳ {pendientes} escritura(s) pendiente(s)")
+        if st.button("Guardar ahora", key="vaciar_escrituras"):
+            if escritura_diferida.vaciar(timeout=60):
+                st.success("Todos los cambios están guardados.")
+    elif not errores:
+        hora = f" ({datetime.fromtimestamp(ultimo_guardado).strftime('%H:%M:%S')})" if ultimo_guardado else ""
+        st.caption(f"✅ Guardado{hora}")
+
+def render_first_render_time(inicio):
+    """Anota el tiempo hasta la primera vista de la sesión (solo en su primera ejecución) y lo muestra
+    junto con el de las demás sesiones del proceso, en frío y desde la caché de arranque."""
+    if "tiempo_primera_vista" not in st.session_state:
+        st.session_state.tiempo_primera_vista = time.perf_counter() - inicio
+        arranque.registrar_tiempo(st.session_state.tipo_arranque, st.session_state.tiempo_primera_vista)
+    tipo = arranque.TIPOS_ARRANQUE[st.session_state.tipo_arranque].lower()
+    st.caption(f"⚡ Primera vista en {st.session_state.tiempo_primera_vista:.2f} s ({tipo})")
+    with st.expander("⏱️ Tiempo hasta la primera vista"):
+        st.dataframe(arranque.metricas().round(3), use_container_width=True, hide_index=True)
+
+def restaurar_respaldo():
+    """Restaura el respaldo elegido y descarta todo lo cargado de la sucursal (caché compartida y sesión).
+
+    Se llama desde el cuerpo del script, no como callback del botón: los callbacks corren
+    antes de que el script active la sucursal de la sesión y restaurarían la principal.
+    """
+    instantanea = st.session_state.respaldo_elegido
+    try:
+        escritos, borrados = respaldos.restaurar(instantanea)
+    except (OSError, ValueError) as e:
+        st.session_state.respaldo_mensaje = ("error", f"No se pudo restaurar el respaldo: {e}")
+        return
+    ventas_gastos.descartar_datos()
+    arranque.descartar()
+    registrar_evento("restaurar", "todas", f"Restaurar respaldo {instantanea}", respaldo=instantanea)
+    conservar = {"sucursal", "selector_sucursal", "nav_radio"}
+    for key in list(st.session_state.keys()):
+        if key not in conservar:
+            del st.session_state[key]
+    st.session_state.respaldo_mensaje = (
+        "success", f"Respaldo {instantanea} restaurado ({escritos} archivo(s) escritos, {borrados} borrado(s))."
+    )
+
+def render_backups_section():
+    """Renderiza la lista de respaldos con las acciones de tomar uno ahora y restaurar."""
+    st.subheader("🗄️ Respaldos")
+    tipo, mensaje = st.session_state.pop("respaldo_mensaje", (None, None))
+    if tipo == "success":
+        st.success(mensaje)
+    elif tipo == "error":
+        st.error(mensaje)
+    st.caption(
+        f"Se toma uno cada {respaldos.INTERVALO_HORAS} horas y antes de eliminar todas las ventas o gastos y de importar. "
+        "Solo se guardan comprimidos los archivos que cambiaron."
+    )
+    if st.button("📸 Tomar respaldo ahora", key="tomar_respaldo"):
+        try:
+            instantanea = respaldos.tomar("manual")
+            st.success(f"Respaldo {instantanea} listo." if instantanea else "No hay datos para respaldar.")
+        except OSError as e:
+            st.error(f"No se pudo tomar el respaldo: {e}")
+    lista = respaldos.listar()
+    if not lista:
+        st.info("Todavía no hay respaldos.")
+        return
+    tabla = pd.DataFrame(lista)
+    tabla["MB"] = (tabla.pop("bytes") / 1e6).round(2)
+    st.dataframe(tabla, use_container_width=True, hide_index=True)
+    st.selectbox(
+        "Respaldo a restaurar", [fila["instantanea"] for fila in lista], key="respaldo_elegido",
+        format_func=lambda i: next(f"{f['fecha']:%Y-%m-%d %H:%M:%S} - {f['motivo']}" for f in lista if f["instantanea"] == i)
+    )
+    confirmar = st.checkbox("✅ Confirmo que quiero reemplazar los datos actuales por este respaldo", key="confirmar_restaurar")
+    if st.button("♻️ Restaurar respaldo", key="restaurar_respaldo", disabled=not confirmar):
+        restaurar_respaldo()
+        st.rerun()
+
+def render_audit_section():
+    """Renderiza el registro de auditoría: eventos por tabla y tipo, verificación de la cadena y eventos de un mes."""
+    st.subheader("🧾 Auditoría de cambios")
+    st.caption(
+        "Cada cambio a las tablas queda registrado y no se puede modificar: cualquier línea alterada rompe la cadena de hashes."
+    )
+    totales = eventos.totales()
+    if totales.empty:
+        st.info("Todavía no hay cambios registrados.")
+        return
+    st.dataframe(totales, use_container_width=True)
+    if st.button("🔍 Verificar integridad del registro", key="verificar_eventos"):
+        revisados, alterado = eventos.verificar()
+        if alterado is None:
+            st.success(f"Registro íntegro: {revisados} evento(s) verificados.")
+        else:
+            st.error(f"El evento {alterado} fue alterado o falta uno anterior ({revisados} evento(s) correctos antes).")
+    col1, col2 = st.columns(2)
+    with col1:
+        mes = st.selectbox("Mes", eventos.meses(), key="auditoria_mes")
+    with col2:
+        tablas = st.multiselect("Tablas", list(totales.index), key="auditoria_tablas")
+    registro = eventos.leer_mes(mes)
+    if tablas:
+        registro = [e for e in registro if e["tabla"] in tablas]
+    # Los más recientes primero
+    st.dataframe(eventos.tabla_eventos(registro[::-1]), use_container_width=True, hide_index=True)
+    st.download_button(
+        "⬇️ Descargar eventos del mes (JSONL)",
+        "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in registro).encode("utf-8"),
+        file_name=f"eventos_{mes}.jsonl", mime="application/jsonl", key="descargar_eventos"
+    )
+
 # --- 6. FLUJO PRINCIPAL DE LA APLICACIÓN ---
+def cambiar_sucursal():
+    """Cambia la sucursal de la sesión y descarta todo su estado (tablas, historial, vistas, widgets)."""
+    nueva = st.session_state.selector_sucursal
+    for key in list(st.session_state.keys()):
+        if key != "selector_sucursal":
+            del st.session_state[key]
+    st.session_state.sucursal = nueva
+
+def render_branch_selector():
+    """Renderiza el selector de sucursal (solo si hay más de una configurada)."""
+    disponibles = sucursales.listar()
+    if len(disponibles) < 2:
+        return
+    st.sidebar.selectbox(
+        "🏪 Sucursal", disponibles, index=disponibles.index(SUCURSAL), format_func=sucursales.nombre,
+        key="selector_sucursal", on_change=cambiar_sucursal
+    )
+
+def render_date_range_selector():
+    """Renderiza el selector de rango de fechas que decide qué meses se cargan en memoria."""
+    hoy = date.today()
+    rango = st.sidebar.date_input(
+        "📅 Rango de fechas a cargar", value=(hoy - timedelta(days=hoy.weekday()), hoy), key="rango_fechas"
+    )
+    if isinstance(rango, (list, tuple)):
+        if not rango:
+            return
+        inicio, fin = rango[0], rango[-1]
+    else:
+        inicio = fin = rango
+    meses = set(particiones.meses_en_rango(inicio, fin)) | MESES_SIEMPRE_CARGADOS
+    if st.session_state.get("meses_rango") != meses:
+        # Cambió el rango: se descartan las tablas en memoria para recargar solo esos meses
+        st.session_state.meses_rango = meses
+        st.session_state.meses_cargados = set(meses)
+        for key in list(TABLAS_SESION) + ["orden_vistas", "indices_consulta", "indices_etiquetas"]:
+            st.session_state.pop(key, None)
+        limpiar_historial_cambios()
+    meses_visibles = sorted(st.session_state.meses_cargados - MESES_SIEMPRE_CARGADOS)
+    st.sidebar.caption(f"Meses cargados: {', '.join(meses_visibles)}")
+
 def main():
     """Flujo principal de la aplicación."""
+    inicio = time.perf_counter()
+    render_branch_selector()
+    render_persistence_toggle()
+    render_date_range_selector()
+    render_query_filters()
     initialize_session_state()
+    respaldos.programar()
+    render_undo_redo_controls()
     st.title("🐔 Sistema de Gestión de Proveedores y Ventas - Producto Pollo")
 
     # Barra lateral para navegación
@@ -1521,6 +2988,9 @@ def main():
     # Renderizar contenido según la sección seleccionada
     if opcion == "🏠 Inicio":
         st.header("🏠 Bienvenido al Sistema de Gestión")
+        # El resumen sale de los totales por mes de las particiones, sin leer filas
+        resumen_proveedores = particiones.leer_resumen("proveedores")
+        resumen_cartera = cartera.resumen_cartera(st.session_state.cartera_clientes)
         st.markdown("""
         Este sistema te permite gestionar proveedores, depósitos, notas de débito, ventas y gastos para el producto **Pollo**. Utiliza la barra lateral para navegar entre las secciones.
         
@@ -1528,12 +2998,14 @@ def main():
         - **Proveedores Registrados**: {}
         - **Depósitos Totales**: {}
         - **Ventas Totales**: {}
+        - **Saldo Pendiente de Clientes**: {}
         - **Gastos Totales**: {}
         """.format(
-            len(st.session_state.data[st.session_state.data["Proveedor"] != "BALANCE_INICIAL"]),
-            formatear_moneda(st.session_state.df["Monto"].sum() if not st.session_state.df.empty else 0),
-            formatear_moneda(st.session_state.ventas_data["Total_a_cobrar"].sum() if not st.session_state.ventas_data.empty else 0),
-            formatear_moneda(st.session_state.gastos_data["Dinero"].sum() if not st.session_state.gastos_data.empty else 0)
+            resumen_proveedores.loc[resumen_proveedores["Proveedor"] != "BALANCE_INICIAL", "filas"].sum(),
+            formatear_moneda(particiones.leer_resumen("depositos")["Monto"].sum()),
+            formatear_moneda(resumen_cartera["Facturado"].sum()),
+            formatear_moneda(resumen_cartera["Pendiente"].sum()),
+            formatear_moneda(particiones.leer_resumen("gastos")["dinero"].sum())
         ))
 
     elif opcion == "📝 Registro de Proveedores":
@@ -1559,26 +3031,36 @@ def main():
         render_sales_form()
         render_expenses_form()
         render_sales_and_expenses_tables()
+        render_receivables_section()
         render_alerts_section()
         render_clear_data_section()
 
     elif opcion == "📈 Reportes y Gráficos":
         st.header("📈 Reportes y Gráficos")
         render_tables_and_download()
+        render_supplier_statement_section()
+        render_deposit_allocation_section()
+        render_rollup_section()
+        render_inventory_reconciliation_section()
+        render_demand_forecast_section()
         render_charts()
 
     elif opcion == "📁 Importar Datos":
         st.header("📁 Importar Datos")
         render_import_excel_section()
+        render_backups_section()
+        render_audit_section()
 
     # Recalcular saldos si hubo cambios
-    if any([
+    hubo_cambios = any([
         st.session_state.record_added, st.session_state.record_deleted, st.session_state.record_edited,
         st.session_state.deposit_added, st.session_state.deposit_deleted, st.session_state.deposit_edited,
         st.session_state.debit_note_added, st.session_state.debit_note_deleted, st.session_state.debit_note_edited,
         st.session_state.data_imported
-    ]):
+    ])
+    if hubo_cambios or st.session_state.saldos_desactualizados:
         recalculate_accumulated_balances()
+        publicar_datos_preparados(cambio=hubo_cambios)
         st.session_state.record_added = False
         st.session_state.record_deleted = False
         st.session_state.record_edited = False
@@ -1589,6 +3071,12 @@ def main():
         st.session_state.debit_note_deleted = False
         st.session_state.debit_note_edited = False
         st.session_state.data_imported = False
+        st.session_state.saldos_desactualizados = False
+
+    # Al final, para reflejar las escrituras encoladas en esta ejecución
+    with st.sidebar:
+        render_persistence_status()
+        render_first_render_time(inicio)
 
 if __name__ == "__main__":
     main()
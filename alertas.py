@@ -0,0 +1,215 @@
+"""Reglas de alerta de clientes cargadas desde reglas_alertas.json.
+
+Cada regla compara una métrica por cliente (ver METRICAS) con un umbral; un
+cliente entra en alerta si cumple alguna, y su prioridad sale de la suma de
+los pesos de las reglas que cumple. El archivo también admite umbrales
+propios por cliente o desactivar una regla para un cliente:
+
+    {
+      "reglas": [
+        {"nombre": "saldo_alto", "metrica": "saldo", "operador": ">", "umbral": 10,
+         "peso": 1, "motivo": "Debe más de ${valor:.2f}"}
+      ],
+      "prioridades": [{"nombre": "Alta", "puntaje_minimo": 2}, {"nombre": "Media", "puntaje_minimo": 1}],
+      "clientes": {"Moreira": {"saldo_alto": {"umbral": 50}, "racha_saldo": {"activa": false}}}
+    }
+
+Las reglas se compilan una vez (por versión del archivo) en matrices de
+umbrales clientes × reglas, y se evalúan con una comparación por operador
+sobre la matriz de métricas, sin recorrer clientes ni reglas.
+"""
+import json
+import operator
+import os
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+REGLAS_FILE = os.path.join(BASE_DIR, 'reglas_alertas.json')
+
+# Se usan si no existe el archivo de reglas: las alertas de siempre
+REGLAS_POR_DEFECTO = {
+    'reglas': [
+        {'nombre': 'saldo_alto', 'metrica': 'saldo', 'operador': '>', 'umbral': 10,
+         'peso': 1, 'motivo': 'Debe más de ${valor:.2f}'},
+        {'nombre': 'racha_saldo', 'metrica': 'racha_dias_saldo', 'operador': '>=', 'umbral': 2,
+         'peso': 1, 'motivo': 'Saldo por {valor:.0f} día(s) consecutivo(s)'},
+    ],
+    'prioridades': [{'nombre': 'Alta', 'puntaje_minimo': 2}, {'nombre': 'Media', 'puntaje_minimo': 1}],
+    'clientes': {},
+}
+
+METRICAS = {
+    'saldo': 'Saldo pendiente del cliente',
+    'facturado': 'Total facturado',
+    'pagado': 'Total pagado',
+    'ratio_pago': 'Pagado / facturado (1 si no hay facturado)',
+    'racha_dias_saldo': 'Mayor cantidad de días consecutivos con ventas con saldo',
+    'dias_mora': 'Días desde la venta impaga más antigua (0 si no hay)',
+    'dias_sin_compra': 'Días desde la última venta',
+}
+OPERADORES = {
+    '>': operator.gt, '>=': operator.ge, '<': operator.lt,
+    '<=': operator.le, '==': operator.eq, '!=': operator.ne,
+}
+COLUMNAS_ALERTAS = ['Cliente', 'Saldo_Total', 'Ultima_Venta', 'Motivo_Alerta', 'Prioridad']
+
+# ((ruta, mtime_ns) del archivo de reglas, reglas compiladas)
+_compiladas = (None, None)
+
+
+def validar_reglas(config):
+    """Revisa la estructura de las reglas y lanza ValueError con el primer problema encontrado."""
+    reglas = config.get('reglas')
+    if not isinstance(reglas, list) or not reglas:
+        raise ValueError("El archivo de reglas debe tener una lista 'reglas' no vacía.")
+    nombres = set()
+    for regla in reglas:
+        nombre = regla.get('nombre')
+        if not nombre or nombre in nombres:
+            raise ValueError(f"Cada regla necesita un 'nombre' único (revisa '{nombre}').")
+        nombres.add(nombre)
+        if regla.get('metrica') not in METRICAS:
+            raise ValueError(f"Regla '{nombre}': métrica desconocida '{regla.get('metrica')}'.")
+        if regla.get('operador') not in OPERADORES:
+            raise ValueError(f"Regla '{nombre}': operador desconocido '{regla.get('operador')}'.")
+        if not isinstance(regla.get('umbral'), (int, float)):
+            raise ValueError(f"Regla '{nombre}': el umbral debe ser un número.")
+    for prioridad in config.get('prioridades', []):
+        if 'nombre' not in prioridad or not isinstance(prioridad.get('puntaje_minimo'), (int, float)):
+            raise ValueError("Cada prioridad necesita 'nombre' y un 'puntaje_minimo' numérico.")
+    for cliente, ajustes in config.get('clientes', {}).items():
+        for nombre, ajuste in ajustes.items():
+            if nombre not in nombres:
+                raise ValueError(f"Cliente '{cliente}': la regla '{nombre}' no existe.")
+            if 'umbral' in ajuste and not isinstance(ajuste['umbral'], (int, float)):
+                raise ValueError(f"Cliente '{cliente}', regla '{nombre}': el umbral debe ser un número.")
+
+
+def compilar_reglas(config):
+    """Convierte la configuración en arreglos listos para evaluar."""
+    validar_reglas(config)
+    reglas = config['reglas']
+    nombres = [regla['nombre'] for regla in reglas]
+    ajustes = [
+        {'cliente': cliente, 'regla': nombre, **ajuste}
+        for cliente, por_regla in config.get('clientes', {}).items()
+        for nombre, ajuste in por_regla.items()
+    ]
+    ajustes = pd.DataFrame(ajustes, columns=['cliente', 'regla', 'umbral', 'activa'])
+    prioridades = sorted(config.get('prioridades', []), key=lambda p: p['puntaje_minimo'], reverse=True)
+    return {
+        'nombres': nombres,
+        'metricas': [regla['metrica'] for regla in reglas],
+        'operadores': np.array([regla['operador'] for regla in reglas]),
+        'umbrales': np.array([float(regla['umbral']) for regla in reglas]),
+        'pesos': np.array([float(regla.get('peso', 1)) for regla in reglas]),
+        'motivos': [regla.get('motivo', f"{regla['nombre']}: {{valor}}") for regla in reglas],
+        # Ajustes por cliente en formato largo: se pivotan contra los clientes al evaluar
+        'umbrales_cliente': ajustes.dropna(subset=['umbral']).pivot_table(
+            index='cliente', columns='regla', values='umbral', aggfunc='last'
+        ).reindex(columns=nombres),
+        'inactivas_cliente': ajustes[ajustes['activa'].eq(False)].assign(inactiva=True).pivot_table(
+            index='cliente', columns='regla', values='inactiva', aggfunc='any'
+        ).reindex(columns=nombres),
+        'prioridades': [p['nombre'] for p in prioridades],
+        'puntajes': [float(p['puntaje_minimo']) for p in prioridades],
+    }
+
+
+def cargar_reglas(ruta=REGLAS_FILE):
+    """Reglas compiladas del archivo (o las por defecto si no existe); se recompilan solo si el archivo cambió."""
+    global _compiladas
+    try:
+        mtime = os.stat(ruta).st_mtime_ns
+    except FileNotFoundError:
+        mtime = 'por_defecto'
+    if _compiladas[0] == (ruta, mtime):
+        return _compiladas[1]
+    if mtime == 'por_defecto':
+        config = REGLAS_POR_DEFECTO
+    else:
+        try:
+            with open(ruta, encoding='utf-8') as f:
+                config = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"El archivo de reglas no es un JSON válido: {e}") from e
+    compiladas = compilar_reglas(config)
+    _compiladas = ((ruta, mtime), compiladas)
+    return compiladas
+
+
+def racha_maxima(clientes, fechas):
+    """Mayor cantidad de días consecutivos por cliente, dadas sus fechas (con repeticiones)."""
+    dias = pd.DataFrame({'cliente': clientes, 'dia': pd.to_datetime(fechas).normalize()})
+    dias = dias.dropna().drop_duplicates().sort_values(['cliente', 'dia'])
+    if dias.empty:
+        return pd.Series(dtype=float)
+    # Una racha nueva empieza con cada cliente nuevo o cada salto de más de un día
+    corte = dias['cliente'].ne(dias['cliente'].shift()) | dias['dia'].diff().ne(pd.Timedelta(days=1))
+    rachas = dias.groupby([dias['cliente'], corte.cumsum()]).size()
+    return rachas.groupby(level=0).max().astype(float)
+
+
+def metricas_clientes(resumen_cartera, racha, hoy=None):
+    """Matriz clientes × métricas a partir del resumen de cartera y de la racha de días con saldo."""
+    hoy = pd.Timestamp(hoy or pd.Timestamp.today()).normalize()
+    cuentas = resumen_cartera.set_index('Cliente')
+    facturado = cuentas['Facturado'].astype(float)
+    pagado = cuentas['Pagado'].astype(float)
+    return pd.DataFrame({
+        'saldo': cuentas['Pendiente'].astype(float),
+        'facturado': facturado,
+        'pagado': pagado,
+        'ratio_pago': (pagado / facturado).where(facturado != 0, 1.0),
+        'racha_dias_saldo': racha.reindex(cuentas.index).fillna(0.0),
+        'dias_mora': (hoy - pd.to_datetime(cuentas['Impaga_Mas_Antigua'])).dt.days.fillna(0).astype(float),
+        'dias_sin_compra': (hoy - pd.to_datetime(cuentas['Ultima_Venta'])).dt.days.astype(float),
+    })
+
+
+def evaluar(reglas, metricas):
+    """Evalúa todas las reglas a la vez: devuelve (cumple clientes × reglas, valores, puntaje, prioridad)."""
+    clientes = metricas.index
+    valores = metricas[reglas['metricas']].to_numpy()
+    umbrales = np.broadcast_to(reglas['umbrales'], valores.shape).copy()
+    propios = reglas['umbrales_cliente'].reindex(clientes).to_numpy()
+    umbrales = np.where(np.isnan(propios), umbrales, propios)
+    cumple = np.zeros(valores.shape, dtype=bool)
+    for simbolo in np.unique(reglas['operadores']):
+        columnas = reglas['operadores'] == simbolo
+        cumple[:, columnas] = OPERADORES[simbolo](valores[:, columnas], umbrales[:, columnas])
+    cumple &= ~np.isnan(valores)
+    inactivas = reglas['inactivas_cliente'].reindex(clientes).fillna(False).to_numpy(dtype=bool)
+    cumple &= ~inactivas
+    puntaje = cumple.astype(float) @ reglas['pesos']
+    prioridad = np.select(
+        [puntaje >= minimo for minimo in reglas['puntajes']], reglas['prioridades'], default=''
+    ) if reglas['prioridades'] else np.full(len(clientes), '')
+    return cumple, valores, puntaje, prioridad
+
+
+def analizar(resumen_cartera, clientes_con_saldo, fechas_con_saldo, hoy=None, reglas=None):
+    """DataFrame de alertas (una fila por cliente que cumple alguna regla)."""
+    if resumen_cartera.empty:
+        return pd.DataFrame(columns=COLUMNAS_ALERTAS)
+    reglas = cargar_reglas() if reglas is None else reglas
+    metricas = metricas_clientes(resumen_cartera, racha_maxima(clientes_con_saldo, fechas_con_saldo), hoy)
+    cumple, valores, _, prioridad = evaluar(reglas, metricas)
+    alerta = cumple.any(axis=1)
+    if not alerta.any():
+        return pd.DataFrame(columns=COLUMNAS_ALERTAS)
+    # Solo el texto de los motivos se arma por elemento, y solo para las reglas que se cumplen
+    motivos = np.full((alerta.sum(), len(reglas['nombres'])), '', dtype=object)
+    for j, plantilla in enumerate(reglas['motivos']):
+        filas = cumple[alerta, j]
+        motivos[filas, j] = [plantilla.format(valor=v) for v in valores[alerta, j][filas]]
+    ultima = pd.to_datetime(resumen_cartera['Ultima_Venta'].to_numpy()[alerta])
+    return pd.DataFrame({
+        'Cliente': metricas.index[alerta],
+        'Saldo_Total': metricas['saldo'].to_numpy()[alerta],
+        'Ultima_Venta': ultima.strftime('%Y-%m-%d').fillna(''),
+        'Motivo_Alerta': [' | '.join(m for m in fila if m) for fila in motivos],
+        'Prioridad': prioridad[alerta],
+    })[COLUMNAS_ALERTAS]
@@ -0,0 +1,318 @@
+"""API HTTP/JSON local, de solo lectura, sobre las tablas y los saldos.
+
+Uso: python api.py [--host 127.0.0.1] [--port 8600]
+
+Rutas (todas GET; todas aceptan ?sucursal=, por defecto la principal, ver sucursales.py):
+    /api/sucursales                         sucursales configuradas
+    /api/tablas                             tablas disponibles y su cantidad de filas
+    /api/<tabla>?desde=&hasta=&pagina=&por_pagina=&orden=desc&<grupo>=
+                                            filas de proveedores, depositos, notas_debito,
+                                            ventas o gastos; <grupo> filtra por proveedor,
+                                            empresa, cliente o gasto según la tabla
+    /api/saldos/clientes                    cartera de clientes (facturado, pagado, pendiente)
+    /api/saldos/proveedores                 cargos, abonos y saldo por proveedor
+    /api/saldos/diarios?desde=&hasta=       Saldo diario y Saldo Acumulado por fecha
+
+Cada tabla se lee una vez y queda en memoria, compartida por todos los hilos del
+servidor; se vuelve a leer solo cuando cambia su firma en disco (alguien guardó).
+Las tablas en memoria son por sucursal, bajo el mismo presupuesto de memoria que
+la aplicación (se descartan primero las sucursales consultadas hace más tiempo).
+Ventas y gastos usan la misma caché que la aplicación (ventas_gastos.obtener_tabla).
+La ETag de cada respuesta sale de las firmas de lo que consulta, así que un
+cliente que repite la consulta con If-None-Match recibe 304 sin recalcular nada.
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+import cartera
+import particiones
+import sucursales
+import ventas_gastos
+
+POR_PAGINA = 100
+MAX_POR_PAGINA = 1000
+# Respuestas ya calculadas por ETag (las más recientes)
+MAX_RESPUESTAS = 256
+# Mismo saldo inicial por defecto que la página principal, si la sucursal no define el suyo
+SALDO_INICIAL = 176.01
+
+_bloqueo = threading.Lock()
+# Por sucursal: tabla -> {'firma': firma de las particiones, 'df': filas ordenadas por fecha,
+#                         'fechas': datetime64 ordenadas}
+_instantaneas = sucursales.CacheSucursales(
+    dict, lambda tablas: sum(int(datos['df'].memory_usage(deep=True).sum()) for datos in tablas.values())
+)
+_respuestas = OrderedDict()
+
+
+class ErrorConsulta(Exception):
+    """Consulta inválida; se responde con 400 y el mensaje."""
+
+
+# --- Instantáneas en memoria ---
+def _leer_filas(tabla):
+    """Historial completo de una tabla: de la caché compartida para ventas y gastos, de las particiones para el resto."""
+    if tabla in ventas_gastos.TABLAS:
+        return ventas_gastos.obtener_tabla(tabla)
+    return particiones.leer_meses(tabla)
+
+
+def instantanea(tabla, firma=None):
+    """Filas de una tabla ordenadas por fecha, releídas solo si cambió la firma de sus particiones."""
+    firma = particiones.firma_tabla(tabla) if firma is None else firma
+    with _bloqueo:
+        actual = _instantaneas.obtener().get(tabla)
+        if actual is not None and np.array_equal(actual['firma'], firma):
+            return actual
+    df = _leer_filas(tabla)
+    columna = particiones.TABLAS[tabla]['fecha']
+    fechas = pd.to_datetime(df[columna], errors='coerce') if not df.empty else pd.Series(dtype='datetime64[ns]')
+    orden = np.argsort(fechas.to_numpy(), kind='stable')
+    df = df.iloc[orden].reset_index(drop=True)
+    if not df.empty:
+        df[columna] = fechas.iloc[orden].dt.strftime('%Y-%m-%d').to_numpy()
+    actual = {'firma': firma, 'df': df, 'fechas': fechas.to_numpy()[orden]}
+    with _bloqueo:
+        _instantaneas.obtener()[tabla] = actual
+    _instantaneas.podar()
+    return actual
+
+
+# --- Consultas ---
+def _fecha_param(params, nombre):
+    valor = params.get(nombre)
+    if not valor:
+        return None
+    try:
+        return np.datetime64(pd.Timestamp(valor).normalize(), 'ns')
+    except ValueError:
+        raise ErrorConsulta(f"Fecha inválida en '{nombre}': {valor}")
+
+
+def _entero_param(params, nombre, defecto, minimo, maximo):
+    try:
+        valor = int(params.get(nombre, defecto))
+    except ValueError:
+        raise ErrorConsulta(f"'{nombre}' debe ser un número entero.")
+    if not minimo <= valor <= maximo:
+        raise ErrorConsulta(f"'{nombre}' debe estar entre {minimo} y {maximo}.")
+    return valor
+
+
+def _rango(fechas, params):
+    """Posiciones [desde, hasta) de las fechas ordenadas dentro del rango pedido (búsqueda binaria)."""
+    desde, hasta = _fecha_param(params, 'desde'), _fecha_param(params, 'hasta')
+    inicio = np.searchsorted(fechas, desde, side='left') if desde is not None else 0
+    # Las fechas vacías (NaT) quedan al final; sin 'hasta' se excluyen igual que con él
+    validas = len(fechas) - int(np.isnat(fechas).sum()) if len(fechas) else 0
+    fin = np.searchsorted(fechas[:validas], hasta + np.timedelta64(1, 'D'), side='left') if hasta is not None else validas
+    return inicio, max(inicio, fin)
+
+
+def _pagina(df, params):
+    """Corta una página del DataFrame y arma el cuerpo JSON con el total de filas."""
+    por_pagina = _entero_param(params, 'por_pagina', POR_PAGINA, 1, MAX_POR_PAGINA)
+    pagina = _entero_param(params, 'pagina', 1, 1, 10 ** 9)
+    if params.get('orden') == 'desc':
+        df = df.iloc[::-1]
+    filas = df.iloc[(pagina - 1) * por_pagina: pagina * por_pagina]
+    encabezado = json.dumps({'total': len(df), 'pagina': pagina, 'por_pagina': por_pagina})
+    return encabezado[:-1] + ', "filas": ' + filas.to_json(orient='records', date_format='iso', force_ascii=False) + '}'
+
+
+def consultar_tabla(tabla, params):
+    """Página de filas de una tabla filtradas por fechas y por su columna de grupo."""
+    datos = instantanea(tabla)
+    inicio, fin = _rango(datos['fechas'], params)
+    df = datos['df'].iloc[inicio:fin]
+    grupo = particiones.TABLAS[tabla]['grupo']
+    if grupo and params.get(grupo.lower()):
+        df = df[df[grupo].isin(params[grupo.lower()].split(','))]
+    return _pagina(df, params)
+
+
+def saldos_clientes(params):
+    """Cartera de clientes como página JSON."""
+    resumen = cartera.resumen_cartera(ventas_gastos.obtener_cartera())
+    return _pagina(resumen.sort_values('Pendiente', ascending=False), params)
+
+
+def saldos_proveedores(params):
+    """Cargos, abonos y saldo (abonos menos cargos) acumulados por proveedor."""
+    estado = particiones.leer_estado_proveedores()
+    if estado is None or estado.empty:
+        return _pagina(pd.DataFrame(columns=['Proveedor', 'Cargo', 'Abono', 'Saldo']), params)
+    resumen = estado.groupby('Proveedor')[['Cargo', 'Abono']].sum().reset_index()
+    resumen['Saldo'] = resumen['Abono'] - resumen['Cargo']
+    return _pagina(resumen, params)
+
+
+def saldos_diarios(params):
+    """Saldo diario y Saldo Acumulado de proveedores por fecha.
+
+    El Saldo Acumulado guardado en las filas queda viejo en los meses que ninguna
+    sesión cargó después de un cambio en meses anteriores, así que se rehace: saldo
+    inicial, más las sumas mensuales de _saldos.pkl de los meses anteriores, más
+    el Saldo diario de cada día del mes hasta esa fecha.
+    """
+    datos = instantanea('proveedores')
+    inicio, fin = _rango(datos['fechas'], params)
+    operaciones = datos['df'].iloc[inicio:fin]
+    operaciones = operaciones[operaciones['Proveedor'] != 'BALANCE_INICIAL']
+    saldos = particiones.leer_saldos()
+    if saldos is not None:
+        saldos = saldos[saldos.index != particiones.MES_SIN_FECHA].sort_index()
+    if saldos is None or operaciones.empty:
+        primero = 0  # Sin sumas mensuales se acumula desde el principio
+    else:
+        # El acumulado de un día necesita los días anteriores de su mes
+        mes = operaciones['Fecha'].iloc[0][:7]
+        primero = int(np.searchsorted(datos['fechas'], np.datetime64(f'{mes}-01', 'ns'), side='left'))
+    df = datos['df'].iloc[primero:fin]
+    df = df[df['Proveedor'] != 'BALANCE_INICIAL']
+    diarios = df.groupby('Fecha', sort=True).agg(**{'Saldo diario': ('Saldo diario', 'last')}).reset_index()
+    diarios['Saldo diario'] = pd.to_numeric(diarios['Saldo diario'], errors='coerce').fillna(0.0)
+    meses = diarios['Fecha'].str[:7]
+    en_el_mes = diarios.groupby(meses)['Saldo diario'].cumsum()
+    if saldos is None:
+        anteriores = diarios['Saldo diario'].cumsum() - en_el_mes
+    else:
+        acumulados = np.concatenate([[0.0], saldos.cumsum().to_numpy()])
+        anteriores = acumulados[np.searchsorted(saldos.index.to_numpy(), meses.to_numpy(), side='left')]
+    diarios['Saldo Acumulado'] = sucursales.valor('saldo_inicial', SALDO_INICIAL) + anteriores + en_el_mes
+    if not operaciones.empty:
+        diarios = diarios[diarios['Fecha'] >= operaciones['Fecha'].iloc[0]]
+    return _pagina(diarios.reset_index(drop=True), params)
+
+
+def _mtime(ruta):
+    try:
+        return os.stat(ruta).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+# ruta -> (función(params) -> cuerpo JSON, función() -> lo que invalida la respuesta)
+RUTAS = {
+    **{
+        f'/api/{tabla}': (lambda params, tabla=tabla: consultar_tabla(tabla, params),
+                          lambda tabla=tabla: particiones.firma_tabla(tabla).tolist())
+        for tabla in particiones.TABLAS
+    },
+    '/api/saldos/clientes': (saldos_clientes, lambda: particiones.firma_tabla('ventas').tolist()),
+    '/api/saldos/proveedores': (
+        saldos_proveedores, lambda: _mtime(particiones.ruta_particiones(particiones.ESTADO_PROVEEDORES_FILE))
+    ),
+    '/api/saldos/diarios': (saldos_diarios, lambda: [
+        particiones.firma_tabla('proveedores').tolist(), _mtime(particiones.ruta_particiones(particiones.SALDOS_FILE))
+    ]),
+}
+
+
+def listar_tablas(params):
+    """Tablas disponibles con su cantidad de filas."""
+    return json.dumps({'tablas': [
+        {'tabla': tabla, 'filas': len(instantanea(tabla)['df']), 'ruta': f'/api/{tabla}'}
+        for tabla in particiones.TABLAS
+    ]})
+
+
+def listar_sucursales(params):
+    """Sucursales configuradas con su nombre."""
+    return json.dumps({'sucursales': [
+        {'sucursal': sucursal, 'nombre': sucursales.nombre(sucursal)} for sucursal in sucursales.listar()
+    ]}, ensure_ascii=False)
+
+
+RUTAS['/api/tablas'] = (listar_tablas, lambda: [particiones.firma_tabla(t).tolist() for t in particiones.TABLAS])
+RUTAS['/api/sucursales'] = (listar_sucursales, lambda: sucursales.listar())
+
+
+def responder(ruta, params):
+    """(etag, cuerpo) de una consulta; el cuerpo se calcula solo si su ETag no está en caché."""
+    funcion, dependencias = RUTAS[ruta]
+    clave = json.dumps([sucursales.actual(), ruta, sorted(params.items()), dependencias()])
+    etag = '"' + hashlib.sha1(clave.encode('utf-8')).hexdigest() + '"'
+    with _bloqueo:
+        if etag in _respuestas:
+            _respuestas.move_to_end(etag)
+            return etag, _respuestas[etag]
+    cuerpo = funcion(params).encode('utf-8')
+    with _bloqueo:
+        _respuestas[etag] = cuerpo
+        while len(_respuestas) > MAX_RESPUESTAS:
+            _respuestas.popitem(last=False)
+    return etag, cuerpo
+
+
+# --- Servidor ---
+class ManejadorAPI(BaseHTTPRequestHandler):
+    """Atiende las rutas GET de RUTAS."""
+
+    server_version = 'NovenoAPI/1.0'
+
+    def do_GET(self):
+        partes = urlsplit(self.path)
+        ruta = partes.path.rstrip('/')
+        if ruta not in RUTAS:
+            self._enviar(404, json.dumps({'error': f'Ruta desconocida: {ruta}'}).encode('utf-8'))
+            return
+        params = {clave: valores[-1] for clave, valores in parse_qs(partes.query).items()}
+        sucursal = params.pop('sucursal', None)
+        if sucursal is not None and sucursal not in sucursales.listar():
+            self._enviar(400, json.dumps({'error': f'Sucursal desconocida: {sucursal}'}, ensure_ascii=False).encode('utf-8'))
+            return
+        sucursales.activar(sucursal)
+        try:
+            etag, cuerpo = responder(ruta, params)
+        except ErrorConsulta as e:
+            self._enviar(400, json.dumps({'error': str(e)}, ensure_ascii=False).encode('utf-8'))
+            return
+        if etag in (self.headers.get('If-None-Match') or ''):
+            self._enviar(304, b'', etag)
+            return
+        self._enviar(200, cuerpo, etag)
+
+    def _enviar(self, estado, cuerpo, etag=None):
+        self.send_response(estado)
+        if etag:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+        if estado != 304:
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        if estado != 304:
+            self.wfile.write(cuerpo)
+
+    def log_message(self, formato, *args):
+        pass
+
+
+def crear_servidor(host='127.0.0.1', puerto=8600):
+    """Servidor HTTP con un hilo por conexión (sin iniciar)."""
+    return ThreadingHTTPServer((host, puerto), ManejadorAPI)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='API JSON de solo lectura sobre las tablas y los saldos.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8600)
+    args = parser.parse_args()
+    servidor = crear_servidor(args.host, args.port)
+    print(f'API escuchando en http://{args.host}:{args.port}/api/tablas')
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
@@ -0,0 +1,122 @@
+"""Caché de arranque del proceso: datos ya preparados para las sesiones nuevas.
+
+Cada sesión nueva de la página principal necesita las tablas de proveedores,
+depósitos y notas de débito de los meses cargados, con la fila BALANCE_INICIAL y
+los saldos ya recalculados, y el estado de cuenta por proveedor. Prepararlas es
+el mismo trabajo para cada dispositivo que abre la aplicación, así que la primera
+sesión del proceso publica aquí el resultado y las siguientes con el mismo rango
+de meses reciben una copia sin leer ni recalcular nada.
+
+Cada sesión que cambia esas tablas vuelve a publicar sus datos ya recalculados
+(y descarta los de otros rangos, que quedaron viejos). Como en ventas_gastos.py,
+la firma de las particiones se toma cuando terminan de escribirse; si después
+cambia por una escritura ajena al proceso, el rango se descarta y la siguiente
+sesión arranca en frío.
+
+También guarda el tiempo hasta la primera vista de las sesiones del proceso, en
+frío y desde la caché, para mostrarlo en la interfaz.
+"""
+import threading
+from collections import OrderedDict, deque
+
+import numpy as np
+import pandas as pd
+
+import escritura_diferida
+import particiones
+import sucursales
+
+TABLAS = ('proveedores', 'depositos', 'notas_debito')
+# Rangos de meses distintos por sucursal (casi todas las sesiones usan el de la semana actual)
+MAX_RANGOS = 4
+MAX_MEDICIONES = 200
+TIPOS_ARRANQUE = {'fria': 'En frío', 'tibia': 'Desde la caché'}
+
+_bloqueo = threading.RLock()
+
+
+def _tamano_sucursal(rangos):
+    """Bytes aproximados de los datos preparados de una sucursal."""
+    return sum(
+        int(df.memory_usage(deep=True).sum()) for entrada in rangos.values() for df in entrada['datos'].values()
+    )
+
+
+# Por sucursal: meses cargados (frozenset) -> {'datos': {clave de session_state: DataFrame}, 'firma': firma o None}
+_cache = sucursales.CacheSucursales(OrderedDict, _tamano_sucursal)
+# Segundos hasta la primera vista de las últimas sesiones, por tipo de arranque
+_mediciones = {tipo: deque(maxlen=MAX_MEDICIONES) for tipo in TIPOS_ARRANQUE}
+
+
+def _firma():
+    return np.concatenate([particiones.firma_tabla(tabla) for tabla in TABLAS])
+
+
+def _sin_escrituras_pendientes():
+    return all(escritura_diferida.esperar(tabla, timeout=0) for tabla in TABLAS)
+
+
+def publicar(meses, datos, cambio=False):
+    """Guarda una copia de los datos preparados de una sesión para las sesiones nuevas con los mismos meses.
+
+    datos: {clave de session_state: DataFrame}. cambio=True si la sesión modificó
+    las tablas: los datos preparados de otros rangos se descartan.
+    """
+    clave = frozenset(meses)
+    copias = {nombre: df.copy() for nombre, df in datos.items()}
+    with _bloqueo:
+        rangos = _cache.obtener()
+        if cambio:
+            rangos.clear()
+        # Con escrituras pendientes la firma se toma al terminar (ver obtener)
+        rangos[clave] = {'datos': copias, 'firma': _firma() if _sin_escrituras_pendientes() else None}
+        rangos.move_to_end(clave)
+        while len(rangos) > MAX_RANGOS:
+            rangos.popitem(last=False)
+        _cache.podar()
+
+
+def obtener(meses):
+    """Copia de los datos preparados para esos meses, o None si no hay o quedaron desactualizados."""
+    clave = frozenset(meses)
+    with _bloqueo:
+        rangos = _cache.obtener()
+        entrada = rangos.get(clave)
+        if entrada is None:
+            return None
+        # Con escrituras propias pendientes manda la memoria; si no, se revisa la firma en disco
+        if _sin_escrituras_pendientes():
+            firma = _firma()
+            if entrada['firma'] is None:
+                entrada['firma'] = firma
+            elif not np.array_equal(entrada['firma'], firma):
+                del rangos[clave]
+                return None
+        rangos.move_to_end(clave)
+        return {nombre: df.copy() for nombre, df in entrada['datos'].items()}
+
+
+def descartar(sucursal=None):
+    """Descarta los datos preparados de una sucursal (la activa por defecto), por ejemplo al restaurar un respaldo."""
+    _cache.descartar(sucursal)
+
+
+def registrar_tiempo(tipo, segundos):
+    """Anota el tiempo hasta la primera vista de una sesión ('fria' o 'tibia')."""
+    with _bloqueo:
+        _mediciones[tipo].append(segundos)
+
+
+def metricas():
+    """Sesiones, mediana, p95 y último tiempo hasta la primera vista por tipo de arranque (en segundos)."""
+    with _bloqueo:
+        mediciones = {tipo: list(valores) for tipo, valores in _mediciones.items()}
+    filas = []
+    for tipo, valores in mediciones.items():
+        if valores:
+            filas.append({
+                'Arranque': TIPOS_ARRANQUE[tipo], 'Sesiones': len(valores),
+                'Mediana (s)': float(np.median(valores)), 'p95 (s)': float(np.percentile(valores, 95)),
+                'Última (s)': valores[-1],
+            })
+    return pd.DataFrame(filas, columns=['Arranque', 'Sesiones', 'Mediana (s)', 'p95 (s)', 'Última (s)'])
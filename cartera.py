@@ -0,0 +1,250 @@
+"""Cartera de clientes (cuentas por cobrar) mantenida de forma incremental.
+
+Por cliente se guarda el total facturado, el total pagado, el saldo pendiente,
+la última venta y la venta impaga más antigua. Cada venta agregada, editada o
+eliminada ajusta solo los acumulados de su cliente; la cartera completa se
+reconstruye desde las particiones únicamente cuando su firma no coincide con la
+de la tabla de ventas (por ejemplo, si otra aplicación escribió entre medio).
+
+Cada cambio guarda solo las cuentas de los clientes que tocó: se agregan al final
+de un registro de cambios (_cartera_cambios.pkl) que, al leer, se aplica sobre la
+cartera completa (_cartera.pkl). Cuando el registro ya pesa más que la cartera
+completa se compacta en ella, así que escribir cuesta lo mismo por cambio sin
+importar cuántos clientes haya.
+
+Con la escritura diferida activa, la cartera se guarda en la misma cola que las
+particiones y después de ellas, para que la firma guardada sea la de las ventas
+ya escritas; los cambios que se acumulan en la cola salen en una sola escritura.
+"""
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+import escritura_diferida
+import particiones
+
+CARTERA_FILE = '_cartera.pkl'
+CAMBIOS_FILE = '_cartera_cambios.pkl'
+COLUMNAS_CARTERA = ['Cliente', 'Facturado', 'Pagado', 'Pendiente', 'Ultima_Venta', 'Impaga_Mas_Antigua']
+
+
+def _cuenta_vacia():
+    """Acumulados iniciales de un cliente."""
+    # fechas: fecha -> [ventas ese día, ventas impagas ese día], para mantener los extremos
+    return {'facturado': 0.0, 'pagado': 0.0, 'pendiente': 0.0,
+            'ultima_venta': None, 'impaga_mas_antigua': None, 'fechas': {}}
+
+
+def _fecha(valor):
+    """Convierte una fecha de venta en date (o None si no es válida)."""
+    fecha = pd.to_datetime(valor, errors='coerce')
+    return None if pd.isna(fecha) else fecha.date()
+
+
+def _numero(valor):
+    """Convierte un importe en float (0 si no es válido)."""
+    numero = pd.to_numeric(valor, errors='coerce')
+    return 0.0 if pd.isna(numero) else float(numero)
+
+
+def construir_cartera(df_ventas):
+    """Calcula la cartera completa a partir de un DataFrame de ventas (formato de archivo)."""
+    cartera = {'firma': particiones.firma_tabla('ventas'), 'clientes': {}}
+    if df_ventas.empty:
+        return cartera
+    df = pd.DataFrame({
+        'cliente': df_ventas['cliente'],
+        'fecha': pd.to_datetime(df_ventas['fecha'], errors='coerce').dt.date,
+        'facturado': pd.to_numeric(df_ventas['total_a_cobrar'], errors='coerce').fillna(0.0),
+        'pagado': pd.to_numeric(df_ventas['pago_cliente'], errors='coerce').fillna(0.0),
+        'pendiente': pd.to_numeric(df_ventas['saldo'], errors='coerce').fillna(0.0),
+    })
+    df['impaga'] = (df['pendiente'] > 0).astype(int)
+    totales = df.groupby('cliente')[['facturado', 'pagado', 'pendiente']].sum()
+    por_dia = df.dropna(subset=['fecha']).groupby(['cliente', 'fecha']).agg(
+        ventas=('impaga', 'size'), impagas=('impaga', 'sum')
+    )
+    for cliente, fila in totales.iterrows():
+        cuenta = _cuenta_vacia()
+        cuenta.update(facturado=float(fila['facturado']), pagado=float(fila['pagado']),
+                      pendiente=float(fila['pendiente']))
+        cartera['clientes'][cliente] = cuenta
+    for (cliente, fecha), fila in por_dia.iterrows():
+        cartera['clientes'][cliente]['fechas'][fecha] = [int(fila['ventas']), int(fila['impagas'])]
+    for cuenta in cartera['clientes'].values():
+        _recalcular_extremos(cuenta)
+    return cartera
+
+
+def _recalcular_extremos(cuenta):
+    """Recalcula la última venta y la impaga más antigua a partir de los días del cliente."""
+    fechas = cuenta['fechas']
+    cuenta['ultima_venta'] = max(fechas) if fechas else None
+    impagas = [fecha for fecha, (_, n_impagas) in fechas.items() if n_impagas > 0]
+    cuenta['impaga_mas_antigua'] = min(impagas) if impagas else None
+
+
+def registrar_venta(cartera, venta, signo=1):
+    """Suma (signo=1) o resta (signo=-1) una venta de la cuenta de su cliente."""
+    cliente = venta.get('cliente')
+    if cliente is None or pd.isna(cliente):
+        return
+    cuenta = cartera['clientes'].setdefault(cliente, _cuenta_vacia())
+    pendiente = _numero(venta.get('saldo'))
+    cuenta['facturado'] += signo * _numero(venta.get('total_a_cobrar'))
+    cuenta['pagado'] += signo * _numero(venta.get('pago_cliente'))
+    cuenta['pendiente'] += signo * pendiente
+
+    fecha = _fecha(venta.get('fecha'))
+    if fecha is None:
+        return
+    dia = cuenta['fechas'].setdefault(fecha, [0, 0])
+    dia[0] += signo
+    dia[1] += signo * int(pendiente > 0)
+    if signo > 0:
+        if cuenta['ultima_venta'] is None or fecha > cuenta['ultima_venta']:
+            cuenta['ultima_venta'] = fecha
+        if pendiente > 0 and (cuenta['impaga_mas_antigua'] is None or fecha < cuenta['impaga_mas_antigua']):
+            cuenta['impaga_mas_antigua'] = fecha
+        return
+    # Al quitar, los extremos solo cambian si se vació el día que los definía
+    if dia[0] <= 0:
+        del cuenta['fechas'][fecha]
+    if fecha == cuenta['ultima_venta'] or (fecha == cuenta['impaga_mas_antigua'] and dia[1] <= 0):
+        _recalcular_extremos(cuenta)
+
+
+def _leer_guardada():
+    """Cartera guardada con su registro de cambios aplicado, o None si no existe o no se puede leer."""
+    try:
+        with open(particiones.ruta_particiones(CARTERA_FILE), 'rb') as f:
+            cartera = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        return None
+    try:
+        with open(particiones.ruta_particiones(CAMBIOS_FILE), 'rb') as f:
+            while True:
+                cambio = pickle.load(f)
+                cartera['clientes'].update(cambio['clientes'])
+                cartera['firma'] = cambio['firma']
+    except FileNotFoundError:
+        pass
+    except (EOFError, pickle.UnpicklingError, AttributeError):
+        pass  # Fin del registro (o un cambio a medio escribir: la firma ya no coincidirá)
+    return cartera
+
+
+def cargar_cartera():
+    """Lee la cartera guardada; si no existe o está desactualizada, la reconstruye desde las particiones."""
+    escritura_diferida.esperar('cartera')
+    cartera = _leer_guardada()
+    if cartera is not None and np.array_equal(cartera.get('firma'), particiones.firma_tabla('ventas')):
+        return cartera
+    cartera = construir_cartera(particiones.leer_meses('ventas'))
+    guardar_cartera(cartera)
+    return cartera
+
+
+def _escribir_completa(firma, clientes):
+    """Reemplaza la cartera completa y vacía el registro de cambios."""
+    ruta = particiones.ruta_particiones(CARTERA_FILE)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    with open(ruta + '.tmp', 'wb') as f:
+        pickle.dump({'firma': firma, 'clientes': clientes}, f)
+    # El registro se borra antes: sus cambios no deben aplicarse sobre la cartera nueva
+    if os.path.exists(particiones.ruta_particiones(CAMBIOS_FILE)):
+        os.remove(particiones.ruta_particiones(CAMBIOS_FILE))
+    os.replace(ruta + '.tmp', ruta)
+
+
+def _escribir_cartera(cartera, operaciones):
+    """Escribe las operaciones con la firma actual de la tabla de ventas.
+
+    Cada operación es ('completa', clientes serializados) o ('cambios', {cliente: cuenta}).
+    Los cambios posteriores a la última completa se agregan al registro en un solo bloque.
+    """
+    firma = particiones.firma_tabla('ventas')
+    cambios = None
+    for tipo, datos in operaciones:
+        if tipo == 'completa':
+            _escribir_completa(firma, pickle.loads(datos))
+            cambios = None
+        else:
+            cambios = {**(cambios or {}), **datos}
+    # Sin cartera completa no hay a qué agregar: la próxima lectura la reconstruye
+    if cambios is not None and os.path.exists(particiones.ruta_particiones(CARTERA_FILE)):
+        ruta = particiones.ruta_particiones(CAMBIOS_FILE)
+        # Aun sin clientes tocados se agrega el bloque: guarda la firma de las ventas ya escritas
+        with open(ruta, 'ab') as f:
+            pickle.dump({'firma': firma, 'clientes': cambios}, f)
+        # Compactar cuando el registro pesa más que la cartera completa: el costo se reparte entre los cambios
+        if os.path.getsize(ruta) > os.path.getsize(particiones.ruta_particiones(CARTERA_FILE)):
+            guardada = _leer_guardada()
+            _escribir_completa(guardada['firma'], guardada['clientes'])
+    cartera['firma'] = firma
+
+
+def _combinar_operaciones(anteriores, nuevos):
+    """Combina dos escrituras de la cartera pendientes en la cola: las operaciones en orden."""
+    return anteriores[0], anteriores[1] + nuevos[1]
+
+
+def _programar(cartera, operaciones):
+    """Escribe las operaciones de inmediato, o en la cola si la escritura es diferida."""
+    if not escritura_diferida.activa():
+        escritura_diferida.esperar('cartera')  # Una cartera aún en cola no debe escribirse después de esta
+    # Al final de la cola: la firma guardada debe ser la de las ventas encoladas antes que este cambio
+    escritura_diferida.encolar(
+        'cartera', _escribir_cartera, (cartera, operaciones), combinar=_combinar_operaciones, al_final=True
+    )
+
+
+def guardar_cartera(cartera):
+    """Guarda la cartera completa con la firma de la tabla de ventas (en segundo plano si la escritura es diferida)."""
+    # Se serializa ya: los cambios posteriores en memoria no deben colarse en esta escritura
+    _programar(cartera, [('completa', pickle.dumps(cartera['clientes']))])
+
+
+def _copiar_cuenta(cuenta):
+    """Copia de una cuenta que no cambia con los ajustes posteriores en memoria."""
+    return {**cuenta, 'fechas': {fecha: list(dia) for fecha, dia in cuenta['fechas'].items()}}
+
+
+def aplicar_cambios(cartera, quitar=None, agregar=None):
+    """Aplica a la cartera las ventas quitadas y agregadas por una escritura y guarda solo los clientes tocados.
+
+    Quien llama comprueba que la cartera estaba al día antes de esa escritura (ver
+    aplicar_cambios_cartera en ventas_gastos.py); no se consulta el disco, así que no
+    espera a que se escriban las ventas.
+    """
+    tocados = set()
+    for ventas, signo in ((quitar, -1), (agregar, 1)):
+        if ventas is None:
+            continue
+        if isinstance(ventas, pd.DataFrame):
+            ventas = ventas.to_dict('records')
+        for venta in ventas:
+            registrar_venta(cartera, venta, signo)
+            tocados.add(venta.get('cliente'))
+    cuentas = {cliente: _copiar_cuenta(cartera['clientes'][cliente]) for cliente in tocados if cliente in cartera['clientes']}
+    _programar(cartera, [('cambios', cuentas)])
+    return cartera
+
+
+def resumen_cartera(cartera):
+    """DataFrame con una fila por cliente con saldo o ventas registradas."""
+    filas = [
+        {
+            'Cliente': cliente,
+            'Facturado': round(cuenta['facturado'], 2),
+            'Pagado': round(cuenta['pagado'], 2),
+            'Pendiente': round(cuenta['pendiente'], 2),
+            'Ultima_Venta': cuenta['ultima_venta'],
+            'Impaga_Mas_Antigua': cuenta['impaga_mas_antigua'],
+        }
+        for cliente, cuenta in cartera['clientes'].items()
+        if cuenta['fechas'] or round(cuenta['pendiente'], 2) != 0
+    ]
+    return pd.DataFrame(filas, columns=COLUMNAS_CARTERA)
@@ -0,0 +1,177 @@
+"""Conciliación de depósitos con las compras a proveedores (FIFO).
+
+Cada abono de un proveedor (depósito, nota de débito o saldo a favor de meses no
+cargados) paga sus compras de la más antigua a la más nueva, sin importar la
+fecha: un depósito del día siguiente paga la compra del día anterior. Por
+proveedor, las compras ocupan tramos consecutivos [inicio, fin) del total
+comprado y los abonos tramos consecutivos del total abonado, ambos con sumas
+acumuladas; lo pagado de cada compra es la parte de su tramo que cubre el total
+abonado, y cada cruce de un tramo de abono con uno de compra es una asignación.
+No hay bucles por fila: todo sale de cumsum y searchsorted.
+
+Los movimientos son los del estado de cuenta (ver calcular_movimientos_proveedores
+en la página principal): columnas Fecha, Proveedor, Movimiento, Referencia,
+Cargo, Abono y Orden. Los cargos son compras y los abonos, pagos.
+
+Las compras de un proveedor solo dependen de sus propios movimientos, así que
+actualizar() recalcula únicamente los proveedores cuya huella (hash de sus
+movimientos) cambió: un depósito nuevo vuelve a conciliar solo a su proveedor.
+"""
+import numpy as np
+import pandas as pd
+
+# Diferencias menores (redondeo de centavos) no dejan una compra abierta
+TOLERANCIA = 0.005
+ESTADOS = ['Abierta', 'Parcial', 'Saldada']
+COLUMNAS_MOVIMIENTOS = ['Fecha', 'Proveedor', 'Movimiento', 'Referencia', 'Cargo', 'Abono', 'Orden']
+COLUMNAS_PROVEEDORES = ['Proveedor', 'Abiertas', 'Parciales', 'Saldadas', 'Comprado', 'Abonado', 'Pendiente', 'A favor']
+COLUMNAS_FACTURAS = ['Proveedor', 'Fecha', 'Referencia', 'Importe', 'Pagado', 'Pendiente', 'Estado']
+COLUMNAS_ASIGNACIONES = [
+    'Proveedor', 'Fecha abono', 'Movimiento', 'Referencia abono', 'Fecha compra', 'Referencia compra', 'Importe',
+]
+
+
+def _ordenar(movimientos):
+    """Movimientos por proveedor, fecha y orden del estado de cuenta (estable: respeta el orden de entrada)."""
+    movimientos = movimientos.assign(Fecha_orden=pd.to_datetime(movimientos['Fecha'], errors='coerce'))
+    movimientos = movimientos.sort_values(['Proveedor', 'Fecha_orden', 'Orden'], kind='mergesort', ignore_index=True)
+    return movimientos.drop(columns='Fecha_orden')
+
+
+def _tramos(importes, proveedores):
+    """(inicio, fin) de cada importe dentro del total acumulado de su proveedor."""
+    fin = importes.groupby(proveedores).cumsum().to_numpy()
+    return fin - importes.to_numpy(), fin
+
+
+def huellas(movimientos):
+    """Hash de los movimientos de cada proveedor (no depende del orden de las filas)."""
+    if movimientos.empty:
+        return pd.Series(dtype='uint64', name='Huella')
+    # Importes como float: el mismo movimiento da la misma huella aunque llegue como entero
+    columnas = movimientos[COLUMNAS_MOVIMIENTOS].astype({'Cargo': float, 'Abono': float, 'Orden': int})
+    hashes = pd.util.hash_pandas_object(columnas, index=False)
+    return hashes.groupby(movimientos['Proveedor'].to_numpy()).sum().rename('Huella')
+
+
+def conciliar(movimientos):
+    """Concilia los movimientos de todos los proveedores.
+
+    Devuelve {'proveedores', 'facturas', 'asignaciones'}: el resumen por
+    proveedor (con su huella), cada compra con lo pagado y su estado, y qué
+    abono pagó qué compra.
+    """
+    huellas_proveedores = huellas(movimientos)
+    movimientos = movimientos[COLUMNAS_MOVIMIENTOS].copy()
+    movimientos['Cargo'] = pd.to_numeric(movimientos['Cargo'], errors='coerce').fillna(0.0).astype(float)
+    movimientos['Abono'] = pd.to_numeric(movimientos['Abono'], errors='coerce').fillna(0.0).astype(float)
+    movimientos = _ordenar(movimientos)
+    compras = movimientos[movimientos['Cargo'] > 0].reset_index(drop=True)
+    abonos = movimientos[movimientos['Abono'] > 0].reset_index(drop=True)
+
+    inicio, fin = _tramos(compras['Cargo'], compras['Proveedor'])
+    abonado = abonos.groupby('Proveedor')['Abono'].sum()
+    total_abonado = compras['Proveedor'].map(abonado).fillna(0.0).to_numpy()
+    pagado = np.clip(total_abonado - inicio, 0.0, compras['Cargo'].to_numpy())
+    pendiente = compras['Cargo'].to_numpy() - pagado
+    estado = np.select(
+        [pendiente <= TOLERANCIA, pagado <= TOLERANCIA], ['Saldada', 'Abierta'], default='Parcial'
+    )
+    facturas = pd.DataFrame({
+        'Proveedor': compras['Proveedor'], 'Fecha': compras['Fecha'],
+        'Referencia': compras['Referencia'].where(compras['Movimiento'] == 'Compra', compras['Movimiento']),
+        'Importe': compras['Cargo'], 'Pagado': pagado, 'Pendiente': pendiente, 'Estado': estado,
+    }, columns=COLUMNAS_FACTURAS)
+
+    return {
+        'proveedores': _resumir(facturas, abonado, huellas_proveedores),
+        'facturas': facturas,
+        'asignaciones': _asignar(compras, inicio, fin, abonos),
+    }
+
+
+def _asignar(compras, inicio, fin, abonos):
+    """Cruza los tramos de abonos con los de compras: una fila por (abono, compra) con el importe cubierto."""
+    if compras.empty or abonos.empty:
+        return pd.DataFrame(columns=COLUMNAS_ASIGNACIONES)
+    abono_inicio, abono_fin = _tramos(abonos['Abono'], abonos['Proveedor'])
+    # Cada proveedor se corre a su propio segmento del eje, así los tramos de proveedores distintos no se cruzan
+    largo = pd.concat([
+        compras.groupby('Proveedor')['Cargo'].sum(), abonos.groupby('Proveedor')['Abono'].sum()
+    ], axis=1).fillna(0.0).max(axis=1)
+    desplazamiento = largo.cumsum() - largo
+    inicio = inicio + compras['Proveedor'].map(desplazamiento).to_numpy()
+    fin = fin + compras['Proveedor'].map(desplazamiento).to_numpy()
+    abono_inicio = abono_inicio + abonos['Proveedor'].map(desplazamiento).to_numpy()
+    abono_fin = abono_fin + abonos['Proveedor'].map(desplazamiento).to_numpy()
+
+    cortes = np.unique(np.concatenate([inicio, fin, abono_inicio, abono_fin]))
+    medios = (cortes[:-1] + cortes[1:]) / 2
+    compra = np.searchsorted(fin, medios, side='right')
+    abono = np.searchsorted(abono_fin, medios, side='right')
+    validos = (compra < len(fin)) & (abono < len(abono_fin))
+    validos[validos] &= (inicio[compra[validos]] <= medios[validos]) & (abono_inicio[abono[validos]] <= medios[validos])
+    importes = np.diff(cortes)[validos]
+    compra, abono = compra[validos], abono[validos]
+    # Los cortes de dos compras o abonos seguidos parten un mismo cruce solo si coinciden; se agrupan igual
+    cruces = pd.DataFrame({'compra': compra, 'abono': abono, 'Importe': importes}).groupby(
+        ['abono', 'compra'], as_index=False, sort=False
+    )['Importe'].sum()
+    cruces = cruces[cruces['Importe'] > TOLERANCIA]
+    filas_compra = compras.iloc[cruces['compra'].to_numpy()]
+    filas_abono = abonos.iloc[cruces['abono'].to_numpy()]
+    return pd.DataFrame({
+        'Proveedor': filas_abono['Proveedor'].to_numpy(),
+        'Fecha abono': filas_abono['Fecha'].to_numpy(),
+        'Movimiento': filas_abono['Movimiento'].to_numpy(),
+        'Referencia abono': filas_abono['Referencia'].to_numpy(),
+        'Fecha compra': filas_compra['Fecha'].to_numpy(),
+        'Referencia compra': filas_compra['Referencia'].where(
+            filas_compra['Movimiento'] == 'Compra', filas_compra['Movimiento']
+        ).to_numpy(),
+        'Importe': cruces['Importe'].to_numpy(),
+    }, columns=COLUMNAS_ASIGNACIONES)
+
+
+def _resumir(facturas, abonado, huellas_proveedores):
+    """Compras abiertas, parciales y saldadas, pendiente y saldo a favor por proveedor."""
+    conteos = pd.crosstab(facturas['Proveedor'], facturas['Estado']).reindex(columns=ESTADOS, fill_value=0)
+    comprado = facturas.groupby('Proveedor')['Importe'].sum()
+    resumen = pd.DataFrame(index=huellas_proveedores.index.rename('Proveedor'))
+    resumen['Abiertas'] = conteos['Abierta'].reindex(resumen.index, fill_value=0)
+    resumen['Parciales'] = conteos['Parcial'].reindex(resumen.index, fill_value=0)
+    resumen['Saldadas'] = conteos['Saldada'].reindex(resumen.index, fill_value=0)
+    resumen['Comprado'] = comprado.reindex(resumen.index, fill_value=0.0)
+    resumen['Abonado'] = abonado.reindex(resumen.index, fill_value=0.0)
+    resumen['Pendiente'] = facturas.groupby('Proveedor')['Pendiente'].sum().reindex(resumen.index, fill_value=0.0)
+    resumen['A favor'] = (resumen['Abonado'] - resumen['Comprado']).clip(lower=0.0)
+    resumen['Huella'] = huellas_proveedores
+    return resumen.reset_index().astype({c: int for c in ('Abiertas', 'Parciales', 'Saldadas')})
+
+
+def actualizar(anterior, movimientos):
+    """Conciliación al día con los movimientos, recalculando solo los proveedores que cambiaron.
+
+    anterior: resultado previo de conciliar/actualizar (o None). Devuelve
+    (conciliación, proveedores recalculados).
+    """
+    actuales = huellas(movimientos)
+    if anterior is None:
+        return conciliar(movimientos), list(actuales.index)
+    previas = anterior['proveedores'].set_index('Proveedor')['Huella']
+    comunes = actuales.index.intersection(previas.index)
+    iguales = comunes[actuales[comunes].to_numpy() == previas[comunes].to_numpy()]
+    cambiados = actuales.index.difference(iguales)
+    quitados = previas.index.difference(actuales.index)
+    if cambiados.empty and quitados.empty:
+        return anterior, []
+    nueva = conciliar(movimientos[movimientos['Proveedor'].isin(cambiados)])
+    descartar = cambiados.union(quitados)
+    resultado = {}
+    for parte, df in nueva.items():
+        conservadas = anterior[parte][~anterior[parte]['Proveedor'].isin(descartar)]
+        partes = [p for p in (conservadas, df) if not p.empty]
+        combinadas = pd.concat(partes, ignore_index=True) if partes else df
+        # Mismo orden que una conciliación completa: por proveedor, y dentro de él el de cada parte
+        resultado[parte] = combinadas.sort_values('Proveedor', kind='mergesort', ignore_index=True)
+    return resultado, list(cambiados)
@@ -0,0 +1,193 @@
+"""Escritura diferida (write-behind) de archivos en un hilo de fondo.
+
+Con la escritura diferida activa, cada escritura se encola con una clave (por
+ejemplo, el nombre de la tabla) y el hilo de fondo la ejecuta después; la
+interfaz no espera al disco. Si llega otra escritura con la misma clave antes de
+ejecutarse, ambas se combinan en una sola que conserva el lugar de la primera en
+la cola, así que el orden entre claves distintas se respeta.
+
+Las lecturas que dependen del disco llaman a esperar(clave) para ver sus propias
+escrituras. Al terminar el proceso se vacía la cola (vaciar, registrada con atexit).
+Con la escritura diferida inactiva, encolar escribe de inmediato.
+
+Estar activa o no es una variable de contexto, como la sucursal: cada sesión de
+la interfaz la activa al empezar cada ejecución según su propia preferencia, así
+que lo que elige una sesión no cambia el modo de las demás. Por defecto está
+inactiva (la API y los scripts escriben de inmediato).
+
+Las claves son por sucursal (ver sucursales.py): 'ventas' de una sucursal no se
+combina ni se espera con 'ventas' de otra, y cada escritura se ejecuta con la
+sucursal que estaba activa al encolarla.
+"""
+import atexit
+import contextvars
+import threading
+import time
+
+import sucursales
+
+_condicion = threading.Condition()
+# (sucursal, clave) -> [función, argumentos, combinar, contexto]; el dict conserva el orden de llegada
+_pendientes = {}
+# Escrituras que fallaron: se reintentan al combinarse con una nueva o al vaciar la cola
+_fallidas = {}
+_errores = {}
+_en_curso = None
+_hilo = None
+_activa = contextvars.ContextVar('escritura_diferida', default=False)
+_ultimo_guardado = None
+
+
+def activar(valor=True):
+    """Activa o desactiva la escritura diferida en el contexto actual y devuelve el modo elegido.
+
+    No toca la cola: lo ya encolado se sigue escribiendo en segundo plano (ver vaciar).
+    """
+    _activa.set(bool(valor))
+    return bool(valor)
+
+
+def activa():
+    """Indica si las escrituras del contexto actual se hacen en segundo plano."""
+    return _activa.get()
+
+
+def _es_hilo_de_fondo():
+    return _hilo is not None and threading.current_thread() is _hilo
+
+
+def _iniciar_hilo():
+    """Arranca el hilo de fondo si aún no está corriendo (se llama con _condicion tomada)."""
+    global _hilo
+    if _hilo is None or not _hilo.is_alive():
+        _hilo = threading.Thread(target=_procesar_cola, name="escritura-diferida", daemon=True)
+        _hilo.start()
+
+
+def _clave(clave):
+    """Clave de la cola: la clave pedida dentro de la sucursal activa."""
+    return (sucursales.actual(), clave)
+
+
+def _ejecutar(clave, funcion, args, combinar, contexto):
+    """Ejecuta una escritura y registra su resultado (se llama sin _condicion tomada)."""
+    global _ultimo_guardado
+    try:
+        contexto.run(funcion, *args)
+    except Exception as e:
+        with _condicion:
+            _fallidas[clave] = [funcion, args, combinar, contexto]
+            _errores[clave] = str(e)
+        return False
+    with _condicion:
+        _errores.pop(clave, None)
+        _ultimo_guardado = time.time()
+    return True
+
+
+def _procesar_cola():
+    """Bucle del hilo de fondo: toma la escritura más antigua de la cola y la ejecuta."""
+    global _en_curso
+    while True:
+        with _condicion:
+            while not _pendientes:
+                _condicion.wait()
+            clave = next(iter(_pendientes))
+            trabajo = _pendientes.pop(clave)
+            _en_curso = clave
+        try:
+            _ejecutar(clave, *trabajo)
+        finally:
+            with _condicion:
+                _en_curso = None
+                _condicion.notify_all()
+
+
+def encolar(clave, funcion, args=(), combinar=None, al_final=False):
+    """Programa funcion(*args) bajo una clave.
+
+    combinar(args_anteriores, args_nuevos) devuelve los argumentos de la escritura
+    combinada; sin combinar, la nueva escritura reemplaza a la pendiente. Con
+    al_final, la escritura combinada pasa al final de la cola en lugar de conservar
+    el lugar de la pendiente (para escribir después de lo encolado entre medio).
+    """
+    diferida = activa() and not _es_hilo_de_fondo()
+    clave = _clave(clave)
+    contexto = contextvars.copy_context()
+    with _condicion:
+        # La escritura inmediata se lleva la pendiente de la misma clave: si quedara en la
+        # cola, el hilo de fondo la escribiría después, encima de la más reciente
+        pendiente = _pendientes.get(clave) if diferida else _pendientes.pop(clave, None)
+        for anterior in (_fallidas.pop(clave, None), pendiente):
+            if anterior is not None and combinar is not None:
+                args = combinar(anterior[1], args)
+        if diferida:
+            # Reasignar una clave existente conserva su lugar en la cola
+            if al_final:
+                _pendientes.pop(clave, None)
+            _pendientes[clave] = [funcion, args, combinar, contexto]
+            _iniciar_hilo()
+            _condicion.notify_all()
+        elif not _es_hilo_de_fondo():
+            _condicion.wait_for(lambda: _en_curso != clave)
+    if not diferida:
+        return _ejecutar(clave, funcion, args, combinar, contexto)
+    return True
+
+
+def esperar(clave=None, timeout=None):
+    """Espera a que no queden escrituras pendientes ni en curso de la clave (o de todas).
+
+    Devuelve False si se agotó el timeout. Desde el hilo de fondo no espera.
+    """
+    if _es_hilo_de_fondo():
+        return True
+    if clave is not None:
+        clave = _clave(clave)
+
+    def terminado():
+        if clave is None:
+            return not _pendientes and _en_curso is None
+        return clave not in _pendientes and _en_curso != clave
+
+    with _condicion:
+        return _condicion.wait_for(terminado, timeout)
+
+
+def vaciar(timeout=None):
+    """Escribe todo lo pendiente, incluidos los reintentos de escrituras fallidas.
+
+    Si el hilo de fondo no terminó a tiempo (por ejemplo, durante el cierre del
+    proceso), ejecuta lo que quede en el hilo actual.
+    """
+    with _condicion:
+        for clave, trabajo in list(_fallidas.items()):
+            _pendientes.setdefault(clave, trabajo)
+        _fallidas.clear()
+        hay_hilo = _hilo is not None and _hilo.is_alive()
+        if hay_hilo:
+            _condicion.notify_all()
+    if hay_hilo and esperar(timeout=timeout):
+        return not _errores
+    while True:
+        with _condicion:
+            if not _pendientes:
+                break
+            clave = next(iter(_pendientes))
+            trabajo = _pendientes.pop(clave)
+        _ejecutar(clave, *trabajo)
+    return not _errores
+
+
+def estado():
+    """(escrituras pendientes, {clave: error}, fecha del último guardado) para mostrar en la interfaz."""
+    with _condicion:
+        pendientes = len(_pendientes) + (_en_curso is not None) + len(_fallidas)
+        errores = {
+            clave if sucursal == sucursales.SUCURSAL_POR_DEFECTO else f"{clave} ({sucursales.nombre(sucursal)})": error
+            for (sucursal, clave), error in _errores.items()
+        }
+        return pendientes, errores, _ultimo_guardado
+
+
+atexit.register(vaciar, timeout=30)
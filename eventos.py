@@ -0,0 +1,233 @@
+"""Registro de eventos inmutable (auditoría) de todos los cambios a las tablas.
+
+Cada cambio (venta agregada, depósito editado, nota eliminada, importación
+aplicada, deshacer...) se agrega como un evento a eventos/<AAAA-MM>.jsonl en la
+carpeta de la sucursal; nunca se reescribe una línea. Está fuera de data/ para
+que restaurar un respaldo no lo toque. Cada evento lleva un id correlativo y un
+hash encadenado con el del anterior, así que verificar() detecta cualquier línea
+editada, borrada o reordenada.
+
+    {"id", "fecha", "tipo", "tabla", "descripcion", "datos", "hash"}
+
+Según el tipo, datos tiene:
+    agregar, eliminar, importar: {"filas": [fila, ...]}
+    editar: {"filas": [{"fila": fila después del cambio, "antes": {col: valor}, "despues": {col: valor}}]}
+    vaciar: {"filas_eliminadas": n, "respaldo": instantánea tomada antes}
+    deshacer, rehacer: {"evento": id del cambio}
+    restaurar: {"respaldo": instantánea}
+
+Las tablas siguen guardadas en sus particiones; el registro es su historia. Para
+continuar la cadena y mostrar los totales por tabla y tipo sin leer todo el
+registro, cada INSTANTANEA_CADA eventos se guarda el estado del registro en
+_estado.json (último id y hash, totales y posición en su archivo). Al arrancar se
+carga esa instantánea y se reproducen solo los eventos escritos después.
+"""
+import hashlib
+import json
+import os
+import threading
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+import sucursales
+
+# Relativo a la carpeta de la sucursal
+EVENTOS_DIR = 'eventos'
+ESTADO_FILE = '_estado.json'
+INSTANTANEA_CADA = 200
+TIPOS = ['agregar', 'editar', 'eliminar', 'importar', 'vaciar', 'deshacer', 'rehacer', 'restaurar']
+COLUMNAS_EVENTOS = ['id', 'fecha', 'tipo', 'tabla', 'descripcion', 'filas']
+
+_bloqueo = threading.RLock()
+# sucursal -> estado del registro cargado en este proceso
+_estados = {}
+
+
+def _ruta(*partes):
+    return sucursales.ruta(os.path.join(EVENTOS_DIR, *partes))
+
+
+def _valor(valor):
+    """Convierte valores de pandas/numpy a tipos de JSON."""
+    if isinstance(valor, (datetime, date, pd.Timestamp)):
+        return valor.isoformat()
+    if isinstance(valor, np.generic):
+        return valor.item()
+    return str(valor)
+
+
+def _serializar(evento):
+    return json.dumps(evento, ensure_ascii=False, default=_valor)
+
+
+def _encadenar(hash_anterior, cuerpo):
+    return hashlib.sha256((hash_anterior + cuerpo).encode('utf-8')).hexdigest()
+
+
+def filas_a_registros(df):
+    """Filas de un DataFrame como lista de dicts listos para JSON (fechas ISO, nulos como None)."""
+    if df is None or df.empty:
+        return []
+    return json.loads(df.to_json(orient='records', date_format='iso', default_handler=str, force_ascii=False))
+
+
+def cambios_filas(antes, despues):
+    """Payload de una edición: por fila, la fila final y solo las columnas que cambiaron."""
+    antes = antes.reindex(index=despues.index, columns=despues.columns)
+    distintas = ~((antes == despues) | (antes.isna() & despues.isna())).to_numpy()
+    registros_antes = filas_a_registros(antes)
+    registros_despues = filas_a_registros(despues)
+    resultado = []
+    for i, fila in enumerate(registros_despues):
+        columnas = despues.columns[distintas[i]]
+        if len(columnas):
+            resultado.append({
+                'fila': fila,
+                'antes': {c: registros_antes[i][c] for c in columnas},
+                'despues': {c: fila[c] for c in columnas},
+            })
+    return resultado
+
+
+def _segmentos():
+    directorio = _ruta()
+    if not os.path.isdir(directorio):
+        return []
+    return sorted(n[:-6] for n in os.listdir(directorio) if n.endswith('.jsonl'))
+
+
+def _estado_vacio():
+    return {'id': 0, 'hash': '', 'segmento': None, 'posicion': 0, 'totales': {}}
+
+
+def _aplicar(estado, evento, hash_evento):
+    """Actualiza el estado del registro con un evento (sin tocar el archivo)."""
+    estado['id'] = evento['id']
+    estado['hash'] = hash_evento
+    por_tipo = estado['totales'].setdefault(evento['tabla'], {})
+    por_tipo[evento['tipo']] = por_tipo.get(evento['tipo'], 0) + 1
+
+
+def _reproducir(estado):
+    """Lee los eventos escritos después de la posición del estado y los aplica."""
+    for segmento in _segmentos():
+        if estado['segmento'] is not None and segmento < estado['segmento']:
+            continue
+        inicio = estado['posicion'] if segmento == estado['segmento'] else 0
+        ruta = _ruta(f"{segmento}.jsonl")
+        if os.path.getsize(ruta) <= inicio:
+            continue
+        with open(ruta, 'rb') as f:
+            f.seek(inicio)
+            for linea in f:
+                try:
+                    evento = json.loads(linea) if linea.endswith(b'\n') else None
+                except json.JSONDecodeError:
+                    evento = None
+                if evento is None:
+                    break  # Línea incompleta (escritura interrumpida): se descarta al agregar el próximo evento
+                hash_evento = evento.pop('hash')
+                _aplicar(estado, evento, hash_evento)
+                estado['segmento'], estado['posicion'] = segmento, f.tell()
+
+
+def _estado():
+    """Estado del registro de la sucursal activa: instantánea + eventos posteriores (se carga una vez por proceso)."""
+    sucursal = sucursales.actual()
+    estado = _estados.get(sucursal)
+    if estado is None:
+        estado = _estado_vacio()
+        try:
+            with open(_ruta(ESTADO_FILE), encoding='utf-8') as f:
+                estado = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        _estados[sucursal] = estado
+    # Se ponen al día los eventos que haya agregado otro proceso (o todos los posteriores a la instantánea)
+    _reproducir(estado)
+    return estado
+
+
+def _guardar_instantanea(estado):
+    ruta = _ruta(ESTADO_FILE)
+    with open(ruta + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(estado, f)
+    os.replace(ruta + '.tmp', ruta)
+
+
+def registrar(tipo, tabla, descripcion, **datos):
+    """Agrega un evento al registro de la sucursal activa y devuelve su id."""
+    with _bloqueo:
+        estado = _estado()
+        ahora = datetime.now()
+        evento = {
+            'id': estado['id'] + 1, 'fecha': ahora.isoformat(timespec='seconds'),
+            'tipo': tipo, 'tabla': tabla, 'descripcion': descripcion, 'datos': datos,
+        }
+        cuerpo = _serializar(evento)
+        hash_evento = _encadenar(estado['hash'], cuerpo)
+        segmento = ahora.strftime('%Y-%m')
+        ruta = _ruta(f"{segmento}.jsonl")
+        os.makedirs(_ruta(), exist_ok=True)
+        if estado['segmento'] == segmento and os.path.getsize(ruta) > estado['posicion']:
+            os.truncate(ruta, estado['posicion'])
+        with open(ruta, 'ab') as f:
+            f.write((cuerpo[:-1] + f', "hash": "{hash_evento}"}}\n').encode('utf-8'))
+            posicion = f.tell()
+        _aplicar(estado, evento, hash_evento)
+        estado['segmento'], estado['posicion'] = segmento, posicion
+        if estado['id'] % INSTANTANEA_CADA == 0:
+            _guardar_instantanea(estado)
+        return estado['id']
+
+
+def totales():
+    """DataFrame tabla × tipo con la cantidad de eventos (sin leer el registro completo)."""
+    with _bloqueo:
+        conteos = _estado()['totales']
+    return pd.DataFrame(conteos).T.reindex(columns=TIPOS).fillna(0).astype(int).rename_axis('tabla')
+
+
+def meses():
+    """Meses (AAAA-MM) con eventos, del más reciente al más antiguo."""
+    return _segmentos()[::-1]
+
+
+def leer_mes(mes):
+    """Eventos de un mes como lista de dicts."""
+    ruta = _ruta(f"{mes}.jsonl")
+    if not os.path.exists(ruta):
+        return []
+    with open(ruta, 'rb') as f:
+        return [json.loads(linea) for linea in f if linea.endswith(b'\n')]
+
+
+def tabla_eventos(eventos):
+    """Eventos como DataFrame para mostrar (la cantidad de filas afectadas en vez de su detalle)."""
+    return pd.DataFrame([
+        {
+            'id': e['id'], 'fecha': e['fecha'], 'tipo': e['tipo'], 'tabla': e['tabla'],
+            'descripcion': e['descripcion'],
+            'filas': len(e['datos'].get('filas', [])) or e['datos'].get('filas_eliminadas', 0),
+        }
+        for e in eventos
+    ], columns=COLUMNAS_EVENTOS)
+
+
+def verificar():
+    """Recorre todo el registro y comprueba la cadena de hashes. Devuelve (eventos revisados, id del primer evento alterado o None)."""
+    hash_anterior, id_anterior, revisados = '', 0, 0
+    for segmento in _segmentos():
+        with open(_ruta(f"{segmento}.jsonl"), 'rb') as f:
+            for linea in f:
+                if not linea.endswith(b'\n'):
+                    break
+                evento = json.loads(linea)
+                hash_evento = evento.pop('hash')
+                if evento['id'] != id_anterior + 1 or _encadenar(hash_anterior, _serializar(evento)) != hash_evento:
+                    return revisados, evento['id']
+                hash_anterior, id_anterior = hash_evento, evento['id']
+                revisados += 1
+    return revisados, None
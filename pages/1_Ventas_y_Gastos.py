@@ -1,325 +1,222 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime, date, timedelta
-import os
-import atexit
 import io
 
-# --- Configuración de Archivos ---
-# Obtener el directorio actual del script
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-# Crear un subdirectorio 'data' si no existe
-DATA_DIR = os.path.join(BASE_DIR, 'data')
-os.makedirs(DATA_DIR, exist_ok=True)
-
-# Rutas completas a los archivos CSV
-VENTAS_FILE = os.path.join(DATA_DIR, 'ventas.csv')
-GASTOS_FILE = os.path.join(DATA_DIR, 'gastos.csv')
-
-
-# --- Funciones de carga y guardado de datos (sin base de datos) ---
-def cargar_ventas_desde_archivo():
-    """Carga las ventas desde un archivo CSV. Si no existe, devuelve un DataFrame vacío."""
-    if os.path.exists(VENTAS_FILE):
-        try:
-            df = pd.read_csv(VENTAS_FILE)
-            # Asegúrate de que las columnas de fecha sean objetos date
-            if 'fecha' in df.columns:
-                df['fecha'] = pd.to_datetime(df['fecha']).dt.date
-            return df
-        except Exception as e:
-            st.error(f"Error al cargar ventas desde {VENTAS_FILE}: {e}")
-            return pd.DataFrame(columns=['fecha', 'cliente', 'tipo', 'cantidad', 'libras', 'descuento',
-                                         'libras_netas', 'precio', 'total_a_cobrar', 'pago_cliente', 'saldo'])
-    return pd.DataFrame(columns=['fecha', 'cliente', 'tipo', 'cantidad', 'libras', 'descuento',
-                                 'libras_netas', 'precio', 'total_a_cobrar', 'pago_cliente', 'saldo'])
-
-def cargar_gastos_desde_archivo():
-    """Carga los gastos desde un archivo CSV. Si no existe, devuelve un DataFrame vacío."""
-    if os.path.exists(GASTOS_FILE):
-        try:
-            df = pd.read_csv(GASTOS_FILE)
-            # Asegúrate de que las columnas de fecha sean objetos date
-            if 'fecha' in df.columns:
-                df['fecha'] = pd.to_datetime(df['fecha']).dt.date
-            return df
-        except Exception as e:
-            st.error(f"Error al cargar gastos desde {GASTOS_FILE}: {e}")
-            return pd.DataFrame(columns=['fecha', 'calculo', 'descripcion', 'gasto', 'dinero'])
-    return pd.DataFrame(columns=['fecha', 'calculo', 'descripcion', 'gasto', 'dinero'])
-
-def guardar_dataframes_en_archivos():
-    """Guarda los DataFrames de ventas y gastos en archivos CSV."""
-    if 'ventas_raw_data' in st.session_state and not st.session_state.ventas_raw_data.empty:
-        # Asegurarse de que la columna 'fecha' sea compatible con .to_csv (string o datetime)
-        df_to_save_ventas = st.session_state.ventas_raw_data.copy()
-        if 'fecha' in df_to_save_ventas.columns:
-             # Convertir solo si es necesario (ej. si son objetos date.date y no datetime)
-            df_to_save_ventas['fecha'] = pd.to_datetime(df_to_save_ventas['fecha']).dt.strftime('%Y-%m-%d')
-        df_to_save_ventas.to_csv(VENTAS_FILE, index=False)
-        # Si prefieres Excel, descomenta la siguiente línea y comenta la anterior:
-        # st.session_state.ventas_raw_data.to_excel(VENTAS_FILE.replace(".csv", ".xlsx"), index=False, engine='xlsxwriter')
-    
-    if 'gastos_raw_data' in st.session_state and not st.session_state.gastos_raw_data.empty:
-        # Asegurarse de que la columna 'fecha' sea compatible con .to_csv (string o datetime)
-        df_to_save_gastos = st.session_state.gastos_raw_data.copy()
-        if 'fecha' in df_to_save_gastos.columns:
-            df_to_save_gastos['fecha'] = pd.to_datetime(df_to_save_gastos['fecha']).dt.strftime('%Y-%m-%d')
-        df_to_save_gastos.to_csv(GASTOS_FILE, index=False)
-        # Si prefieres Excel, descomenta la siguiente línea y comenta la anterior:
-        # st.session_state.gastos_raw_data.to_excel(GASTOS_FILE.replace(".csv", ".xlsx"), index=False, engine='xlsxwriter')
-
-# Registrar la función de guardado para que se ejecute al finalizar la aplicación
-atexit.register(guardar_dataframes_en_archivos)
-
-# --- Funciones para DataFrames (actualizadas para usar st.session_state directamente) ---
+import cartera
+import escritura_diferida
+import eventos
+import particiones
+import respaldos
+import sucursales
+import validacion
+import ventas_gastos
+from ventas_gastos import (
+    VENTAS_KEYS_FILE, GASTOS_KEYS_FILE, KEY_COLUMNS_VENTAS, KEY_COLUMNS_GASTOS,
+    COLUMNS_VENTAS, COLUMNS_GASTOS, RENOMBRAR_VENTAS, RENOMBRAR_GASTOS,
+    CLIENTES, TIPOS_AVE, CATEGORIAS_GASTO,
+    calcular_hash_claves, cargar_indice_claves, filtrar_duplicados,
+    formatear_moneda, calcular_libras_netas, calcular_total_cobrar, calcular_saldo,
+    analizar_alertas_clientes,
+)
+
+# Página de ventas y gastos con todo el historial, dentro de la aplicación de Noveno_project.py.
+# Las tablas, la cartera de clientes y los cálculos salen de ventas_gastos.py, compartido con
+# la página principal: lo que escribe una página lo ve la otra sin releer el disco, y la cola
+# de escritura_diferida.py guarda lo pendiente al cerrar el proceso.
+
+# Sucursal elegida en la página principal (ver sucursales.py)
+sucursales.activar(st.session_state.get("sucursal"))
+# Escritura en segundo plano según la preferencia de la sesión (interruptor de la página principal)
+escritura_diferida.activar(st.session_state.get("escritura_diferida", False))
+CLIENTES = sucursales.valor("clientes", CLIENTES)
+
+# --- Escritura en las tablas compartidas ---
+def agregar_filas_nuevas(df_filas, tabla, key_columns, descripcion, hashes=None, tipo='agregar'):
+    """Agrega filas al final de la tabla compartida y de sus particiones, manteniendo el índice de claves,
+    y las registra en la auditoría (ver eventos.py)."""
+    version_anterior = ventas_gastos.version_tabla(tabla)
+    if hashes is None:
+        hashes = calcular_hash_claves(df_filas, key_columns)
+    ventas_gastos.agregar_filas(tabla, df_filas, hashes) # Solo se escriben las filas nuevas
+    if tabla == 'ventas':
+        ventas_gastos.aplicar_cambios_cartera(version_anterior, agregar=df_filas)
+    eventos.registrar(tipo, tabla, descripcion, filas=eventos.filas_a_registros(df_filas))
+
+def importar_filas_nuevas(df_importado, tabla, archivo_indice, key_columns, nombre_archivo):
+    """Agrega a la tabla compartida y a las particiones solo las filas que no estaban registradas.
+
+    Devuelve (filas importadas, duplicados omitidos).
+    """
+    claves = cargar_indice_claves(archivo_indice, tabla, key_columns)
+    df_nuevas, duplicados, hashes = filtrar_duplicados(df_importado, claves, key_columns)
+    if not df_nuevas.empty:
+        agregar_filas_nuevas(
+            df_nuevas, tabla, key_columns,
+            f"Importar {len(df_nuevas)} fila(s) de {nombre_archivo}", hashes, tipo='importar'
+        )
+    return len(df_nuevas), duplicados
+
+def guardar_filas_editadas(tabla, filas, descripcion):
+    """Reemplaza filas de la tabla compartida (por etiqueta) y reescribe solo sus meses."""
+    actual = ventas_gastos.obtener_tabla(tabla)
+    anteriores = actual.loc[filas.index]
+    nuevo = pd.concat([actual.drop(index=filas.index), filas]).reindex(actual.index)
+    meses = set(particiones.mes_de(anteriores['fecha'])) | set(particiones.mes_de(filas['fecha']))
+    version_anterior = ventas_gastos.version_tabla(tabla)
+    ventas_gastos.guardar_meses(tabla, nuevo, meses)
+    if tabla == 'ventas':
+        # Solo se ajustan las cuentas de los clientes: se quitan las ventas anteriores y se suman las editadas
+        ventas_gastos.aplicar_cambios_cartera(version_anterior, quitar=anteriores, agregar=filas)
+    eventos.registrar('editar', tabla, descripcion, filas=eventos.cambios_filas(anteriores, filas))
+
+def quitar_filas(tabla, etiquetas, descripcion):
+    """Elimina filas de la tabla compartida (por etiqueta) y reescribe solo sus meses."""
+    actual = ventas_gastos.obtener_tabla(tabla)
+    quitadas = actual.loc[etiquetas]
+    version_anterior = ventas_gastos.version_tabla(tabla)
+    ventas_gastos.guardar_meses(tabla, actual.drop(index=etiquetas), set(particiones.mes_de(quitadas['fecha'])))
+    if tabla == 'ventas':
+        ventas_gastos.aplicar_cambios_cartera(version_anterior, quitar=quitadas)
+    eventos.registrar('eliminar', tabla, descripcion, filas=eventos.filas_a_registros(quitadas))
+
+def validar_importacion(df_importado, hoja, nombre_archivo):
+    """Filas válidas de un archivo importado; muestra los errores por fila y el reporte para descargar."""
+    validas, errores = validacion.validar(
+        df_importado, hoja, {"clientes": CLIENTES, "tipos_ave": TIPOS_AVE, "categorias": CATEGORIAS_GASTO}
+    )
+    if not errores.empty:
+        st.warning(
+            f"⚠️ Se omitirán **{errores['Fila'].nunique()}** fila(s) con errores de '{nombre_archivo}'; "
+            f"las **{len(validas)}** restantes se pueden importar."
+        )
+        st.dataframe(errores.head(100), use_container_width=True, hide_index=True)
+        st.download_button(
+            "⬇️ Descargar reporte de errores (CSV)", validacion.reporte_csv(errores),
+            file_name=f"errores_{nombre_archivo.rsplit('.', 1)[0]}.csv", mime="text/csv", key=f"reporte_errores_{hoja}"
+        )
+    return validas
+
+def fila_editada(tabla, posicion, updated_data):
+    """Fila de la tabla compartida en la posición del editor con los cambios aplicados.
+
+    Devuelve None si los cambios no modifican la fila (el editor los repite en cada recarga).
+    """
+    fila = ventas_gastos.obtener_tabla(tabla).iloc[posicion]
+    cambios = {
+        col: pd.to_datetime(val).date() if col == 'fecha' else val for col, val in updated_data.items()
+    }
+    if all(fila[col] == val for col, val in cambios.items()):
+        return None
+    return pd.DataFrame([{**fila.to_dict(), **cambios}], index=[fila.name])
+
+# --- Funciones para DataFrames (sobre las tablas compartidas) ---
 def get_ventas_df_processed():
-    """Procesa el DataFrame de ventas para su visualización desde raw data."""
-    df = st.session_state.ventas_raw_data.copy()
+    """Procesa el DataFrame de ventas para su visualización desde la tabla compartida."""
+    df = ventas_gastos.obtener_tabla('ventas')
     if not df.empty:
+        df = df.rename(columns=RENOMBRAR_VENTAS)
         # Convertir a formato de fecha localizable para visualización
-        if 'fecha' in df.columns:
-            df['Fecha'] = pd.to_datetime(df['fecha']).dt.date
-        else: # Si por alguna razón falta 'fecha' en la carga inicial, crea una columna de fecha ficticia
-            df['Fecha'] = date.today() 
-            st.warning("Columna 'fecha' no encontrada en ventas_raw_data. Usando fecha actual.")
-        
-        df = df.rename(columns={
-            'fecha': 'Fecha DB', 'cliente': 'Cliente', 'tipo': 'Tipo', 'cantidad': 'Cantidad',
-            'libras': 'Libras', 'descuento': 'Descuento', 'libras_netas': 'Libras_netas',
-            'precio': 'Precio', 'total_a_cobrar': 'Total_a_cobrar', 'pago_cliente': 'Pago_Cliente',
-            'saldo': 'Saldo'
-        })
+        df['Fecha'] = pd.to_datetime(df['Fecha DB']).dt.date
         # Ordenar por fecha y luego por cliente para consistencia
         df = df.sort_values(by=['Fecha', 'Cliente'], ascending=[False, True])
     return df
 
 def get_gastos_df_processed():
-    """Procesa el DataFrame de gastos para su visualización desde raw data."""
-    df = st.session_state.gastos_raw_data.copy()
+    """Procesa el DataFrame de gastos para su visualización desde la tabla compartida."""
+    df = ventas_gastos.obtener_tabla('gastos')
     if not df.empty:
-        if 'fecha' in df.columns:
-            df['Fecha'] = pd.to_datetime(df['fecha']).dt.date
-        else: # Si por alguna razón falta 'fecha' en la carga inicial, crea una columna de fecha ficticia
-            df['Fecha'] = date.today()
-            st.warning("Columna 'fecha' no encontrada en gastos_raw_data. Usando fecha actual.")
-
-        df = df.rename(columns={
-            'fecha': 'Fecha DB', 'calculo': 'Calculo', 'descripcion': 'Descripcion',
-            'gasto': 'Gasto', 'dinero': 'Dinero'
-        })
+        df = df.rename(columns=RENOMBRAR_GASTOS)
+        df['Fecha'] = pd.to_datetime(df['Fecha DB']).dt.date
         # Ordenar por fecha
         df = df.sort_values(by='Fecha', ascending=False)
     return df
 
 def guardar_venta(venta_data):
-    """Guarda una nueva venta en el DataFrame de session_state y luego en archivo."""
-    nueva_venta_df = pd.DataFrame([venta_data])
-    # Asegúrate de que las columnas coincidan para la concatenación
-    st.session_state.ventas_raw_data = pd.concat([nueva_venta_df, st.session_state.ventas_raw_data], ignore_index=True)
-    guardar_dataframes_en_archivos() # Guardar inmediatamente en archivo
+    """Guarda una nueva venta en la tabla compartida y en su partición."""
+    # La venta nueva va al final; el orden de visualización lo da get_ventas_df_processed
+    agregar_filas_nuevas(
+        pd.DataFrame([venta_data]), 'ventas', KEY_COLUMNS_VENTAS,
+        f"Registrar venta de {venta_data['cliente']}"
+    )
     return True
 
 def guardar_gasto(gasto_data):
-    """Guarda un nuevo gasto en el DataFrame de session_state y luego en archivo."""
-    nuevo_gasto_df = pd.DataFrame([gasto_data])
-    # Asegúrate de que las columnas coincidan para la concatenación
-    st.session_state.gastos_raw_data = pd.concat([nuevo_gasto_df, st.session_state.gastos_raw_data], ignore_index=True)
-    guardar_dataframes_en_archivos() # Guardar inmediatamente en archivo
+    """Guarda un nuevo gasto en la tabla compartida y en su partición."""
+    # El gasto nuevo va al final; el orden de visualización lo da get_gastos_df_processed
+    agregar_filas_nuevas(
+        pd.DataFrame([gasto_data]), 'gastos', KEY_COLUMNS_GASTOS,
+        f"Registrar gasto '{gasto_data['descripcion']}'"
+    )
     return True
 
 def limpiar_ventas():
-    """Elimina todas las ventas del DataFrame y del archivo."""
-    st.session_state.ventas_raw_data = pd.DataFrame(columns=['fecha', 'cliente', 'tipo', 'cantidad', 'libras', 'descuento',
-                                                             'libras_netas', 'precio', 'total_a_cobrar', 'pago_cliente', 'saldo'])
-    guardar_dataframes_en_archivos() # Guardar el DataFrame vacío
-    if os.path.exists(VENTAS_FILE):
-        os.remove(VENTAS_FILE) # Eliminar el archivo físicamente
+    """Elimina todas las ventas de la tabla compartida y del disco (antes toma un respaldo)."""
+    try:
+        respaldo = respaldos.tomar("antes de eliminar todas las ventas")
+    except OSError as e:
+        st.error(f"❌ No se pudo tomar el respaldo previo ({e}); no se eliminó nada.")
+        return False
+    filas_eliminadas = int(particiones.leer_resumen('ventas')['filas'].sum())
+    ventas_gastos.eliminar_tabla('ventas') # Eliminar las particiones físicamente
+    ventas_gastos.recargar_cartera()
+    eventos.registrar('vaciar', 'ventas', "Eliminar todas las ventas", filas_eliminadas=filas_eliminadas, respaldo=respaldo)
     return True
 
 def limpiar_gastos():
-    """Elimina todos los gastos del DataFrame y del archivo."""
-    st.session_state.gastos_raw_data = pd.DataFrame(columns=['fecha', 'calculo', 'descripcion', 'gasto', 'dinero'])
-    guardar_dataframes_en_archivos() # Guardar el DataFrame vacío
-    if os.path.exists(GASTOS_FILE):
-        os.remove(GASTOS_FILE) # Eliminar el archivo físicamente
+    """Elimina todos los gastos de la tabla compartida y del disco (antes toma un respaldo)."""
+    try:
+        respaldo = respaldos.tomar("antes de eliminar todos los gastos")
+    except OSError as e:
+        st.error(f"❌ No se pudo tomar el respaldo previo ({e}); no se eliminó nada.")
+        return False
+    filas_eliminadas = int(particiones.leer_resumen('gastos')['filas'].sum())
+    ventas_gastos.eliminar_tabla('gastos') # Eliminar las particiones físicamente
+    eventos.registrar('vaciar', 'gastos', "Eliminar todos los gastos", filas_eliminadas=filas_eliminadas, respaldo=respaldo)
     return True
 
-# --- Funciones para editar y eliminar datos (NUEVAS) ---
+# --- Funciones para editar y eliminar datos ---
+# El editor entrega posiciones de fila de la tabla mostrada (la tabla compartida, en su orden)
 
 def actualizar_venta(index, updated_data):
-    """Actualiza una venta existente en el DataFrame de session_state."""
-    for col, val in updated_data.items():
-        if col == 'fecha':
-            st.session_state.ventas_raw_data.loc[index, col] = pd.to_datetime(val).date()
-        else:
-            st.session_state.ventas_raw_data.loc[index, col] = val
-    # Recalcular campos derivados si es necesario
-    libras = st.session_state.ventas_raw_data.loc[index, 'libras']
-    descuento = st.session_state.ventas_raw_data.loc[index, 'descuento']
-    precio = st.session_state.ventas_raw_data.loc[index, 'precio']
-    pago_cliente = st.session_state.ventas_raw_data.loc[index, 'pago_cliente']
-
-    st.session_state.ventas_raw_data.loc[index, 'libras_netas'] = calcular_libras_netas(libras, descuento)
-    st.session_state.ventas_raw_data.loc[index, 'total_a_cobrar'] = calcular_total_cobrar(st.session_state.ventas_raw_data.loc[index, 'libras_netas'], precio)
-    st.session_state.ventas_raw_data.loc[index, 'saldo'] = calcular_saldo(st.session_state.ventas_raw_data.loc[index, 'total_a_cobrar'], pago_cliente)
-
-    guardar_dataframes_en_archivos()
-    st.session_state.ventas_data = get_ventas_df_processed() # Actualiza el df procesado
+    """Actualiza una venta existente y recalcula sus campos derivados."""
+    fila = fila_editada('ventas', index, updated_data)
+    if fila is None:
+        return False
+    venta = fila.iloc[0]
+    libras_netas = calcular_libras_netas(venta['libras'], venta['descuento'])
+    total_a_cobrar = calcular_total_cobrar(libras_netas, venta['precio'])
+    fila['libras_netas'] = libras_netas
+    fila['total_a_cobrar'] = total_a_cobrar
+    fila['saldo'] = calcular_saldo(total_a_cobrar, venta['pago_cliente'])
+    guardar_filas_editadas('ventas', fila, f"Editar venta de {venta['cliente']}")
     return True
 
 def eliminar_ventas_seleccionadas(indices):
-    """Elimina ventas seleccionadas del DataFrame de session_state."""
-    st.session_state.ventas_raw_data = st.session_state.ventas_raw_data.drop(indices).reset_index(drop=True)
-    guardar_dataframes_en_archivos()
-    st.session_state.ventas_data = get_ventas_df_processed() # Actualiza el df procesado
+    """Elimina las ventas seleccionadas en el editor."""
+    quitar_filas('ventas', ventas_gastos.obtener_tabla('ventas').index[indices], f"Eliminar {len(indices)} venta(s)")
     return True
 
 def actualizar_gasto(index, updated_data):
-    """Actualiza un gasto existente en el DataFrame de session_state."""
-    for col, val in updated_data.items():
-        if col == 'fecha':
-            st.session_state.gastos_raw_data.loc[index, col] = pd.to_datetime(val).date()
-        else:
-            st.session_state.gastos_raw_data.loc[index, col] = val
-    guardar_dataframes_en_archivos()
-    st.session_state.gastos_data = get_gastos_df_processed() # Actualiza el df procesado
+    """Actualiza un gasto existente."""
+    fila = fila_editada('gastos', index, updated_data)
+    if fila is None:
+        return False
+    guardar_filas_editadas('gastos', fila, f"Editar gasto '{fila.iloc[0]['descripcion']}'")
     return True
 
 def eliminar_gastos_seleccionados(indices):
-    """Elimina gastos seleccionados del DataFrame de session_state."""
-    st.session_state.gastos_raw_data = st.session_state.gastos_raw_data.drop(indices).reset_index(drop=True)
-    guardar_dataframes_en_archivos()
-    st.session_state.gastos_data = get_gastos_df_processed() # Actualiza el df procesado
+    """Elimina los gastos seleccionados en el editor."""
+    quitar_filas('gastos', ventas_gastos.obtener_tabla('gastos').index[indices], f"Eliminar {len(indices)} gasto(s)")
     return True
 
 
 # --- Inicialización principal ---
 st.title("🐔 Sistema de Gestión de Ventas de Aves")
 
-# Inicializar datos en session state cargando desde archivos
-# Se mantienen dos DataFrames: uno 'raw' para guardar y otro 'data' para visualizar
-if 'ventas_raw_data' not in st.session_state:
-    st.session_state.ventas_raw_data = cargar_ventas_desde_archivo()
-if 'ventas_data' not in st.session_state: # Este será el DataFrame procesado para mostrar
-    st.session_state.ventas_data = get_ventas_df_processed()
-
-if 'gastos_raw_data' not in st.session_state:
-    st.session_state.gastos_raw_data = cargar_gastos_desde_archivo()
-if 'gastos_data' not in st.session_state: # Este será el DataFrame procesado para mostrar
-    st.session_state.gastos_data = get_gastos_df_processed()
-
-
-# --- Listas predefinidas ---
-CLIENTES = [
-    "D. Vicente", "D. Jorge", "D. Quinde", "Sra. Isabel", "Sra. Alba",
-    "Sra Yolanda", "Sra Laura Mercado", "D. Segundo", "Legumbrero",
-    "Peruana Posorja", "Sra. Sofia", "Sra. Jessica", "Sra Alado de Jessica",
-    "Comedor Gordo Posorja", "Patitas Posorja", "Sra. Celeste", "Caro negro", "Tienda Isabel Posorja",
-    "Carnicero Posorja", "Moreira","Senel", "Chuzos Narcisa", "Eddy", "D. Jonny", "D. Sra Madelyn", "Lobo Mercado"
-]
-
-TIPOS_AVE = ["Pollo", "Gallina"]
-
-CATEGORIAS_GASTO = [
-    "G. Alimentación", "G. Transporte", "G. Producción", "G. Salud",
-    "G. Educación", "G. Mano de obra", "G. Pérdida", "G. Varios", "Otros Gastos"
-]
-
-# --- Funciones de formateo y cálculo ---
-def formatear_moneda(valor):
-    """Formatea un valor numérico como una cadena de moneda."""
-    try:
-        return f"${float(valor):,.2f}"
-    except (ValueError, TypeError):
-        return "$0.00"
-
-def calcular_libras_netas(libras, descuento):
-    """Calcula las libras netas."""
-    try:
-        return round(float(libras) - float(descuento), 2)
-    except:
-        return 0.0
-
-def calcular_total_cobrar(libras_netas, precio):
-    """Calcula el total a cobrar."""
-    try:
-        return round(float(libras_netas) * float(precio), 2)
-    except:
-        return 0.0
-
-def calcular_saldo(total_cobrar, pago_cliente):
-    """Calcula el saldo pendiente."""
-    try:
-        return round(float(total_cobrar) - float(pago_cliente), 2)
-    except:
-        return 0.0
-
-def analizar_alertas_clientes(ventas_df):
-    """Analiza el DataFrame de ventas para identificar clientes con alertas."""
-    if ventas_df.empty:
-        return pd.DataFrame()
-
-    # Asegúrate de trabajar con una copia para evitar SettingWithCopyWarning
-    df_temp = ventas_df.copy()
-    # Asegurarse de que la columna 'Fecha' sea de tipo datetime para operaciones de fecha
-    if 'Fecha' in df_temp.columns:
-        df_temp['Fecha'] = pd.to_datetime(df_temp['Fecha'])
-    else: # Fallback si 'Fecha' no se creó correctamente
-        st.warning("Columna 'Fecha' no encontrada en df_temp para alertas. Algunas alertas podrían no ser precisas.")
-        df_temp['Fecha'] = pd.to_datetime(df_temp['Fecha DB']) # Usar 'Fecha DB' que es la original
-
-    alertas = []
-
-    for cliente in df_temp['Cliente'].unique():
-        cliente_ventas = df_temp[df_temp['Cliente'] == cliente].copy()
-        cliente_ventas = cliente_ventas.sort_values('Fecha')
-
-        # Convertir 'Saldo' a numérico antes de sumar.
-        # Es crucial que esta columna tenga el formato de moneda quitado si está presente.
-        cliente_ventas['Saldo_num'] = cliente_ventas['Saldo'].apply(
-            lambda x: float(str(x).replace('$', '').replace(',', '')) if isinstance(x, (str, float, int)) else x
-        )
-        saldo_total = cliente_ventas['Saldo_num'].sum()
-
-        debe_mas_10 = saldo_total > 10
-
-        dias_consecutivos = 0
-        # Filtrar solo fechas con saldo positivo
-        fechas_con_saldo = cliente_ventas[cliente_ventas['Saldo_num'] > 0]['Fecha'].dt.date.unique()
-
-        if len(fechas_con_saldo) >= 2:
-            fechas_ordenadas = sorted(list(fechas_con_saldo))
-            consecutivos_actual = 1
-            max_consecutivos = 1
-
-            for i in range(1, len(fechas_ordenadas)):
-                if (fechas_ordenadas[i] - fechas_ordenadas[i-1]).days == 1:
-                    consecutivos_actual += 1
-                    max_consecutivos = max(max_consecutivos, consecutivos_actual)
-                else:
-                    consecutivos_actual = 1
-
-            dias_consecutivos = max_consecutivos
-
-        if debe_mas_10 or dias_consecutivos >= 2:
-            ultima_fecha = cliente_ventas['Fecha'].max().strftime('%Y-%m-%d')
-
-            motivos = []
-            if debe_mas_10:
-                motivos.append(f"Debe más de ${saldo_total:.2f}")
-            if dias_consecutivos >= 2:
-                motivos.append(f"Saldo por {dias_consecutivos} día(s) consecutivo(s)")
-
-            alertas.append({
-                'Cliente': cliente,
-                'Saldo_Total': saldo_total,
-                'Ultima_Venta': ultima_fecha,
-                'Motivo_Alerta': " | ".join(motivos),
-                'Prioridad': 'Alta' if debe_mas_10 and dias_consecutivos >= 2 else 'Media'
-            })
-
-    return pd.DataFrame(alertas)
+# Vistas de la ejecución actual; se vuelven a armar tras cada escritura
+ventas_data = get_ventas_df_processed()
+gastos_data = get_gastos_df_processed()
 
 
 # --- SECCIÓN 1: TABLA DE VENTAS ---
@@ -328,12 +225,16 @@ st.header("📊 Registro de Ventas")
 st.divider()
 ### 🚨 Alertas de Clientes
 st.subheader("🚨 Alertas de Clientes")
-alertas_df = analizar_alertas_clientes(st.session_state.ventas_data)
-if not alertas_df.empty:
-    st.dataframe(alertas_df, use_container_width=True, hide_index=True)
-    st.warning("Revisa a los clientes listados para gestionar sus saldos.")
+try:
+    alertas_df = analizar_alertas_clientes(ventas_data, cartera.resumen_cartera(ventas_gastos.obtener_cartera()))
+except ValueError as e:
+    st.error(f"Error en las reglas de alertas: {e}")
 else:
-    st.info("🎉 ¡No hay alertas de clientes pendientes! Todos los saldos al día.")
+    if not alertas_df.empty:
+        st.dataframe(alertas_df, use_container_width=True, hide_index=True)
+        st.warning("Revisa a los clientes listados para gestionar sus saldos.")
+    else:
+        st.info("🎉 ¡No hay alertas de clientes pendientes! Todos los saldos al día.")
 
 st.divider()
 
@@ -386,7 +287,7 @@ with st.expander("📝 Formulario de Nueva Venta", expanded=False): # Cambiado a
             }
             
             if guardar_venta(venta_data): # Llama a la función que guarda en session_state y archivo
-                st.session_state.ventas_data = get_ventas_df_processed() # Actualiza el df procesado
+                ventas_data = get_ventas_df_processed() # Actualiza el df procesado
                 st.success(f"✅ Venta para **'{cliente}'** guardada exitosamente.")
             else:
                 st.error(f"❌ Error al guardar la venta para **'{cliente}'**.")
@@ -407,11 +308,11 @@ with st.expander("📝 Formulario de Nueva Venta", expanded=False): # Cambiado a
 st.divider()
 
 ### 📋 Historial de Ventas (con edición y eliminación)
-if not st.session_state.ventas_data.empty:
+if not ventas_data.empty:
     st.subheader("📋 Historial de Ventas (Editar / Eliminar)")
     
     # Crear un DataFrame para la edición con una columna 'Seleccionar'
-    df_editable_ventas = st.session_state.ventas_raw_data.copy()
+    df_editable_ventas = ventas_gastos.obtener_tabla('ventas').copy()
     
     # Asegúrate de que las columnas de fecha sean objetos date para el editor
     if 'fecha' in df_editable_ventas.columns:
@@ -431,7 +332,7 @@ if not st.session_state.ventas_data.empty:
         for index, updates in st.session_state.ventas_data_editor['edited_rows'].items():
             if actualizar_venta(index, updates):
                 st.success(f"✅ Venta en la fila {index+1} actualizada exitosamente.")
-                st.session_state.ventas_data = get_ventas_df_processed() # Actualizar el df procesado
+                ventas_data = get_ventas_df_processed() # Actualizar el df procesado
                 # st.rerun() # Opcional: recargar la página para ver los cambios inmediatamente
 
     # Botón de eliminación
@@ -440,15 +341,16 @@ if not st.session_state.ventas_data.empty:
         if st.button(f"🚨 Confirmar Eliminación de Venta(s) Seleccionada(s) ({len(st.session_state.ventas_data_editor['deleted_rows'])})", type="danger", key="confirm_delete_selected_ventas"):
             if eliminar_ventas_seleccionadas(st.session_state.ventas_data_editor['deleted_rows']):
                 st.success(f"✅ Venta(s) eliminada(s) exitosamente.")
-                st.session_state.ventas_data = get_ventas_df_processed()
+                ventas_data = get_ventas_df_processed()
                 st.rerun() # Recargar para reflejar la eliminación
             else:
                 st.error("❌ Error al eliminar la(s) venta(s).")
     
-    # Resumen de ventas (usando el DataFrame raw actualizado para cálculos)
-    total_ventas = st.session_state.ventas_raw_data['total_a_cobrar'].sum()
-    total_pagos = st.session_state.ventas_raw_data['pago_cliente'].sum()
-    saldo_pendiente = st.session_state.ventas_raw_data['saldo'].sum()
+    # Resumen de ventas (leído de la cartera de clientes, sin recorrer las ventas)
+    resumen_cartera = cartera.resumen_cartera(ventas_gastos.obtener_cartera())
+    total_ventas = resumen_cartera['Facturado'].sum()
+    total_pagos = resumen_cartera['Pagado'].sum()
+    saldo_pendiente = resumen_cartera['Pendiente'].sum()
     
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -465,7 +367,7 @@ if not st.session_state.ventas_data.empty:
 
     with col_exp_imp_ventas_1:
         # Botón para descargar a Excel
-        df_for_download_ventas = st.session_state.ventas_raw_data.copy()
+        df_for_download_ventas = ventas_gastos.obtener_tabla('ventas').copy()
         if not df_for_download_ventas.empty:
             df_for_download_ventas['fecha'] = pd.to_datetime(df_for_download_ventas['fecha']).dt.strftime('%Y-%m-%d') # Formato de fecha para Excel
             
@@ -494,50 +396,31 @@ if not st.session_state.ventas_data.empty:
                 else: # .csv
                     df_imported_ventas = pd.read_csv(uploaded_file_ventas)
                 
-                # Nombres de columnas esperados (minúsculas y sin espacios)
-                expected_cols_raw_ventas = [
-                    'fecha', 'cliente', 'tipo', 'cantidad', 'libras', 'descuento', 
-                    'libras_netas', 'precio', 'total_a_cobrar', 'pago_cliente', 'saldo'
-                ]
-                
                 # Convertir nombres de columnas a minúsculas y sin espacios para validación
                 df_imported_ventas.columns = df_imported_ventas.columns.str.lower().str.replace(' ', '_')
 
                 # Validar que las columnas necesarias existan
-                if not all(col in df_imported_ventas.columns for col in expected_cols_raw_ventas):
-                    st.error(f"❌ El archivo importado no tiene las columnas requeridas o tienen nombres incorrectos. Asegúrate de que existan: {', '.join(expected_cols_raw_ventas)}")
+                faltantes = validacion.columnas_faltantes(df_imported_ventas, 'ventas')
+                if faltantes:
+                    st.error(f"❌ El archivo importado no tiene las columnas requeridas o tienen nombres incorrectos. Faltan: {', '.join(faltantes)}")
                 else:
-                    # Convertir el DataFrame importado para que coincida con el formato de fecha esperado
-                    # y asegurar tipos de datos correctos antes de concatenar
-                    for col in ['cantidad']:
-                        if col in df_imported_ventas.columns:
-                            df_imported_ventas[col] = pd.to_numeric(df_imported_ventas[col], errors='coerce').fillna(0).astype(int)
-                    for col in ['libras', 'descuento', 'libras_netas', 'precio', 'total_a_cobrar', 'pago_cliente', 'saldo']:
-                         if col in df_imported_ventas.columns:
-                            df_imported_ventas[col] = pd.to_numeric(df_imported_ventas[col], errors='coerce').fillna(0.0).round(2)
-                    
-                    if 'fecha' in df_imported_ventas.columns:
-                        df_imported_ventas['fecha'] = pd.to_datetime(df_imported_ventas['fecha'], errors='coerce').dt.date
-                        df_imported_ventas.dropna(subset=['fecha'], inplace=True) # Eliminar filas sin fecha válida
-                    else:
-                        st.error("❌ La columna 'fecha' es obligatoria para importar ventas.")
-                        df_imported_ventas = pd.DataFrame() # Vaciar el DF si no hay fecha válida
+                    # Tipos, rangos y listas de clientes y tipos de ave, fila por fila; las filas con errores se omiten
+                    df_imported_ventas = validar_importacion(df_imported_ventas, 'ventas', uploaded_file_ventas.name)
 
                     if not df_imported_ventas.empty:
-                        # Filtrar solo las columnas que necesitamos para la concatenación y reordenar
-                        df_imported_ventas = df_imported_ventas[expected_cols_raw_ventas]
+                        columnas_montos = ['libras', 'descuento', 'libras_netas', 'precio', 'total_a_cobrar', 'pago_cliente', 'saldo']
+                        df_imported_ventas[columnas_montos] = df_imported_ventas[columnas_montos].round(2)
+                        df_imported_ventas = df_imported_ventas[COLUMNS_VENTAS]
 
-                        # Concatena el nuevo DataFrame con el existente
-                        initial_rows = len(st.session_state.ventas_raw_data)
-                        st.session_state.ventas_raw_data = pd.concat([st.session_state.ventas_raw_data, df_imported_ventas], ignore_index=True)
-                        # Eliminar duplicados basándose en un subconjunto de columnas que definan una venta única
-                        st.session_state.ventas_raw_data.drop_duplicates(subset=['fecha', 'cliente', 'tipo', 'cantidad', 'libras', 'precio'], keep='first', inplace=True) 
-                        
-                        rows_imported = len(st.session_state.ventas_raw_data) - initial_rows
+                        # Solo las filas del archivo se comparan contra el índice de claves existente
+                        rows_imported, duplicados = importar_filas_nuevas(
+                            df_imported_ventas, 'ventas', VENTAS_KEYS_FILE, KEY_COLUMNS_VENTAS, uploaded_file_ventas.name
+                        )
+                        if duplicados:
+                            st.info(f"Se omitieron **{duplicados}** venta(s) duplicada(s) de '{uploaded_file_ventas.name}'.")
 
                         if rows_imported > 0:
-                            guardar_dataframes_en_archivos() # Guardar después de la importación
-                            st.session_state.ventas_data = get_ventas_df_processed() # Actualiza el df procesado
+                            ventas_data = get_ventas_df_processed() # Actualiza el df procesado
                             st.success(f"✅ Se importaron **{rows_imported}** ventas exitosamente desde el archivo.")
                             st.rerun()
                         else:
@@ -552,7 +435,7 @@ else:
 
 
 # Botón para limpiar datos de ventas
-if not st.session_state.ventas_raw_data.empty: # Usar raw_data para la condición
+if not ventas_gastos.obtener_tabla('ventas').empty: # Usar la tabla sin procesar para la condición
     with st.expander("🗑️ Opciones Avanzadas de Ventas (Eliminar Datos)"):
         st.error("¡Esta acción eliminará PERMANENTEMENTE todas las ventas! Úsala con extrema precaución y solo si estás seguro.")
         # Primer nivel de confirmación
@@ -564,7 +447,7 @@ if not st.session_state.ventas_raw_data.empty: # Usar raw_data para la condició
         if st.session_state.get('confirm_delete_ventas', False):
             if st.button("🚨 CONFIRMAR ELIMINACIÓN PERMANENTE DE VENTAS 🚨", type="danger", use_container_width=True, key="limpiar_ventas_confirm_step2"):
                 if limpiar_ventas(): # Llama a la función de limpieza
-                    st.session_state.ventas_data = get_ventas_df_processed() # Actualiza el df procesado
+                    ventas_data = get_ventas_df_processed() # Actualiza el df procesado
                     st.success("✅ Todas las ventas han sido eliminadas exitosamente.")
                 else:
                     st.error("❌ Ocurrió un error al intentar eliminar las ventas.")
@@ -613,7 +496,7 @@ with st.expander("📝 Formulario de Nuevo Gasto", expanded=False): # Cambiado a
             }
             
             if guardar_gasto(gasto_data): # Llama a la función que guarda en session_state y archivo
-                st.session_state.gastos_data = get_gastos_df_processed() # Actualiza el df procesado
+                gastos_data = get_gastos_df_processed() # Actualiza el df procesado
                 st.success(f"✅ Gasto de **'{categoria_gasto}'** por {formatear_moneda(dinero)} guardado exitosamente.")
             else:
                 st.error(f"❌ Error al guardar el gasto para **'{categoria_gasto}'**.")
@@ -631,11 +514,11 @@ with st.expander("📝 Formulario de Nuevo Gasto", expanded=False): # Cambiado a
 st.divider()
 
 ### 📈 Historial de Gastos (con edición y eliminación)
-if not st.session_state.gastos_data.empty:
+if not gastos_data.empty:
     st.subheader("📈 Historial de Gastos (Editar / Eliminar)")
 
     # Crear un DataFrame para la edición con una columna 'Seleccionar'
-    df_editable_gastos = st.session_state.gastos_raw_data.copy()
+    df_editable_gastos = ventas_gastos.obtener_tabla('gastos').copy()
 
     # Asegúrate de que las columnas de fecha sean objetos date para el editor
     if 'fecha' in df_editable_gastos.columns:
@@ -655,7 +538,7 @@ if not st.session_state.gastos_data.empty:
         for index, updates in st.session_state.gastos_data_editor['edited_rows'].items():
             if actualizar_gasto(index, updates):
                 st.success(f"✅ Gasto en la fila {index+1} actualizado exitosamente.")
-                st.session_state.gastos_data = get_gastos_df_processed() # Actualizar el df procesado
+                gastos_data = get_gastos_df_processed() # Actualizar el df procesado
                 # st.rerun() # Opcional: recargar la página para ver los cambios inmediatamente
 
     # Botón de eliminación
@@ -664,13 +547,13 @@ if not st.session_state.gastos_data.empty:
         if st.button(f"🚨 Confirmar Eliminación de Gasto(s) Seleccionado(s) ({len(st.session_state.gastos_data_editor['deleted_rows'])})", type="danger", key="confirm_delete_selected_gastos"):
             if eliminar_gastos_seleccionados(st.session_state.gastos_data_editor['deleted_rows']):
                 st.success(f"✅ Gasto(s) eliminados(s) exitosamente.")
-                st.session_state.gastos_data = get_gastos_df_processed()
+                gastos_data = get_gastos_df_processed()
                 st.rerun() # Recargar para reflejar la eliminación
             else:
                 st.error("❌ Error al eliminar el(los) gasto(s).")
     
     # Resumen de gastos
-    total_gastos = st.session_state.gastos_raw_data['dinero'].sum()
+    total_gastos = ventas_gastos.obtener_tabla('gastos')['dinero'].sum()
     st.metric("💸 Total Gastos Registrados", formatear_moneda(total_gastos))
 
     st.divider()
@@ -680,7 +563,7 @@ if not st.session_state.gastos_data.empty:
 
     with col_exp_imp_gastos_1:
         # Botón para descargar a Excel
-        df_for_download_gastos = st.session_state.gastos_raw_data.copy()
+        df_for_download_gastos = ventas_gastos.obtener_tabla('gastos').copy()
         if not df_for_download_gastos.empty:
             df_for_download_gastos['fecha'] = pd.to_datetime(df_for_download_gastos['fecha']).dt.strftime('%Y-%m-%d') # Formato de fecha para Excel
             
@@ -709,47 +592,30 @@ if not st.session_state.gastos_data.empty:
                 else: # .csv
                     df_imported_gastos = pd.read_csv(uploaded_file_gastos)
                 
-                # Nombres de columnas esperados (minúsculas y sin espacios)
-                expected_cols_raw_gastos = [
-                    'fecha', 'calculo', 'descripcion', 'gasto', 'dinero'
-                ]
-
                 # Convertir nombres de columnas a minúsculas y sin espacios para validación
                 df_imported_gastos.columns = df_imported_gastos.columns.str.lower().str.replace(' ', '_')
 
                 # Validar que las columnas necesarias existan
-                if not all(col in df_imported_gastos.columns for col in expected_cols_raw_gastos):
-                    st.error(f"❌ El archivo importado no tiene las columnas requeridas o tienen nombres incorrectos. Asegúrate de que existan: {', '.join(expected_cols_raw_gastos)}")
+                faltantes = validacion.columnas_faltantes(df_imported_gastos, 'gastos')
+                if faltantes:
+                    st.error(f"❌ El archivo importado no tiene las columnas requeridas o tienen nombres incorrectos. Faltan: {', '.join(faltantes)}")
                 else:
-                    # Convertir el DataFrame importado para que coincida con el formato de fecha esperado
-                    # y asegurar tipos de datos correctos antes de concatenar
-                    for col in ['calculo', 'dinero']:
-                         if col in df_imported_gastos.columns:
-                            df_imported_gastos[col] = pd.to_numeric(df_imported_gastos[col], errors='coerce').fillna(0.0).round(2)
-                    
-                    if 'fecha' in df_imported_gastos.columns:
-                        df_imported_gastos['fecha'] = pd.to_datetime(df_imported_gastos['fecha'], errors='coerce').dt.date
-                        df_imported_gastos.dropna(subset=['fecha'], inplace=True) # Eliminar filas sin fecha válida
-                    else:
-                        st.error("❌ La columna 'fecha' es obligatoria para importar gastos.")
-                        df_imported_gastos = pd.DataFrame() # Vaciar el DF si no hay fecha válida
-
+                    # Tipos, rangos y categorías, fila por fila; las filas con errores se omiten
+                    df_imported_gastos = validar_importacion(df_imported_gastos, 'gastos', uploaded_file_gastos.name)
 
                     if not df_imported_gastos.empty:
-                        # Filtrar solo las columnas que necesitamos para la concatenación
-                        df_imported_gastos = df_imported_gastos[expected_cols_raw_gastos]
+                        df_imported_gastos[['calculo', 'dinero']] = df_imported_gastos[['calculo', 'dinero']].round(2)
+                        df_imported_gastos = df_imported_gastos[COLUMNS_GASTOS]
 
-                        # Concatena el nuevo DataFrame con el existente
-                        initial_rows = len(st.session_state.gastos_raw_data)
-                        st.session_state.gastos_raw_data = pd.concat([st.session_state.gastos_raw_data, df_imported_gastos], ignore_index=True)
-                        # Eliminar duplicados basándose en un subconjunto de columnas que definan un gasto único
-                        st.session_state.gastos_raw_data.drop_duplicates(subset=['fecha', 'gasto', 'dinero'], keep='first', inplace=True) 
-                        
-                        rows_imported = len(st.session_state.gastos_raw_data) - initial_rows
+                        # Solo las filas del archivo se comparan contra el índice de claves existente
+                        rows_imported, duplicados = importar_filas_nuevas(
+                            df_imported_gastos, 'gastos', GASTOS_KEYS_FILE, KEY_COLUMNS_GASTOS, uploaded_file_gastos.name
+                        )
+                        if duplicados:
+                            st.info(f"Se omitieron **{duplicados}** gasto(s) duplicado(s) de '{uploaded_file_gastos.name}'.")
 
                         if rows_imported > 0:
-                            guardar_dataframes_en_archivos() # Guardar después de la importación
-                            st.session_state.gastos_data = get_gastos_df_processed() # Actualiza el df procesado
+                            gastos_data = get_gastos_df_processed() # Actualiza el df procesado
                             st.success(f"✅ Se importaron **{rows_imported}** gastos exitosamente desde el archivo.")
                             st.rerun()
                         else:
@@ -763,7 +629,7 @@ else:
     st.info("📝 No hay gastos registrados. ¡Empieza a agregar gastos usando el formulario de arriba!")
 
 # Botón para limpiar datos de gastos
-if not st.session_state.gastos_raw_data.empty: # Usar raw_data para la condición
+if not ventas_gastos.obtener_tabla('gastos').empty: # Usar la tabla sin procesar para la condición
     with st.expander("🗑️ Opciones Avanzadas de Gastos (Eliminar Datos)"):
         st.error("¡Esta acción eliminará PERMANENTEMENTE todos los gastos! Úsala con extrema precaución y solo si estás seguro.")
         # Primer nivel de confirmación
@@ -775,7 +641,7 @@ if not st.session_state.gastos_raw_data.empty: # Usar raw_data para la condició
         if st.session_state.get('confirm_delete_gastos', False):
             if st.button("🚨 CONFIRMAR ELIMINACIÓN PERMANENTE DE GASTOS 🚨", type="danger", use_container_width=True, key="limpiar_gastos_confirm_step2"):
                 if limpiar_gastos(): # Llama a la función de limpieza
-                    st.session_state.gastos_data = get_gastos_df_processed() # Actualiza el df procesado
+                    gastos_data = get_gastos_df_processed() # Actualiza el df procesado
                     st.success("✅ Todos los gastos han sido eliminados exitosamente.")
                 else:
                     st.error("❌ Ocurrió un error al intentar eliminar los gastos.")
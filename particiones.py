@@ -0,0 +1,575 @@
+"""Almacenamiento particionado por mes para los registros de ambas aplicaciones.
+
+Cada tabla se guarda en data/particiones/<tabla>/<AAAA-MM>.<ext>. Junto a las
+particiones se mantiene un _resumen.pkl con, por mes (y por cliente, proveedor
+o categoría), la cantidad de filas y las sumas principales, de modo que las
+vistas de solo totales no necesitan leer filas.
+
+Además, el cubo diario (_cubo/<AAAA-MM>.pkl, un archivo por mes) guarda los mismos
+totales por día y por dimensiones (cliente y tipo, categoría, proveedor...), para
+que los reportes corten y detallen por año, mes o día sin leer filas. Ambos se
+actualizan solo en los meses que se escriben, y al agregar filas solo se suman
+sus días: el costo de cada escritura no crece con el historial.
+
+Las lecturas esperan primero las escrituras diferidas pendientes de la misma
+tabla (ver escritura_diferida.py), así siempre ven lo último que se guardó.
+
+Todas las rutas están dentro de la carpeta de la sucursal activa (ver sucursales.py).
+"""
+import csv
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import escritura_diferida
+import sucursales
+
+# Relativa a la carpeta de la sucursal
+PARTITIONS_DIR = os.path.join('data', 'particiones')
+RESUMEN_FILE = '_resumen.pkl'
+CUBO_DIR = '_cubo'
+# Suma mensual del Saldo diario ajustado de proveedores (para el saldo de apertura)
+SALDOS_FILE = '_saldos.pkl'
+# Cargos y abonos mensuales por proveedor (saldo de apertura del estado de cuenta)
+ESTADO_PROVEEDORES_FILE = '_estado_proveedores.pkl'
+COLUMNAS_ESTADO_PROVEEDORES = ['mes', 'Proveedor', 'Cargo', 'Abono']
+# Partición para filas cuya fecha no se pudo interpretar
+MES_SIN_FECHA = 'sin-fecha'
+
+TABLAS = {
+    'proveedores': {
+        'ext': '.pkl', 'fecha': 'Fecha', 'grupo': 'Proveedor', 'n': 'N',
+        'sumas': ['Cantidad', 'Libras Restantes', 'Total ($)', 'Saldo diario'], 'cubo': ['Proveedor', 'Producto']
+    },
+    'depositos': {
+        'ext': '.pkl', 'fecha': 'Fecha', 'grupo': 'Empresa', 'n': 'N',
+        'sumas': ['Monto'], 'cubo': ['Empresa']
+    },
+    'notas_debito': {
+        'ext': '.pkl', 'fecha': 'Fecha', 'grupo': None, 'n': None,
+        'sumas': ['Descuento real'], 'cubo': []
+    },
+    'ventas': {
+        'ext': '.csv', 'fecha': 'fecha', 'grupo': 'cliente', 'n': None,
+        'sumas': ['cantidad', 'libras_netas', 'total_a_cobrar', 'pago_cliente', 'saldo'], 'cubo': ['cliente', 'tipo']
+    },
+    'gastos': {
+        'ext': '.csv', 'fecha': 'fecha', 'grupo': 'gasto', 'n': None,
+        'sumas': ['dinero'], 'cubo': ['gasto']
+    },
+}
+
+
+def ruta_particiones(*partes):
+    """Ruta dentro del directorio de particiones de la sucursal activa."""
+    return sucursales.ruta(os.path.join(PARTITIONS_DIR, *partes))
+
+
+def ruta_tabla(tabla):
+    """Directorio donde se guardan las particiones de una tabla."""
+    return ruta_particiones(tabla)
+
+
+def ruta_particion(tabla, mes):
+    """Ruta del archivo de un mes de una tabla."""
+    return os.path.join(ruta_tabla(tabla), f"{mes}{TABLAS[tabla]['ext']}")
+
+
+def mes_de(fechas):
+    """Convierte una serie de fechas en claves de mes 'AAAA-MM'."""
+    meses = pd.to_datetime(pd.Series(fechas), errors='coerce').dt.strftime('%Y-%m')
+    return meses.fillna(MES_SIN_FECHA).astype(str)
+
+
+def meses_en_rango(inicio, fin):
+    """Lista de meses 'AAAA-MM' que cubren el rango de fechas [inicio, fin]."""
+    if fin < inicio:
+        inicio, fin = fin, inicio
+    return [p.strftime('%Y-%m') for p in pd.period_range(inicio, fin, freq='M')]
+
+
+def listar_meses(tabla):
+    """Meses que tienen partición guardada para la tabla, en orden."""
+    escritura_diferida.esperar(tabla)
+    directorio = ruta_tabla(tabla)
+    if not os.path.isdir(directorio):
+        return []
+    ext = TABLAS[tabla]['ext']
+    return sorted(
+        nombre[:-len(ext)] for nombre in os.listdir(directorio)
+        if nombre.endswith(ext) and not nombre.startswith('_')
+    )
+
+
+def mtime_particion(tabla, mes):
+    """mtime_ns de la partición, o None si no existe (útil como clave de caché)."""
+    escritura_diferida.esperar(tabla)
+    try:
+        return os.stat(ruta_particion(tabla, mes)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def leer_particion(tabla, mes):
+    """Lee un mes de una tabla; devuelve un DataFrame vacío si no existe."""
+    escritura_diferida.esperar(tabla)
+    ruta = ruta_particion(tabla, mes)
+    if not os.path.exists(ruta):
+        return pd.DataFrame()
+    if TABLAS[tabla]['ext'] == '.pkl':
+        return pd.read_pickle(ruta)
+    return pd.read_csv(ruta)
+
+
+def leer_meses(tabla, meses=None):
+    """Concatena las particiones de los meses indicados (todos si meses es None)."""
+    meses = listar_meses(tabla) if meses is None else meses
+    partes = [leer_particion(tabla, mes) for mes in meses]
+    partes = [parte for parte in partes if not parte.empty]
+    if not partes:
+        return pd.DataFrame()
+    return pd.concat(partes, ignore_index=True)
+
+
+def _escribir_archivo(tabla, df, ruta):
+    """Escribe un DataFrame de forma atómica (archivo temporal + reemplazo)."""
+    temporal = ruta + '.tmp'
+    if TABLAS[tabla]['ext'] == '.pkl':
+        df.to_pickle(temporal)
+    else:
+        df_to_save = df.copy()
+        columna_fecha = TABLAS[tabla]['fecha']
+        if columna_fecha in df_to_save.columns:
+            df_to_save[columna_fecha] = pd.to_datetime(df_to_save[columna_fecha], errors='coerce').dt.strftime('%Y-%m-%d')
+        df_to_save.to_csv(temporal, index=False)
+    os.replace(temporal, ruta)
+
+
+def escribir_meses(tabla, df, meses):
+    """Reescribe las particiones de los meses indicados con las filas de df.
+
+    Los meses sin filas en df se eliminan del disco. Las demás particiones no se tocan.
+    """
+    os.makedirs(ruta_tabla(tabla), exist_ok=True)
+    meses_df = mes_de(df[TABLAS[tabla]['fecha']]).to_numpy() if not df.empty else np.array([], dtype=object)
+    meses = sorted(set(meses))
+    for mes in meses:
+        filas = df[meses_df == mes]
+        ruta = ruta_particion(tabla, mes)
+        if filas.empty:
+            if os.path.exists(ruta):
+                os.remove(ruta)
+        else:
+            _escribir_archivo(tabla, filas, ruta)
+    # El resumen y el cubo solo necesitan las filas de esos meses
+    df = df[np.isin(meses_df, meses)]
+    actualizar_resumen(tabla, df, meses)
+    actualizar_cubo(tabla, df, meses)
+
+
+def _combinar_escrituras(anteriores, nuevos):
+    """Dos escrituras pendientes de una tabla: sus operaciones en orden de llegada."""
+    tabla, operaciones = nuevos
+    return tabla, anteriores[1] + operaciones
+
+
+def _escribir_pendientes(tabla, operaciones):
+    """Ejecuta las operaciones encoladas de una tabla: ('reescribir', df, meses) o ('agregar', filas, al_agregar).
+
+    Cada mes se reescribe una sola vez, con la reescritura más reciente que lo
+    incluye; las filas agregadas antes de esa reescritura ya están en ella. Las
+    demás filas agregadas se escriben al final, todas juntas.
+    """
+    ultima_reescritura = {}
+    for posicion, (tipo, df, meses) in enumerate(operaciones):
+        if tipo == 'reescribir':
+            ultima_reescritura.update(dict.fromkeys(meses, posicion))
+    for posicion, (tipo, df, meses) in enumerate(operaciones):
+        if tipo == 'reescribir':
+            propios = {mes for mes in meses if ultima_reescritura[mes] == posicion}
+            if propios:
+                escribir_meses(tabla, df, propios)
+    agregadas, avisos = [], []
+    for posicion, (tipo, filas, al_agregar) in enumerate(operaciones):
+        if tipo != 'agregar':
+            continue
+        meses_filas = mes_de(filas[TABLAS[tabla]['fecha']]).to_numpy()
+        sin_reescribir = np.array([ultima_reescritura.get(mes, -1) < posicion for mes in meses_filas], dtype=bool)
+        if sin_reescribir.all():
+            avisos.append(al_agregar)
+        if sin_reescribir.any():
+            agregadas.append(filas[sin_reescribir])
+    if not agregadas:
+        return
+    firma_anterior = firma_tabla(tabla)
+    agregar_filas(tabla, pd.concat(agregadas, ignore_index=True) if len(agregadas) > 1 else agregadas[0])
+    firma_nueva = firma_tabla(tabla)
+    for al_agregar in avisos:
+        if al_agregar is not None:
+            al_agregar(firma_anterior, firma_nueva)
+
+
+def programar_escritura(tabla, df, meses, copiar=True):
+    """Igual que escribir_meses, pero en segundo plano si la escritura diferida está activa.
+
+    Se encola una copia de df, de modo que los cambios posteriores en memoria no
+    alteran lo que se va a escribir (copiar=False si df ya no se va a modificar).
+    """
+    if not escritura_diferida.activa():
+        escritura_diferida.esperar(tabla)  # Las escrituras de otras sesiones aún en cola van primero
+        escribir_meses(tabla, df, meses)
+        return
+    df = df.copy() if copiar else df
+    escritura_diferida.encolar(tabla, _escribir_pendientes, (tabla, [('reescribir', df, set(meses))]), _combinar_escrituras)
+
+
+def programar_agregado(tabla, df_filas, al_agregar=None):
+    """Igual que agregar_filas, pero en segundo plano si la escritura diferida está activa.
+
+    Los agregados seguidos de una tabla se combinan en uno solo. al_agregar(firma
+    anterior, firma nueva) se llama después de escribir las filas (por ejemplo, para
+    sumarlas al índice de claves); no se llama si una reescritura posterior las absorbió.
+    """
+    if not escritura_diferida.activa():
+        escritura_diferida.esperar(tabla)
+        _escribir_pendientes(tabla, [('agregar', df_filas, al_agregar)])
+        return
+    escritura_diferida.encolar(
+        tabla, _escribir_pendientes, (tabla, [('agregar', df_filas.copy(), al_agregar)]), _combinar_escrituras
+    )
+
+
+def _sumar_resumen(resumen, nuevo, claves):
+    """Suma dos resúmenes por claves (filas y sumas se suman, n_max se toma el mayor)."""
+    partes = [parte for parte in (resumen, nuevo) if not parte.empty]
+    if len(partes) < 2:
+        return partes[0] if partes else nuevo
+    agregaciones = {col: ('max' if col == 'n_max' else 'sum') for col in nuevo.columns if col not in claves}
+    return pd.concat(partes, ignore_index=True).groupby(claves, as_index=False).agg(agregaciones)[list(nuevo.columns)]
+
+
+def agregar_filas(tabla, df_filas):
+    """Agrega filas al final de sus particiones sin reescribir el historial.
+
+    Las particiones CSV solo reciben las filas nuevas; las pkl se leen y reescriben
+    solo en los meses de las filas. El resumen y el cubo suman lo agregado en lugar
+    de recalcular sus meses.
+    """
+    spec = TABLAS[tabla]
+    meses_filas = mes_de(df_filas[spec['fecha']]).to_numpy()
+    os.makedirs(ruta_tabla(tabla), exist_ok=True)
+    for mes in sorted(set(meses_filas)):
+        filas_mes = df_filas[meses_filas == mes]
+        ruta = ruta_particion(tabla, mes)
+        if spec['ext'] != '.csv':
+            actual = leer_particion(tabla, mes)
+            _escribir_archivo(tabla, pd.concat([actual, filas_mes], ignore_index=True) if not actual.empty else filas_mes, ruta)
+            continue
+        df_to_save = filas_mes.copy()
+        df_to_save[spec['fecha']] = pd.to_datetime(df_to_save[spec['fecha']], errors='coerce').dt.strftime('%Y-%m-%d')
+        archivo_con_filas = os.path.exists(ruta) and os.path.getsize(ruta) > 0
+        if archivo_con_filas:
+            # Respetar el orden de columnas del encabezado existente
+            with open(ruta, 'r', encoding='utf-8', newline='') as f:
+                encabezado = next(csv.reader(f), [])
+            if encabezado:
+                df_to_save = df_to_save.reindex(columns=encabezado)
+            with open(ruta, 'rb+') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    f.write(b'\n')
+        df_to_save.to_csv(ruta, mode='a', header=not archivo_con_filas, index=False)
+    sumar_al_resumen(tabla, df_filas)
+    sumar_al_cubo(tabla, df_filas)
+
+
+def eliminar_tabla(tabla):
+    """Elimina todas las particiones, el resumen y el cubo de una tabla."""
+    escritura_diferida.esperar(tabla)
+    directorio = ruta_tabla(tabla)
+    if not os.path.isdir(directorio):
+        return
+    for nombre in os.listdir(directorio):
+        ruta = os.path.join(directorio, nombre)
+        if os.path.isdir(ruta):
+            shutil.rmtree(ruta)
+        else:
+            os.remove(ruta)
+
+
+def firma_tabla(tabla):
+    """(tamaño total, mtime_ns máximo) de las particiones de una tabla, como uint64.
+
+    Cambia con cualquier escritura de filas; no la afecta el archivo de resumen.
+    """
+    escritura_diferida.esperar(tabla)
+    directorio = ruta_tabla(tabla)
+    tamano, mtime = 0, 0
+    if os.path.isdir(directorio):
+        for entrada in os.scandir(directorio):
+            if entrada.is_file() and not entrada.name.startswith('_') and not entrada.name.endswith('.tmp'):
+                stat = entrada.stat()
+                tamano += stat.st_size
+                mtime = max(mtime, stat.st_mtime_ns)
+    return np.array([tamano, mtime], dtype=np.uint64)
+
+
+# --- Resúmenes por mes ---
+def _columnas_resumen(tabla):
+    spec = TABLAS[tabla]
+    columnas = ['mes'] + ([spec['grupo']] if spec['grupo'] else []) + ['filas'] + spec['sumas']
+    return columnas + (['n_max'] if spec['n'] else [])
+
+
+def resumir(tabla, df):
+    """Calcula filas y sumas por mes (y grupo) de un DataFrame de la tabla."""
+    spec = TABLAS[tabla]
+    if df.empty:
+        return pd.DataFrame(columns=_columnas_resumen(tabla))
+    base = pd.DataFrame({'mes': mes_de(df[spec['fecha']]).to_numpy()})
+    claves = ['mes']
+    if spec['grupo']:
+        base[spec['grupo']] = df[spec['grupo']].astype(str).to_numpy()
+        claves.append(spec['grupo'])
+    agregaciones = {'filas': ('mes', 'size')}
+    for col in spec['sumas']:
+        base[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).to_numpy() if col in df.columns else 0.0
+        agregaciones[col] = (col, 'sum')
+    if spec['n']:
+        base['n_max'] = pd.to_numeric(df[spec['n']], errors='coerce').fillna(0).to_numpy()
+        agregaciones['n_max'] = ('n_max', 'max')
+    return base.groupby(claves).agg(**agregaciones).reset_index()[_columnas_resumen(tabla)]
+
+
+def leer_resumen(tabla):
+    """Lee el resumen por mes de una tabla (vacío si no existe)."""
+    escritura_diferida.esperar(tabla)
+    ruta = os.path.join(ruta_tabla(tabla), RESUMEN_FILE)
+    if os.path.exists(ruta):
+        try:
+            return pd.read_pickle(ruta)
+        except Exception:
+            pass
+    return pd.DataFrame(columns=_columnas_resumen(tabla))
+
+
+def actualizar_resumen(tabla, df, meses):
+    """Reemplaza en el resumen las filas de los meses indicados con lo que hay en df."""
+    spec = TABLAS[tabla]
+    meses = set(meses)
+    if not df.empty:
+        df = df[mes_de(df[spec['fecha']]).isin(meses).to_numpy()]
+    resumen = leer_resumen(tabla)
+    resumen = resumen[~resumen['mes'].isin(meses)]
+    nuevo = resumir(tabla, df)
+    partes = [parte for parte in (resumen, nuevo) if not parte.empty]
+    resumen = pd.concat(partes, ignore_index=True) if partes else nuevo
+    os.makedirs(ruta_tabla(tabla), exist_ok=True)
+    resumen.sort_values('mes').reset_index(drop=True).to_pickle(os.path.join(ruta_tabla(tabla), RESUMEN_FILE))
+
+
+def sumar_al_resumen(tabla, df_filas):
+    """Suma al resumen las filas agregadas, sin recalcular sus meses."""
+    spec = TABLAS[tabla]
+    claves = ['mes'] + ([spec['grupo']] if spec['grupo'] else [])
+    resumen = _sumar_resumen(leer_resumen(tabla), resumir(tabla, df_filas), claves)
+    os.makedirs(ruta_tabla(tabla), exist_ok=True)
+    resumen.sort_values('mes').reset_index(drop=True).to_pickle(os.path.join(ruta_tabla(tabla), RESUMEN_FILE))
+
+
+# --- Cubo diario para reportes ---
+def _columnas_cubo(tabla):
+    spec = TABLAS[tabla]
+    return ['dia', 'mes'] + spec['cubo'] + ['filas'] + spec['sumas']
+
+
+def resumir_dias(tabla, df):
+    """Calcula filas y sumas por día y por las dimensiones del cubo (sin las filas sin fecha)."""
+    spec = TABLAS[tabla]
+    if df.empty:
+        return pd.DataFrame(columns=_columnas_cubo(tabla))
+    base = pd.DataFrame({'dia': pd.to_datetime(df[spec['fecha']], errors='coerce').dt.normalize().to_numpy()})
+    for col in spec['cubo']:
+        base[col] = df[col].astype(str).to_numpy() if col in df.columns else ''
+    agregaciones = {'filas': ('dia', 'size')}
+    for col in spec['sumas']:
+        base[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).to_numpy() if col in df.columns else 0.0
+        agregaciones[col] = (col, 'sum')
+    cubo = base.dropna(subset=['dia']).groupby(['dia'] + spec['cubo']).agg(**agregaciones).reset_index()
+    cubo['mes'] = cubo['dia'].dt.strftime('%Y-%m')
+    return cubo[_columnas_cubo(tabla)]
+
+
+def _ruta_cubo(tabla, *partes):
+    return os.path.join(ruta_tabla(tabla), CUBO_DIR, *partes)
+
+
+def _leer_cubo_mes(tabla, mes):
+    """Cubo de un mes (vacío si no hay archivo)."""
+    ruta = _ruta_cubo(tabla, f"{mes}.pkl")
+    if os.path.exists(ruta):
+        return pd.read_pickle(ruta)
+    return pd.DataFrame(columns=_columnas_cubo(tabla))
+
+
+def _guardar_cubo_mes(tabla, mes, cubo):
+    """Escribe el cubo de un mes de forma atómica; un mes sin días se borra."""
+    ruta = _ruta_cubo(tabla, f"{mes}.pkl")
+    if cubo.empty:
+        if os.path.exists(ruta):
+            os.remove(ruta)
+        return
+    os.makedirs(_ruta_cubo(tabla), exist_ok=True)
+    cubo.sort_values(['dia'] + TABLAS[tabla]['cubo']).reset_index(drop=True).to_pickle(ruta + '.tmp')
+    os.replace(ruta + '.tmp', ruta)
+
+
+def _construir_cubo(tabla):
+    """Construye el cubo desde las particiones, un mes a la vez."""
+    if os.path.isdir(_ruta_cubo(tabla)):
+        shutil.rmtree(_ruta_cubo(tabla))
+    os.makedirs(_ruta_cubo(tabla))
+    for mes in listar_meses(tabla):
+        cubo = resumir_dias(tabla, leer_particion(tabla, mes))
+        for mes_cubo, parte in cubo.groupby('mes'):
+            _guardar_cubo_mes(tabla, mes_cubo, parte)
+    # El cubo de un solo archivo de versiones anteriores ya no se usa
+    anterior = os.path.join(ruta_tabla(tabla), '_cubo.pkl')
+    if os.path.exists(anterior):
+        os.remove(anterior)
+
+
+def _leer_cubo_guardado(tabla):
+    """Concatena los archivos del cubo; None si falta o si cambiaron sus dimensiones."""
+    if not os.path.isdir(_ruta_cubo(tabla)):
+        return None
+    try:
+        partes = [
+            pd.read_pickle(_ruta_cubo(tabla, nombre))
+            for nombre in sorted(os.listdir(_ruta_cubo(tabla))) if nombre.endswith('.pkl')
+        ]
+    except Exception:
+        return None
+    if any(list(parte.columns) != _columnas_cubo(tabla) for parte in partes):
+        return None
+    if not partes:
+        return pd.DataFrame(columns=_columnas_cubo(tabla))
+    return pd.concat(partes, ignore_index=True)
+
+
+def leer_cubo(tabla):
+    """Lee el cubo diario de una tabla (todos sus meses); si no existe (o cambiaron sus dimensiones), lo construye."""
+    escritura_diferida.esperar(tabla)
+    cubo = _leer_cubo_guardado(tabla)
+    if cubo is not None:
+        return cubo
+    if not os.path.isdir(ruta_tabla(tabla)):
+        return resumir_dias(tabla, pd.DataFrame())
+    _construir_cubo(tabla)
+    return _leer_cubo_guardado(tabla)
+
+
+def mtime_cubo(tabla):
+    """mtime_ns más reciente del cubo de la tabla (lo construye si falta), útil como clave de caché.
+
+    Cada escritura reemplaza o borra un archivo del directorio del cubo, así que cambia su mtime.
+    """
+    escritura_diferida.esperar(tabla)
+    if not os.path.isdir(_ruta_cubo(tabla)):
+        leer_cubo(tabla)
+    try:
+        with os.scandir(_ruta_cubo(tabla)) as entradas:
+            mtimes = [entrada.stat().st_mtime_ns for entrada in entradas]
+        return max(mtimes + [os.stat(_ruta_cubo(tabla)).st_mtime_ns])
+    except FileNotFoundError:
+        return None
+
+
+def actualizar_cubo(tabla, df, meses):
+    """Reemplaza en el cubo los días de los meses indicados con lo que hay en df (solo sus archivos)."""
+    spec = TABLAS[tabla]
+    meses = set(meses)
+    if not df.empty:
+        df = df[mes_de(df[spec['fecha']]).isin(meses).to_numpy()]
+    if not os.path.isdir(_ruta_cubo(tabla)):
+        return  # Se construirá completo en la primera lectura
+    nuevo = resumir_dias(tabla, df)
+    for mes in meses:
+        _guardar_cubo_mes(tabla, mes, nuevo[nuevo['mes'] == mes])
+
+
+def sumar_al_cubo(tabla, df_filas):
+    """Suma al cubo los días de las filas agregadas: solo se lee y escribe el archivo de sus meses."""
+    if not os.path.isdir(_ruta_cubo(tabla)):
+        return  # Se construirá completo en la primera lectura
+    claves = ['dia', 'mes'] + TABLAS[tabla]['cubo']
+    for mes, nuevo in resumir_dias(tabla, df_filas).groupby('mes'):
+        _guardar_cubo_mes(tabla, mes, _sumar_resumen(_leer_cubo_mes(tabla, mes), nuevo, claves))
+
+
+def leer_saldos():
+    """Serie mes -> suma del Saldo diario ajustado de proveedores, o None si no existe."""
+    if os.path.exists(ruta_particiones(SALDOS_FILE)):
+        try:
+            return pd.read_pickle(ruta_particiones(SALDOS_FILE))
+        except Exception:
+            return None
+    return None
+
+
+def guardar_saldos(saldos_por_mes, meses):
+    """Reemplaza en el resumen de saldos los meses indicados."""
+    actuales = leer_saldos()
+    actuales = pd.Series(dtype=float) if actuales is None else actuales
+    actuales = actuales[~actuales.index.isin(list(meses))]
+    saldos = pd.concat([actuales, saldos_por_mes.astype(float)]).sort_index()
+    os.makedirs(ruta_particiones(), exist_ok=True)
+    saldos.to_pickle(ruta_particiones(SALDOS_FILE))
+
+
+def leer_estado_proveedores():
+    """DataFrame (mes, Proveedor, Cargo, Abono) con los movimientos mensuales por proveedor, o None si no existe."""
+    if os.path.exists(ruta_particiones(ESTADO_PROVEEDORES_FILE)):
+        try:
+            return pd.read_pickle(ruta_particiones(ESTADO_PROVEEDORES_FILE))
+        except Exception:
+            return None
+    return None
+
+
+def guardar_estado_proveedores(movimientos_por_mes, meses):
+    """Reemplaza en el resumen por proveedor los meses indicados."""
+    actuales = leer_estado_proveedores()
+    if actuales is None:
+        actuales = pd.DataFrame(columns=COLUMNAS_ESTADO_PROVEEDORES)
+    actuales = actuales[~actuales['mes'].isin(list(meses))]
+    partes = [parte for parte in (actuales, movimientos_por_mes[COLUMNAS_ESTADO_PROVEEDORES]) if not parte.empty]
+    estado = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(columns=COLUMNAS_ESTADO_PROVEEDORES)
+    os.makedirs(ruta_particiones(), exist_ok=True)
+    estado.sort_values(['mes', 'Proveedor']).reset_index(drop=True).to_pickle(ruta_particiones(ESTADO_PROVEEDORES_FILE))
+
+
+# --- Migración desde los archivos únicos anteriores ---
+def migrar_tabla(tabla, archivo_anterior):
+    """Divide un archivo único (pkl o csv) en particiones mensuales.
+
+    Solo actúa si la tabla aún no tiene directorio de particiones. El archivo
+    original (en la carpeta de la sucursal) se renombra a '<archivo>.migrado'
+    para no volver a importarlo.
+    """
+    archivo_anterior = sucursales.ruta(archivo_anterior)
+    if os.path.isdir(ruta_tabla(tabla)) or not os.path.exists(archivo_anterior):
+        return False
+    if archivo_anterior.endswith('.pkl'):
+        df = pd.read_pickle(archivo_anterior)
+    else:
+        df = pd.read_csv(archivo_anterior)
+    columna_fecha = TABLAS[tabla]['fecha']
+    if columna_fecha in df.columns:
+        df[columna_fecha] = pd.to_datetime(df[columna_fecha], errors='coerce').dt.date
+    meses = set(mes_de(df[columna_fecha])) if columna_fecha in df.columns and not df.empty else set()
+    escribir_meses(tabla, df, meses)
+    os.replace(archivo_anterior, archivo_anterior + '.migrado')
+    return True
@@ -0,0 +1,63 @@
+"""Pronóstico de demanda de ventas por cliente a partir del cubo diario de ventas.
+
+Para cada cliente se calcula un nivel (media móvil exponencial de sus ventas
+diarias, días sin venta incluidos) y un factor por día de la semana (media de
+ese día / media general en la ventana de historia). El pronóstico de un día es
+nivel × factor de su día de la semana. Todos los clientes se calculan a la vez
+sobre una matriz días × clientes, sin recorrerlos uno por uno.
+"""
+import pandas as pd
+
+# Semanas de historia que se usan para el nivel y la estacionalidad semanal
+SEMANAS_HISTORIA = 12
+# Vida media, en días, de la media móvil exponencial del nivel
+VIDA_MEDIA_DIAS = 14
+MEDIDAS = {'libras_netas': 'Libras', 'cantidad': 'Cantidad'}
+COLUMNAS_PRONOSTICO = ['Fecha', 'Cliente', 'Libras', 'Cantidad']
+
+
+def matriz_diaria(cubo, columna, inicio, fin):
+    """Matriz días × clientes con la suma de una columna del cubo entre inicio y fin (0 sin ventas)."""
+    dias = pd.date_range(inicio, fin, freq='D')
+    cubo = cubo[cubo['dia'].between(dias[0], dias[-1])] if len(dias) else cubo.iloc[:0]
+    matriz = cubo.pivot_table(index='dia', columns='cliente', values=columna, aggfunc='sum')
+    return matriz.reindex(dias).fillna(0.0)
+
+
+def pronosticar_medida(matriz, fechas):
+    """Pronóstico días × clientes de una matriz diaria para las fechas indicadas."""
+    if matriz.empty or matriz.columns.empty:
+        return pd.DataFrame(0.0, index=fechas, columns=matriz.columns)
+    nivel = matriz.ewm(halflife=VIDA_MEDIA_DIAS).mean().iloc[-1]
+    por_dia_semana = matriz.groupby(matriz.index.dayofweek).mean().reindex(range(7))
+    factor = por_dia_semana.div(matriz.mean()).fillna(0.0)
+    valores = factor.loc[fechas.dayofweek].to_numpy() * nivel.to_numpy()
+    return pd.DataFrame(valores, index=fechas, columns=matriz.columns)
+
+
+def pronosticar(cubo, desde, dias=7, tipos=None):
+    """Pronóstico por cliente y fecha de libras y cantidad para los días desde `desde`.
+
+    cubo es el cubo diario de ventas (particiones.leer_cubo('ventas')); con tipos
+    se cuentan solo las ventas de esos tipos de ave. La historia termina el día
+    anterior a `desde`.
+    """
+    desde = pd.Timestamp(desde).normalize()
+    fechas = pd.date_range(desde, periods=dias, freq='D')
+    if tipos is not None:
+        cubo = cubo[cubo['tipo'].isin(tipos)]
+    inicio = desde - pd.Timedelta(weeks=SEMANAS_HISTORIA)
+    fin = desde - pd.Timedelta(days=1)
+    partes = {
+        nombre: pronosticar_medida(matriz_diaria(cubo, columna, inicio, fin), fechas).stack()
+        for columna, nombre in MEDIDAS.items()
+    }
+    if any(parte.empty for parte in partes.values()):
+        return pd.DataFrame(columns=COLUMNAS_PRONOSTICO)
+    resultado = pd.DataFrame(partes).rename_axis(['Fecha', 'Cliente']).reset_index()
+    return resultado[COLUMNAS_PRONOSTICO]
+
+
+def totales_por_fecha(pronostico):
+    """Suma de todos los clientes por fecha."""
+    return pronostico.groupby('Fecha')[list(MEDIDAS.values())].sum()
@@ -0,0 +1,260 @@
+"""Respaldos comprimidos (instantáneas) de todos los datos de una sucursal.
+
+Una instantánea copia la carpeta data/ de la sucursal (particiones, resúmenes,
+cartera e índices de claves) dentro de respaldos/. Cada archivo se guarda
+comprimido con zlib una sola vez por contenido (objetos/<sha256>.z) y la
+instantánea es solo un manifiesto JSON {ruta: [hash, tamaño, mtime_ns]}: un mes o
+una tabla que no cambió entre instantáneas no ocupa espacio nuevo, y no se
+vuelve a leer si su tamaño y mtime coinciden con la instantánea anterior.
+
+Se toman cada INTERVALO_HORAS (en la cola de escritura diferida, ver programar)
+y antes de las operaciones destructivas (eliminar todas las filas, importar).
+La rotación conserva las últimas RETENCION['recientes'], la última de cada día de
+los últimos RETENCION['diarias'] días y la última de cada semana de las últimas
+RETENCION['semanales'] semanas; los objetos que ya no usa ninguna se borran.
+
+restaurar() devuelve la carpeta de datos al estado de una instantánea: solo
+descomprime los archivos cuyo contenido cambió y borra los que no existían
+(antes toma una instantánea del estado actual, así la restauración se puede
+deshacer).
+
+Desde la línea de comandos (con la aplicación detenida para restaurar):
+
+    python respaldos.py listar [--sucursal ID]
+    python respaldos.py tomar [--sucursal ID]
+    python respaldos.py restaurar INSTANTANEA [--sucursal ID]
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import zlib
+from datetime import datetime, timedelta
+
+import escritura_diferida
+import sucursales
+
+# Relativas a la carpeta de la sucursal
+DATOS_DIR = 'data'
+RESPALDOS_DIR = 'respaldos'
+INTERVALO_HORAS = 6
+RETENCION = {'recientes': 10, 'diarias': 7, 'semanales': 4}
+NIVEL_COMPRESION = 6
+FORMATO_ID = '%Y%m%d-%H%M%S-%f'
+
+_bloqueo = threading.RLock()
+
+
+def _ruta_respaldos(*partes):
+    return sucursales.ruta(os.path.join(RESPALDOS_DIR, *partes))
+
+
+def _ruta_objeto(hash_archivo):
+    return _ruta_respaldos('objetos', f"{hash_archivo}.z")
+
+
+def _ruta_manifiesto(instantanea):
+    return _ruta_respaldos('instantaneas', f"{instantanea}.json")
+
+
+def _archivos_datos():
+    """{ruta relativa a data/: os.stat} de los archivos de datos de la sucursal activa."""
+    raiz = sucursales.ruta(DATOS_DIR)
+    archivos = {}
+    for directorio, _, nombres in os.walk(raiz):
+        for nombre in nombres:
+            if nombre.endswith('.tmp'):
+                continue
+            ruta = os.path.join(directorio, nombre)
+            archivos[os.path.relpath(ruta, raiz).replace(os.sep, '/')] = os.stat(ruta)
+    return archivos
+
+
+def _hash(ruta):
+    digest = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(bloque)
+    return digest.hexdigest()
+
+
+def _escribir_atomico(ruta, contenido):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    with open(ruta + '.tmp', 'wb') as f:
+        f.write(contenido)
+    os.replace(ruta + '.tmp', ruta)
+
+
+def _guardar_objeto(hash_archivo, ruta):
+    """Guarda el contenido comprimido de un archivo, si ese contenido aún no estaba guardado."""
+    destino = _ruta_objeto(hash_archivo)
+    if not os.path.exists(destino):
+        with open(ruta, 'rb') as f:
+            _escribir_atomico(destino, zlib.compress(f.read(), NIVEL_COMPRESION))
+
+
+def _leer_manifiesto(instantanea):
+    with open(_ruta_manifiesto(instantanea), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _ids():
+    """Identificadores de las instantáneas de la sucursal activa, de la más nueva a la más vieja."""
+    directorio = _ruta_respaldos('instantaneas')
+    if not os.path.isdir(directorio):
+        return []
+    return sorted((n[:-5] for n in os.listdir(directorio) if n.endswith('.json')), reverse=True)
+
+
+def _fecha(instantanea):
+    return datetime.strptime(instantanea, FORMATO_ID)
+
+
+def listar():
+    """Instantáneas de la sucursal activa (la más nueva primero) con fecha, motivo, archivos y tamaño de los datos."""
+    resultado = []
+    for instantanea in _ids():
+        manifiesto = _leer_manifiesto(instantanea)
+        resultado.append({
+            'instantanea': instantanea,
+            'fecha': _fecha(instantanea),
+            'motivo': manifiesto.get('motivo', ''),
+            'archivos': len(manifiesto['archivos']),
+            'bytes': sum(tamano for _, tamano, _ in manifiesto['archivos'].values()),
+        })
+    return resultado
+
+
+def ultima():
+    """Identificador de la instantánea más nueva de la sucursal activa, o None si no hay."""
+    ids = _ids()
+    return ids[0] if ids else None
+
+
+def tomar(motivo='manual'):
+    """Toma una instantánea de los datos de la sucursal activa y rota las anteriores.
+
+    Si nada cambió desde la última, no crea otra y devuelve la última. Devuelve el
+    identificador de la instantánea, o None si no hay datos.
+    """
+    escritura_diferida.esperar()
+    with _bloqueo:
+        ids = _ids()
+        anteriores = _leer_manifiesto(ids[0])['archivos'] if ids else {}
+        raiz = sucursales.ruta(DATOS_DIR)
+        archivos = {}
+        for ruta_relativa, stat in _archivos_datos().items():
+            anterior = anteriores.get(ruta_relativa)
+            if anterior is not None and anterior[1:] == [stat.st_size, stat.st_mtime_ns]:
+                # Mismo tamaño y mtime que en la instantánea anterior: mismo contenido
+                archivos[ruta_relativa] = anterior
+                continue
+            ruta = os.path.join(raiz, ruta_relativa)
+            hash_archivo = _hash(ruta)
+            _guardar_objeto(hash_archivo, ruta)
+            archivos[ruta_relativa] = [hash_archivo, stat.st_size, stat.st_mtime_ns]
+        if not archivos:
+            return None
+        if ids and {r: a[0] for r, a in archivos.items()} == {r: a[0] for r, a in anteriores.items()}:
+            return ids[0]
+        instantanea = datetime.now().strftime(FORMATO_ID)
+        manifiesto = {'motivo': motivo, 'archivos': archivos}
+        _escribir_atomico(_ruta_manifiesto(instantanea), json.dumps(manifiesto).encode('utf-8'))
+        rotar()
+        return instantanea
+
+
+def conservadas(ids, ahora=None):
+    """Instantáneas que conserva la rotación (de una lista de identificadores)."""
+    ahora = ahora or datetime.now()
+    ordenadas = sorted(ids, reverse=True)
+    conservar = set(ordenadas[:RETENCION['recientes']])
+    dias, semanas = set(), set()
+    for instantanea in ordenadas:
+        fecha = _fecha(instantanea)
+        # La primera de cada día o semana recorriendo de nueva a vieja es la última de ese período
+        if (ahora.date() - fecha.date()).days < RETENCION['diarias'] and fecha.date() not in dias:
+            dias.add(fecha.date())
+            conservar.add(instantanea)
+        semana = fecha.isocalendar()[:2]
+        if ahora - fecha < timedelta(weeks=RETENCION['semanales']) and semana not in semanas:
+            semanas.add(semana)
+            conservar.add(instantanea)
+    return conservar
+
+
+def rotar():
+    """Borra las instantáneas que no conserva la rotación y los objetos que ya nadie usa."""
+    with _bloqueo:
+        ids = _ids()
+        conservar = conservadas(ids)
+        for instantanea in ids:
+            if instantanea not in conservar:
+                os.remove(_ruta_manifiesto(instantanea))
+        usados = {archivo[0] for instantanea in conservar for archivo in _leer_manifiesto(instantanea)['archivos'].values()}
+        directorio = _ruta_respaldos('objetos')
+        for nombre in os.listdir(directorio) if os.path.isdir(directorio) else []:
+            if nombre.endswith('.z') and nombre[:-2] not in usados:
+                os.remove(os.path.join(directorio, nombre))
+
+
+def restaurar(instantanea):
+    """Devuelve la carpeta de datos de la sucursal activa al estado de una instantánea.
+
+    Devuelve (archivos escritos, archivos borrados). Las cachés en memoria de los
+    datos quedan desactualizadas: quien llama debe descartarlas.
+    """
+    if instantanea not in _ids():
+        raise ValueError(f"No existe la instantánea {instantanea}.")
+    tomar(f"antes de restaurar {instantanea}")
+    with _bloqueo:
+        archivos = _leer_manifiesto(instantanea)['archivos']
+        raiz = sucursales.ruta(DATOS_DIR)
+        actuales = _archivos_datos()
+        escritos = 0
+        for ruta_relativa, (hash_archivo, tamano, _) in archivos.items():
+            ruta = os.path.join(raiz, ruta_relativa)
+            actual = actuales.get(ruta_relativa)
+            if actual is not None and actual.st_size == tamano and _hash(ruta) == hash_archivo:
+                continue
+            with open(_ruta_objeto(hash_archivo), 'rb') as f:
+                _escribir_atomico(ruta, zlib.decompress(f.read()))
+            escritos += 1
+        borrados = [r for r in actuales if r not in archivos]
+        for ruta_relativa in borrados:
+            os.remove(os.path.join(raiz, ruta_relativa))
+        return escritos, len(borrados)
+
+
+def _tomar_programada():
+    tomar('programada')
+
+
+def programar():
+    """Encola una instantánea si la última tiene más de INTERVALO_HORAS (se llama en cada ejecución)."""
+    ids = _ids()
+    if ids and datetime.now() - _fecha(ids[0]) < timedelta(hours=INTERVALO_HORAS):
+        return False
+    # Va detrás de las escrituras ya encoladas, así la instantánea las incluye
+    escritura_diferida.encolar('respaldo', _tomar_programada)
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Respaldos comprimidos de los datos de una sucursal.')
+    parser.add_argument('accion', choices=['listar', 'tomar', 'restaurar'])
+    parser.add_argument('instantanea', nargs='?')
+    parser.add_argument('--sucursal', default=None)
+    args = parser.parse_args()
+    sucursales.activar(args.sucursal)
+    if args.accion == 'listar':
+        for fila in listar():
+            print(f"{fila['instantanea']}  {fila['motivo']:<30}  {fila['archivos']:>5} archivos  {fila['bytes'] / 1e6:,.1f} MB")
+    elif args.accion == 'tomar':
+        print(tomar() or 'No hay datos para respaldar.')
+    else:
+        if not args.instantanea:
+            parser.error('indica la instantánea a restaurar (ver "listar")')
+        escritos, borrados = restaurar(args.instantanea)
+        print(f"Restaurada {args.instantanea}: {escritos} archivo(s) escritos, {borrados} borrado(s).")
@@ -0,0 +1,162 @@
+"""Sucursales (negocios) atendidas por un mismo servidor, cada una con sus datos.
+
+sucursales.json (opcional, junto a la aplicación) define cada sucursal con su
+carpeta de datos y su configuración; lo que no se indique usa los valores de
+siempre:
+
+    {
+      "sucursales": {
+        "principal": {"nombre": "Posorja"},
+        "norte": {"nombre": "Sucursal Norte", "directorio": "sucursales/norte",
+                  "saldo_inicial": 0, "proveedores": ["LIRIS SA"], "clientes": ["D. Vicente"]}
+      },
+      "memoria_cache_mb": 512
+    }
+
+Sin archivo hay una sola sucursal, 'principal', con la carpeta de la aplicación.
+La sucursal activa es una variable de contexto: cada ejecución de la interfaz (o
+cada petición de la API) la activa al empezar, y las rutas de particiones,
+cartera e índices de claves se resuelven dentro de su carpeta. Las escrituras
+diferidas recuerdan la sucursal con la que se encolaron.
+
+CacheSucursales guarda los datos cargados de cada sucursal bajo un presupuesto
+de memoria y, al pasarse, descarta primero las sucursales usadas hace más tiempo.
+"""
+import contextvars
+import json
+import os
+import threading
+from collections import OrderedDict
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SUCURSALES_FILE = os.path.join(BASE_DIR, 'sucursales.json')
+SUCURSAL_POR_DEFECTO = 'principal'
+MEMORIA_CACHE_MB_POR_DEFECTO = 512
+
+_actual = contextvars.ContextVar('sucursal', default=SUCURSAL_POR_DEFECTO)
+# (mtime_ns del archivo, configuración leída)
+_configuracion = (None, None)
+
+
+def configuracion():
+    """Configuración de sucursales (se relee solo si cambió el archivo)."""
+    global _configuracion
+    try:
+        mtime = os.stat(SUCURSALES_FILE).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    if _configuracion[1] is not None and _configuracion[0] == mtime:
+        return _configuracion[1]
+    config = {'sucursales': {SUCURSAL_POR_DEFECTO: {}}}
+    if mtime is not None:
+        try:
+            with open(SUCURSALES_FILE, encoding='utf-8') as f:
+                config = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"El archivo de sucursales no es un JSON válido: {e}") from e
+        if not isinstance(config.get('sucursales'), dict) or not config['sucursales']:
+            raise ValueError("El archivo de sucursales debe tener un objeto 'sucursales' no vacío.")
+    _configuracion = (mtime, config)
+    return config
+
+
+def listar():
+    """Identificadores de las sucursales configuradas."""
+    return list(configuracion()['sucursales'])
+
+
+def nombre(sucursal):
+    """Nombre para mostrar de una sucursal."""
+    return configuracion()['sucursales'].get(sucursal, {}).get('nombre', sucursal)
+
+
+def activar(sucursal=None):
+    """Activa una sucursal en el contexto actual (la primera configurada si no es válida) y la devuelve."""
+    disponibles = listar()
+    if sucursal not in disponibles:
+        sucursal = SUCURSAL_POR_DEFECTO if SUCURSAL_POR_DEFECTO in disponibles else disponibles[0]
+    _actual.set(sucursal)
+    return sucursal
+
+
+def actual():
+    """Sucursal activa en el contexto actual."""
+    return _actual.get()
+
+
+def valor(clave, defecto=None):
+    """Valor de configuración de la sucursal activa, o defecto si no lo define."""
+    return configuracion()['sucursales'].get(actual(), {}).get(clave, defecto)
+
+
+def directorio(sucursal=None):
+    """Carpeta raíz de los datos de una sucursal (la activa por defecto)."""
+    config = configuracion()['sucursales'].get(sucursal or actual(), {})
+    return os.path.join(BASE_DIR, config.get('directorio', ''))
+
+
+def ruta(archivo):
+    """Ruta de un archivo de datos dentro de la carpeta de la sucursal activa.
+
+    Acepta nombres relativos ('registro_data.pkl') o rutas dentro de la carpeta de
+    la aplicación (como las constantes de archivos), que se trasladan a la sucursal.
+    """
+    if os.path.isabs(archivo):
+        archivo = os.path.relpath(archivo, BASE_DIR)
+    return os.path.normpath(os.path.join(directorio(), archivo))
+
+
+def limite_memoria():
+    """Presupuesto de memoria de las cachés de sucursales, en bytes."""
+    return int(configuracion().get('memoria_cache_mb', MEMORIA_CACHE_MB_POR_DEFECTO) * 1024 * 1024)
+
+
+class CacheSucursales:
+    """Datos cargados por sucursal con desalojo de la usada hace más tiempo (LRU) por memoria.
+
+    tamano(datos) estima los bytes de los datos de una sucursal; podar() descarta
+    sucursales completas, nunca la activa, hasta quedar dentro del límite.
+    """
+
+    def __init__(self, crear, tamano, limite=None):
+        self._crear = crear
+        self._tamano = tamano
+        self._limite = limite
+        self._datos = OrderedDict()
+        self._bloqueo = threading.RLock()
+
+    def obtener(self, sucursal=None):
+        """Datos de una sucursal (la activa por defecto); la marca como usada recién."""
+        sucursal = sucursal or actual()
+        with self._bloqueo:
+            if sucursal not in self._datos:
+                self._datos[sucursal] = self._crear()
+            self._datos.move_to_end(sucursal)
+            return self._datos[sucursal]
+
+    def podar(self):
+        """Descarta las sucursales menos usadas hasta que el total entre en el límite. Devuelve las descartadas."""
+        limite = limite_memoria() if self._limite is None else self._limite
+        with self._bloqueo:
+            tamanos = {sucursal: self._tamano(datos) for sucursal, datos in self._datos.items()}
+            total = sum(tamanos.values())
+            descartadas = []
+            for sucursal in list(self._datos):
+                if total <= limite:
+                    break
+                if sucursal == actual():
+                    continue
+                del self._datos[sucursal]
+                total -= tamanos[sucursal]
+                descartadas.append(sucursal)
+            return descartadas
+
+    def descartar(self, sucursal=None):
+        """Descarta los datos de una sucursal (la activa por defecto); se vuelven a crear al pedirlos."""
+        with self._bloqueo:
+            self._datos.pop(sucursal or actual(), None)
+
+    def sucursales(self):
+        """Sucursales con datos en la caché, de la menos a la más usada."""
+        with self._bloqueo:
+            return list(self._datos)
@@ -0,0 +1,282 @@
+"""Validación por fila de las hojas importadas (Excel/CSV) antes de agregarlas a las tablas.
+
+Cada hoja tiene un esquema con las reglas de sus columnas: tipo ('fecha',
+'numero', 'entero' o 'texto'), mínimo, valor por defecto para celdas vacías y
+catálogo de valores permitidos (el nombre de una lista que entrega quien
+importa, como 'clientes' o 'proveedores', porque cambian por sucursal). Una
+columna 'opcional' puede faltar en la hoja: se llena con su valor por defecto.
+Además puede comparar dos columnas de la misma fila.
+
+Cada regla se evalúa sobre la columna completa; validar() devuelve las filas
+válidas ya convertidas a su tipo y un reporte con una fila por error (fila del
+archivo, columna, valor y motivo). Una fila con algún error no se importa; las
+demás sí.
+
+leer_libro() lee y valida las hojas de un libro Excel completo, cada una en su
+propio proceso (leer XLSX es trabajo de CPU y las hojas son independientes), así
+que un respaldo completo tarda más o menos lo que su hoja más grande. Iniciar los
+procesos cuesta más que leer una hoja mediana, así que solo se reparte cuando al
+menos dos de las hojas pedidas son grandes; si no, todo se lee en este proceso.
+"""
+import io
+import multiprocessing
+import operator
+import os
+import posixpath
+import zipfile
+from xml.etree import ElementTree
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+
+COLUMNAS_REPORTE = ['Hoja', 'Fila', 'Columna', 'Valor', 'Error']
+# La fila 1 del archivo es el encabezado
+PRIMERA_FILA_DATOS = 2
+# Tamaño (XML sin comprimir) desde el que una hoja tarda en leerse más que iniciar un
+# proceso; hacen falta dos hojas así para que leer en paralelo gane tiempo
+TAMANO_MINIMO_PARALELO = 16 * 1024 * 1024
+# Espacios de nombres del libro XLSX (workbook.xml y sus relaciones)
+_XLSX_MAIN = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_XLSX_REL = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_XLSX_PKG_REL = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+COMPARACIONES = {
+    '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge, '==': operator.eq,
+}
+
+# Esquemas por hoja: reglas por columna y comparaciones entre columnas de la misma fila
+ESQUEMAS = {
+    'registro de proveedores': {
+        'columnas': {
+            'Fecha': {'tipo': 'fecha'},
+            'Proveedor': {'tipo': 'texto', 'catalogo': 'proveedores'},
+            # Los libros anteriores al tipo de ave solo tenían pollo
+            'Producto': {'tipo': 'texto', 'catalogo': 'tipos_ave', 'defecto': 'Pollo', 'opcional': True},
+            'Cantidad': {'tipo': 'entero', 'minimo': 0},
+            'Peso Salida (kg)': {'tipo': 'numero', 'minimo': 0},
+            'Peso Entrada (kg)': {'tipo': 'numero', 'minimo': 0},
+            'Tipo Documento': {'tipo': 'texto', 'catalogo': 'tipos_documento'},
+            'Cantidad de gavetas': {'tipo': 'entero', 'minimo': 0, 'defecto': 0},
+            'Precio Unitario ($)': {'tipo': 'numero', 'minimo': 0},
+        },
+        'comparaciones': [
+            ('Peso Entrada (kg)', '<=', 'Peso Salida (kg)', 'El peso de entrada es mayor que el de salida'),
+        ],
+    },
+    'registro de depositos': {
+        'columnas': {
+            'Fecha': {'tipo': 'fecha'},
+            'Empresa': {'tipo': 'texto', 'catalogo': 'proveedores'},
+            'Agencia': {'tipo': 'texto', 'catalogo': 'agencias'},
+            'Monto': {'tipo': 'numero', 'minimo': 0},
+        },
+    },
+    'registro de notas de debito': {
+        'columnas': {
+            'Fecha': {'tipo': 'fecha'},
+            'Descuento': {'tipo': 'numero', 'minimo': 0, 'defecto': 0},
+            'Descuento real': {'tipo': 'numero', 'minimo': 0, 'defecto': 0},
+        },
+    },
+    'ventas': {
+        # Los encabezados se comparan en minúsculas y con '_' en vez de espacios
+        'normalizar_encabezados': True,
+        'columnas': {
+            'fecha': {'tipo': 'fecha'},
+            'cliente': {'tipo': 'texto', 'catalogo': 'clientes'},
+            'tipo': {'tipo': 'texto', 'catalogo': 'tipos_ave'},
+            'cantidad': {'tipo': 'entero', 'minimo': 0},
+            'libras': {'tipo': 'numero', 'minimo': 0},
+            'descuento': {'tipo': 'numero', 'minimo': 0, 'defecto': 0},
+            'libras_netas': {'tipo': 'numero', 'minimo': 0},
+            'precio': {'tipo': 'numero', 'minimo': 0},
+            'total_a_cobrar': {'tipo': 'numero', 'minimo': 0},
+            'pago_cliente': {'tipo': 'numero', 'minimo': 0, 'defecto': 0},
+            'saldo': {'tipo': 'numero', 'defecto': 0},
+        },
+        'comparaciones': [
+            ('descuento', '<=', 'libras', 'El descuento es mayor que las libras'),
+        ],
+    },
+    'gastos': {
+        'normalizar_encabezados': True,
+        'columnas': {
+            'fecha': {'tipo': 'fecha'},
+            'calculo': {'tipo': 'numero', 'defecto': 0},
+            'descripcion': {'tipo': 'texto', 'defecto': ''},
+            'gasto': {'tipo': 'texto', 'catalogo': 'categorias'},
+            'dinero': {'tipo': 'numero', 'minimo': 0},
+        },
+    },
+}
+
+
+def columnas_faltantes(df, hoja):
+    """Columnas obligatorias del esquema de la hoja que no están en el DataFrame."""
+    return [
+        col for col, regla in ESQUEMAS[hoja]['columnas'].items()
+        if col not in df.columns and not regla.get('opcional')
+    ]
+
+
+def _vacias(serie):
+    """Celdas vacías: nulas o solo con espacios."""
+    nulas = serie.isna()
+    # Solo las celdas de texto pueden tener espacios; las columnas numéricas o de fecha no se recorren
+    if serie.dtype == object:
+        textos = serie.map(type).eq(str)
+        if textos.any():
+            nulas |= textos & serie.where(textos).str.strip().eq('')
+    elif pd.api.types.is_string_dtype(serie):
+        nulas |= serie.str.strip().eq('').fillna(False)
+    return nulas
+
+
+def _convertir(serie, regla):
+    """(valores convertidos, celdas vacías, celdas con valor que no se pudo convertir)."""
+    vacias = _vacias(serie)
+    if regla['tipo'] == 'fecha':
+        valores = pd.to_datetime(serie, errors='coerce')
+    elif regla['tipo'] == 'texto':
+        valores = serie.astype(str).str.strip().where(~vacias)
+    else:
+        valores = pd.to_numeric(serie, errors='coerce')
+    invalidas = valores.isna() & ~vacias
+    if regla['tipo'] == 'entero':
+        invalidas |= valores.notna() & valores.mod(1).ne(0)
+    return valores, vacias, invalidas
+
+
+def _errores(hoja, filas, columna, valores, mascara, mensaje):
+    """Filas del reporte para las celdas marcadas por una regla."""
+    valores = valores[mascara]
+    return pd.DataFrame({
+        'Hoja': hoja,
+        'Fila': filas[mascara],
+        'Columna': columna,
+        'Valor': valores.astype(str).where(valores.notna(), '').to_numpy(),
+        'Error': mensaje,
+    })
+
+
+def validar(df, hoja, catalogos):
+    """Valida una hoja importada con su esquema.
+
+    catalogos: {nombre: valores permitidos} para las columnas con catálogo.
+    Devuelve (filas válidas con las columnas del esquema ya convertidas, reporte
+    de errores con COLUMNAS_REPORTE).
+    """
+    esquema = ESQUEMAS[hoja]
+    df = df.reset_index(drop=True)
+    filas = np.arange(len(df)) + PRIMERA_FILA_DATOS
+    # Las columnas opcionales que faltan quedan vacías y toman su valor por defecto
+    originales = df.reindex(columns=list(esquema['columnas']))
+    convertidas = {}
+    errores = []
+    con_error = np.zeros(len(df), dtype=bool)
+
+    def marcar(columna, mascara, mensaje):
+        nonlocal con_error
+        mascara = np.asarray(mascara, dtype=bool)
+        if mascara.any():
+            errores.append(_errores(hoja, filas, columna, originales[columna], mascara, mensaje))
+            con_error |= mascara
+
+    for columna, regla in esquema['columnas'].items():
+        valores, vacias, invalidas = _convertir(originales[columna], regla)
+        if 'defecto' in regla:
+            valores = valores.mask(vacias, regla['defecto'])
+        else:
+            marcar(columna, vacias, 'Celda vacía')
+        marcar(columna, invalidas, {
+            'fecha': 'Fecha no válida', 'numero': 'No es un número', 'entero': 'No es un número entero',
+        }.get(regla['tipo'], 'Valor no válido'))
+        if 'minimo' in regla:
+            marcar(columna, valores.lt(regla['minimo']), f"Menor que {regla['minimo']}")
+        if 'catalogo' in regla:
+            permitidos = catalogos.get(regla['catalogo'], [])
+            marcar(columna, valores.notna() & ~valores.isin(permitidos), f"No está en la lista de {regla['catalogo']}")
+        convertidas[columna] = valores
+
+    for izquierda, simbolo, derecha, mensaje in esquema.get('comparaciones', []):
+        cumple = COMPARACIONES[simbolo](convertidas[izquierda], convertidas[derecha])
+        incompletas = convertidas[izquierda].isna() | convertidas[derecha].isna()
+        marcar(izquierda, ~cumple & ~incompletas, mensaje)
+
+    validas = pd.DataFrame(convertidas)[~con_error]
+    for columna, regla in esquema['columnas'].items():
+        if regla['tipo'] == 'fecha':
+            validas[columna] = validas[columna].dt.date
+        elif regla['tipo'] == 'entero':
+            validas[columna] = validas[columna].astype(int)
+        elif regla['tipo'] == 'numero':
+            validas[columna] = validas[columna].astype(float)
+    reporte = (
+        pd.concat(errores, ignore_index=True).sort_values(['Fila', 'Columna'], kind='stable', ignore_index=True)
+        if errores else pd.DataFrame(columns=COLUMNAS_REPORTE)
+    )
+    return validas.reset_index(drop=True), reporte
+
+
+def reporte_csv(reporte):
+    """Reporte de errores como CSV (bytes) para descargar."""
+    return reporte.to_csv(index=False).encode('utf-8')
+
+
+def leer_hoja(contenido, hoja, catalogos):
+    """Lee y valida una hoja de un libro Excel (en bytes).
+
+    Devuelve (filas válidas, reporte de errores, columnas faltantes); si faltan
+    columnas la hoja no se valida y las filas y el reporte son None.
+    """
+    df = pd.read_excel(io.BytesIO(contenido), sheet_name=hoja)
+    if ESQUEMAS[hoja].get('normalizar_encabezados'):
+        df.columns = df.columns.str.lower().str.replace(' ', '_')
+    faltantes = columnas_faltantes(df, hoja)
+    if faltantes:
+        return None, None, faltantes
+    validas, errores = validar(df, hoja, catalogos)
+    return validas, errores, []
+
+
+def _ruta_en_libro(destino):
+    """Ruta dentro del zip de un destino de xl/_rels/workbook.xml.rels (relativo a xl/ o absoluto)."""
+    if destino.startswith('/'):
+        return destino[1:]
+    return posixpath.normpath(posixpath.join('xl', destino))
+
+
+def tamanos_hojas(contenido):
+    """{hoja: tamaño de su XML sin comprimir} de un libro XLSX; vacío si no se puede leer (p. ej. .xls)."""
+    try:
+        with zipfile.ZipFile(io.BytesIO(contenido)) as libro:
+            relaciones = ElementTree.fromstring(libro.read('xl/_rels/workbook.xml.rels'))
+            rutas = {rel.get('Id'): _ruta_en_libro(rel.get('Target')) for rel in relaciones.iter(f'{_XLSX_PKG_REL}Relationship')}
+            tamanos = {info.filename: info.file_size for info in libro.infolist()}
+            hojas = ElementTree.fromstring(libro.read('xl/workbook.xml')).iter(f'{_XLSX_MAIN}sheet')
+            return {hoja.get('name'): tamanos.get(rutas.get(hoja.get(f'{_XLSX_REL}id')), 0) for hoja in hojas}
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError, AttributeError):
+        return {}
+
+
+def leer_libro(contenido, hojas, catalogos, procesos=None):
+    """Lee y valida varias hojas de un libro Excel, en paralelo si vale la pena.
+
+    Devuelve {hoja: resultado de leer_hoja} en el orden de hojas. Si una hoja
+    falla se propaga su excepción y no se devuelve ninguna.
+    """
+    tamanos = tamanos_hojas(contenido)
+    grandes = sum(tamanos.get(hoja, 0) >= TAMANO_MINIMO_PARALELO for hoja in hojas)
+    # Solo las hojas grandes justifican un proceso propio; las demás no acortan la lectura
+    procesos = min(grandes, procesos or os.cpu_count() or 1)
+    if procesos > 1:
+        try:
+            # spawn: el proceso de la aplicación tiene hilos (servidor, escritura diferida) y no se debe duplicar con fork
+            with ProcessPoolExecutor(procesos, mp_context=multiprocessing.get_context('spawn')) as pool:
+                futuros = {hoja: pool.submit(leer_hoja, contenido, hoja, catalogos) for hoja in hojas}
+                return {hoja: futuro.result() for hoja, futuro in futuros.items()}
+        except (OSError, BrokenProcessPool):
+            pass  # Sin procesos disponibles: se leen en este proceso
+    return {hoja: leer_hoja(contenido, hoja, catalogos) for hoja in hojas}
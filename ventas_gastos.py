@@ -0,0 +1,456 @@
+"""Núcleo compartido de ventas y gastos para todas las páginas de la aplicación.
+
+Reúne las constantes, los cálculos, las alertas de clientes y el índice de claves
+de importación que antes tenía cada aplicación por separado, y mantiene una sola
+caché por proceso de las tablas 'ventas' y 'gastos' (por mes) y de la cartera de
+clientes.
+
+La caché guarda cada mes por separado y solo carga los meses que se piden: una
+sesión con una semana seleccionada no tiene en memoria el resto del historial.
+Cada escritura pasa por este módulo: se publica una nueva versión de los meses
+que toca (la anterior no se modifica, así quien la esté leyendo no ve cambios a
+medias) y se programan solo esos meses en las particiones. Las sesiones comparan
+version_meses() de sus meses para saber si otra escribió, sin volver a leer el
+disco. La caché se relee de las particiones solo si su firma cambió por una
+escritura ajena al proceso.
+
+La caché es por sucursal (ver sucursales.py), bajo un presupuesto de memoria: al
+cargar una sucursal que no entra se descartan las usadas hace más tiempo.
+"""
+import itertools
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import alertas
+import cartera
+import escritura_diferida
+import particiones
+import sucursales
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+os.makedirs(DATA_DIR, exist_ok=True)
+
+# Archivos CSV únicos anteriores; se migran una sola vez a particiones mensuales (ver particiones.py)
+VENTAS_FILE = os.path.join(DATA_DIR, 'ventas.csv')
+GASTOS_FILE = os.path.join(DATA_DIR, 'gastos.csv')
+# Índices persistentes de claves (hash por fila) para deduplicar importaciones
+VENTAS_KEYS_FILE = os.path.join(DATA_DIR, 'ventas_claves.bin')
+GASTOS_KEYS_FILE = os.path.join(DATA_DIR, 'gastos_claves.bin')
+
+CLIENTES = [
+    "D. Vicente", "D. Jorge", "D. Quinde", "Sra. Isabel", "Sra. Alba",
+    "Sra Yolanda", "Sra Laura Mercado", "D. Segundo", "Legumbrero",
+    "Peruana Posorja", "Sra. Sofia", "Sra. Jessica", "Sra Alado de Jessica",
+    "Comedor Gordo Posorja", "Patitas Posorja", "Sra. Celeste", "Caro negro",
+    "Tienda Isabel Posorja", "Carnicero Posorja", "Moreira", "Senel",
+    "Chuzos Narcisa", "Eddy", "D. Jonny", "D. Sra Madelyn", "Lobo Mercado"
+]
+TIPOS_AVE = ["Pollo", "Gallina"]
+CATEGORIAS_GASTO = [
+    "G. Alimentación", "G. Transporte", "G. Producción", "G. Salud",
+    "G. Educación", "G. Mano de obra", "G. Pérdida", "G. Varios", "Otros Gastos"
+]
+
+COLUMNS_VENTAS = [
+    'fecha', 'cliente', 'tipo', 'cantidad', 'libras', 'descuento',
+    'libras_netas', 'precio', 'total_a_cobrar', 'pago_cliente', 'saldo'
+]
+COLUMNS_GASTOS = ['fecha', 'calculo', 'descripcion', 'gasto', 'dinero']
+# Columnas que identifican una venta o un gasto único al importar
+KEY_COLUMNS_VENTAS = ['fecha', 'cliente', 'tipo', 'cantidad', 'libras', 'precio']
+KEY_COLUMNS_GASTOS = ['fecha', 'gasto', 'dinero']
+TEXT_KEY_COLUMNS = ['cliente', 'tipo', 'gasto']
+
+# Nombres de columna de visualización de ventas y gastos
+RENOMBRAR_VENTAS = {
+    'fecha': 'Fecha DB', 'cliente': 'Cliente', 'tipo': 'Tipo', 'cantidad': 'Cantidad',
+    'libras': 'Libras', 'descuento': 'Descuento', 'libras_netas': 'Libras_netas',
+    'precio': 'Precio', 'total_a_cobrar': 'Total_a_cobrar', 'pago_cliente': 'Pago_Cliente',
+    'saldo': 'Saldo'
+}
+RENOMBRAR_GASTOS = {
+    'fecha': 'Fecha DB', 'calculo': 'Calculo', 'descripcion': 'Descripcion',
+    'gasto': 'Gasto', 'dinero': 'Dinero'
+}
+
+# tabla -> (archivo único anterior, columnas)
+TABLAS = {
+    'ventas': (VENTAS_FILE, COLUMNS_VENTAS),
+    'gastos': (GASTOS_FILE, COLUMNS_GASTOS),
+}
+INDICES_CLAVES = {'ventas': VENTAS_KEYS_FILE, 'gastos': GASTOS_KEYS_FILE}
+
+_bloqueo = threading.RLock()
+# Versiones únicas en todo el proceso: una sucursal descartada y recargada no repite versiones
+_versiones = itertools.count()
+
+
+def _tamano_sucursal(datos):
+    """Bytes aproximados de los meses cargados de una sucursal (y del historial completo, si se armó)."""
+    total = 0
+    for entrada in datos['tablas'].values():
+        total += sum(int(df.memory_usage(deep=True).sum()) for df in entrada['meses'].values())
+        if entrada['completa'] is not None:
+            total += int(entrada['completa'][1].memory_usage(deep=True).sum())
+    return total
+
+
+# Por sucursal: {'tablas': {tabla: {'meses': {mes: filas del mes}, 'versiones': {mes: int},
+#                                  'version': int de toda la tabla, 'firma': firma o None,
+#                                  'listado': meses con filas en disco, 'completa': (version, historial) o None}},
+#                'cartera': cartera de clientes o None, 'version_cartera': versión de 'ventas' que refleja}
+_cache = sucursales.CacheSucursales(
+    lambda: {'tablas': {}, 'cartera': None, 'version_cartera': None}, _tamano_sucursal
+)
+
+
+def _tablas():
+    """Tablas en caché de la sucursal activa."""
+    return _cache.obtener()['tablas']
+
+
+# --- Caché compartida de tablas ---
+# Cada mes se carga y se publica por separado: una sesión solo tiene en memoria los meses
+# de su rango, y una escritura solo reemplaza los meses que toca.
+def _leer_mes(tabla, mes):
+    """Lee un mes de una tabla con las columnas y fechas normalizadas."""
+    columnas = TABLAS[tabla][1]
+    df = particiones.leer_particion(tabla, mes)
+    if df.empty:
+        return pd.DataFrame(columns=columnas)
+    df['fecha'] = pd.to_datetime(df['fecha'], errors='coerce').dt.date
+    for col in columnas:
+        if col not in df.columns:
+            df[col] = None
+    return df[columnas]
+
+
+def _entrada(tabla):
+    """Entrada de la tabla en la caché (se llama con _bloqueo tomado).
+
+    Se descarta entera si sus particiones cambiaron por una escritura ajena al proceso.
+    """
+    tablas = _tablas()
+    entrada = tablas.get(tabla)
+    # Con escrituras propias pendientes manda la memoria; si no, se revisa la firma en disco
+    if entrada is not None and escritura_diferida.esperar(tabla, timeout=0):
+        firma = particiones.firma_tabla(tabla)
+        if entrada['firma'] is None:
+            entrada['firma'] = firma
+        elif not np.array_equal(entrada['firma'], firma):
+            entrada = None
+    if entrada is None:
+        particiones.migrar_tabla(tabla, TABLAS[tabla][0])
+        entrada = tablas[tabla] = {
+            'meses': {}, 'versiones': {}, 'version': next(_versiones), 'firma': particiones.firma_tabla(tabla),
+            'listado': set(particiones.listar_meses(tabla)), 'completa': None,
+        }
+    return entrada
+
+
+def _mes(tabla, entrada, mes):
+    """Filas de un mes, desde la caché o del disco (se llama con _bloqueo tomado)."""
+    if mes not in entrada['meses']:
+        entrada['meses'][mes] = _leer_mes(tabla, mes)
+        entrada['versiones'][mes] = next(_versiones)
+    return entrada['meses'][mes]
+
+
+def _concatenar(tabla, partes):
+    partes = [parte for parte in partes if not parte.empty]
+    if not partes:
+        return pd.DataFrame(columns=TABLAS[tabla][1])
+    return pd.concat(partes, ignore_index=True)
+
+
+def filas_de_meses(tabla, meses):
+    """Copia de las filas de los meses indicados (con etiquetas nuevas desde 0); solo carga esos meses."""
+    with _bloqueo:
+        entrada = _entrada(tabla)
+        faltaban = not set(meses) <= set(entrada['meses'])
+        df = _concatenar(tabla, [_mes(tabla, entrada, mes) for mes in sorted(meses)])
+    if faltaban:
+        _cache.podar()
+    return df
+
+
+def obtener_tabla(tabla):
+    """Historial completo de una tabla (todos sus meses), compartido por las páginas de historial y la API.
+
+    Se arma una vez por versión de la tabla. No debe modificarse en sitio: las
+    escrituras publican meses nuevos.
+    """
+    with _bloqueo:
+        entrada = _entrada(tabla)
+        if entrada['completa'] is None or entrada['completa'][0] != entrada['version']:
+            df = _concatenar(tabla, [_mes(tabla, entrada, mes) for mes in sorted(entrada['listado'])])
+            entrada['completa'] = (entrada['version'], df)
+            armada = True
+        else:
+            armada = False
+        df = entrada['completa'][1]
+    if armada:
+        _cache.podar()
+    return df
+
+
+def version_tabla(tabla):
+    """Versión de toda la tabla en la caché; cambia con cada escritura o relectura."""
+    with _bloqueo:
+        return _entrada(tabla)['version']
+
+
+def version_meses(tabla, meses):
+    """{mes: versión} de los meses indicados; la de un mes cambia solo cuando se escribe o se relee ese mes."""
+    with _bloqueo:
+        entrada = _entrada(tabla)
+        for mes in meses:
+            _mes(tabla, entrada, mes)
+        return {mes: entrada['versiones'][mes] for mes in meses}
+
+
+def _publicar(tabla, entrada, filas_por_mes):
+    """Reemplaza meses de la tabla en la caché por versiones nuevas (se llama con _bloqueo tomado).
+
+    Los DataFrames anteriores no se modifican, así quien los esté leyendo no ve cambios a medias.
+    Devuelve {mes: versión nueva}.
+    """
+    versiones = {}
+    for mes, filas in filas_por_mes.items():
+        entrada['meses'][mes] = filas
+        entrada['versiones'][mes] = versiones[mes] = next(_versiones)
+        if filas.empty:
+            entrada['listado'].discard(mes)
+        else:
+            entrada['listado'].add(mes)
+    entrada['version'] = next(_versiones)
+    entrada['firma'] = None  # Se toma de nuevo cuando terminen de escribirse las particiones
+    entrada['completa'] = None
+    return versiones
+
+
+def guardar_meses(tabla, df, meses):
+    """Reemplaza los meses indicados por las filas de df de esos meses y los guarda.
+
+    df puede tener solo parte del historial (por ejemplo, los meses cargados de una
+    sesión) pero debe tener todas las filas de esos meses. Solo se publican y se
+    escriben esos meses. Devuelve {mes: versión nueva}.
+    """
+    columnas = TABLAS[tabla][1]
+    meses_df = particiones.mes_de(df['fecha']).to_numpy()
+    filas_por_mes = {
+        mes: df[meses_df == mes].reindex(columns=columnas).reset_index(drop=True) for mes in sorted(set(meses))
+    }
+    with _bloqueo:
+        versiones = _publicar(tabla, _entrada(tabla), filas_por_mes)
+        particiones.programar_escritura(tabla, _concatenar(tabla, filas_por_mes.values()), set(meses), copiar=False)
+    return versiones
+
+
+def agregar_filas(tabla, df_filas, hashes=None):
+    """Agrega filas al final de sus meses y de sus particiones. Devuelve {mes: versión nueva} de los meses en caché.
+
+    Solo se escriben las filas nuevas (en segundo plano si la escritura es diferida);
+    hashes, si se indican, se suman al índice de claves de la tabla cuando se escriben.
+    """
+    filas = df_filas.reindex(columns=TABLAS[tabla][1]).reset_index(drop=True)
+    meses_filas = particiones.mes_de(filas['fecha']).to_numpy()
+    with _bloqueo:
+        entrada = _entrada(tabla)
+        # Los meses que no están en caché se leerán del disco, ya con las filas
+        filas_por_mes = {
+            mes: _concatenar(tabla, [entrada['meses'][mes], filas[meses_filas == mes]])
+            for mes in sorted(set(meses_filas)) if mes in entrada['meses']
+        }
+        versiones = _publicar(tabla, entrada, filas_por_mes)
+        entrada['listado'].update(meses_filas)
+        al_agregar = None if hashes is None else (
+            lambda firma_anterior, firma_nueva: agregar_claves_al_indice(
+                INDICES_CLAVES[tabla], firma_anterior, firma_nueva, hashes
+            )
+        )
+        particiones.programar_agregado(tabla, filas, al_agregar)
+    return versiones
+
+
+def eliminar_tabla(tabla):
+    """Elimina todas las particiones de una tabla y la deja vacía en la caché."""
+    with _bloqueo:
+        entrada = _entrada(tabla)
+        particiones.eliminar_tabla(tabla)
+        vacia = pd.DataFrame(columns=TABLAS[tabla][1])
+        _publicar(tabla, entrada, {mes: vacia for mes in set(entrada['meses']) | entrada['listado']})
+        entrada['firma'] = particiones.firma_tabla(tabla)
+
+
+def descartar_datos():
+    """Descarta las tablas y la cartera en caché de la sucursal activa (por ejemplo, tras restaurar un respaldo)."""
+    with _bloqueo:
+        _cache.descartar()
+
+
+# --- Cartera de clientes compartida ---
+# La cartera recuerda la versión de 'ventas' que refleja: se compara con la caché, no con
+# la firma en disco, así ajustarla no espera a que se escriban las ventas.
+def obtener_cartera():
+    """Cartera de clientes de la sucursal activa; se recarga si las ventas cambiaron sin pasar por ella."""
+    with _bloqueo:
+        datos = _cache.obtener()
+        if datos['cartera'] is None or datos['version_cartera'] != version_tabla('ventas'):
+            return recargar_cartera()
+        return datos['cartera']
+
+
+def aplicar_cambios_cartera(version_anterior, quitar=None, agregar=None):
+    """Ajusta la cartera compartida con las ventas quitadas y agregadas por una escritura.
+
+    version_anterior es version_tabla('ventas') antes de escribir; si la cartera no
+    estaba al día con ella, se recarga (ya con esta escritura) en lugar de ajustarse.
+    """
+    with _bloqueo:
+        datos = _cache.obtener()
+        if datos['cartera'] is None or datos['version_cartera'] != version_anterior:
+            return recargar_cartera()
+        datos['cartera'] = cartera.aplicar_cambios(datos['cartera'], quitar=quitar, agregar=agregar)
+        datos['version_cartera'] = version_tabla('ventas')
+        return datos['cartera']
+
+
+def recargar_cartera():
+    """Vuelve a cargar la cartera compartida (por ejemplo, tras eliminar todas las ventas)."""
+    with _bloqueo:
+        datos = _cache.obtener()
+        datos['version_cartera'] = version_tabla('ventas')
+        datos['cartera'] = cartera.cargar_cartera()
+        return datos['cartera']
+
+
+# --- Índice de claves para deduplicar importaciones ---
+# Formato del archivo: [tamaño particiones, mtime_ns particiones, hash_1, hash_2, ...] como uint64.
+# La firma de las particiones indica si el índice sigue sincronizado; si no, se reconstruye.
+def calcular_hash_claves(df, key_columns):
+    """Calcula un hash uint64 por fila a partir de las columnas clave normalizadas."""
+    claves = pd.DataFrame(index=df.index)
+    for col in key_columns:
+        if col == 'fecha':
+            claves[col] = pd.to_datetime(df[col], errors='coerce').dt.strftime('%Y-%m-%d').astype(str)
+        elif col in TEXT_KEY_COLUMNS:
+            claves[col] = df[col].astype(str)
+        else:
+            claves[col] = pd.to_numeric(df[col], errors='coerce').astype('float64').round(2)
+    return pd.util.hash_pandas_object(claves, index=False).to_numpy(dtype=np.uint64)
+
+
+def cargar_indice_claves(index_file, tabla, key_columns):
+    """Carga el índice de claves ordenado; si las particiones cambiaron, lo reconstruye desde ellas."""
+    index_file = sucursales.ruta(index_file)
+    firma = particiones.firma_tabla(tabla)
+    if os.path.exists(index_file):
+        try:
+            datos = np.fromfile(index_file, dtype=np.uint64)
+            if len(datos) >= 2 and np.array_equal(datos[:2], firma):
+                return np.unique(datos[2:])
+        except (OSError, ValueError):
+            pass
+    historial = particiones.leer_meses(tabla)
+    if historial.empty:
+        claves = np.empty(0, dtype=np.uint64)
+    else:
+        claves = np.unique(calcular_hash_claves(historial, key_columns))
+    try:
+        np.concatenate([firma, claves]).tofile(index_file)
+    except OSError:
+        pass
+    return claves
+
+
+def agregar_claves_al_indice(index_file, firma_anterior, firma_nueva, hashes):
+    """Agrega hashes al final del índice si estaba sincronizado antes de escribir las filas.
+
+    Se llama desde la escritura de las filas (ver agregar_filas), con la firma de las
+    particiones antes y después. Varios agregados combinados en una sola escritura
+    comparten esas firmas: el índice ya llevado a firma_nueva por uno de ellos también
+    admite los hashes de los demás.
+    """
+    index_file = sucursales.ruta(index_file)
+    if not os.path.exists(index_file):
+        return
+    try:
+        with open(index_file, 'r+b') as f:
+            firma_indice = np.fromfile(f, dtype=np.uint64, count=2)
+            if not (np.array_equal(firma_indice, firma_anterior) or np.array_equal(firma_indice, firma_nueva)):
+                return  # Desactualizado: se reconstruirá en la próxima importación
+            f.seek(0)
+            f.write(np.asarray(firma_nueva, dtype=np.uint64).tobytes())
+            f.seek(0, os.SEEK_END)
+            f.write(np.asarray(hashes, dtype=np.uint64).tobytes())
+    except OSError:
+        pass
+
+
+def filtrar_duplicados(df_nuevo, claves_existentes, key_columns):
+    """Separa las filas nuevas de las ya registradas usando solo el índice de claves.
+
+    Devuelve (filas nuevas, cantidad de duplicados omitidos, hashes de las filas nuevas).
+    """
+    if df_nuevo.empty:
+        return df_nuevo, 0, np.empty(0, dtype=np.uint64)
+    hashes = calcular_hash_claves(df_nuevo, key_columns)
+    posiciones = np.searchsorted(claves_existentes, hashes)
+    posiciones = np.minimum(posiciones, max(len(claves_existentes) - 1, 0))
+    ya_registrada = (
+        claves_existentes[posiciones] == hashes if len(claves_existentes) else np.zeros(len(hashes), dtype=bool)
+    )
+    repetida_en_archivo = pd.Series(hashes).duplicated().to_numpy()
+    es_nueva = ~(ya_registrada | repetida_en_archivo)
+    return df_nuevo[es_nueva], int((~es_nueva).sum()), hashes[es_nueva]
+
+
+# --- Formateo, cálculos y alertas ---
+def formatear_moneda(valor):
+    """Formatea un valor numérico como moneda."""
+    try:
+        return f"${float(valor):,.2f}"
+    except (ValueError, TypeError):
+        return "$0.00"
+
+
+def calcular_libras_netas(libras, descuento):
+    """Calcula las libras netas."""
+    try:
+        return round(float(libras) - float(descuento), 2)
+    except:
+        return 0.0
+
+
+def calcular_total_cobrar(libras_netas, precio):
+    """Calcula el total a cobrar."""
+    try:
+        return round(float(libras_netas) * float(precio), 2)
+    except:
+        return 0.0
+
+
+def calcular_saldo(total_cobrar, pago_cliente):
+    """Calcula el saldo pendiente."""
+    try:
+        return round(float(total_cobrar) - float(pago_cliente), 2)
+    except:
+        return 0.0
+
+
+def analizar_alertas_clientes(ventas_df, resumen_cartera):
+    """Clientes en alerta según las reglas de alertas.py: el saldo sale de la cartera y los días con saldo de las ventas."""
+    if ventas_df.empty:
+        ventas_df = pd.DataFrame(columns=['Fecha', 'Cliente', 'Saldo'])
+    fechas = pd.to_datetime(ventas_df['Fecha'] if 'Fecha' in ventas_df.columns else ventas_df['Fecha DB'], errors='coerce')
+    saldos = pd.to_numeric(
+        ventas_df['Saldo'].astype(str).str.replace('$', '', regex=False).str.replace(',', '', regex=False),
+        errors='coerce'
+    )
+    con_saldo = (saldos > 0).to_numpy()
+    return alertas.analizar(resumen_cartera, ventas_df['Cliente'].to_numpy()[con_saldo], fechas.to_numpy()[con_saldo])